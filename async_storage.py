@@ -0,0 +1,49 @@
+# async_storage.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of storage calls that may run at the same time
+STORAGE_WORKERS = 4
+
+class AsyncStorage:
+    """Async facade over a storage module (googlesheet or database)
+    
+    Every function of the backend is exposed as a coroutine that runs the
+    blocking call on a bounded thread pool, so a slow Sheets round trip no
+    longer freezes the event loop (other commands, scheduler jobs).
+    
+    Usage:
+        storage = AsyncStorage(googlesheet)
+        client = await storage.get_client_by_token(token)
+    """
+    
+    def __init__(self, backend, max_workers=STORAGE_WORKERS):
+        self._backend = backend
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"{backend.__name__}-storage"
+        )
+    
+    def __getattr__(self, name):
+        func = getattr(self._backend, name)
+        if not callable(func):
+            return func
+        
+        @functools.wraps(func)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        
+        # Cache the wrapper so the lookup only happens once per function
+        setattr(self, name, call)
+        return call
+    
+    async def run(self, func, *args, **kwargs):
+        """Run any blocking callable on the storage pool (e.g. an export consuming iter_clients)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    def shutdown(self, wait=True):
+        """Stop the thread pool once the bot is shutting down"""
+        self._executor.shutdown(wait=wait)
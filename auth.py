@@ -3,6 +3,7 @@ import functools
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
+from rendering import ACCESS_DENIED, ACCESS_DENIED_CONTACT, PARSE_MODE
 
 logger = logging.getLogger(__name__)
 
@@ -55,8 +56,11 @@ def is_admin(user_id):
     return user_id in ADMIN_USERS
 
 
-async def admin_only_middleware(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Middleware to check if user is admin before processing any command"""
+async def admin_only_middleware(update: Update, context: ContextTypes.DEFAULT_TYPE, outbox) -> bool:
+    """Middleware to check if user is admin before processing any command
+
+    The access denied answer goes through the bot's outbox, like every other reply.
+    """
     # Skip updates that aren't messages or don't have a user
     if not update.effective_message or not update.effective_user:
         return True
@@ -76,49 +80,19 @@ async def admin_only_middleware(update: Update, context: ContextTypes.DEFAULT_TY
     username = update.effective_user.username or "Unknown"
     logger.warning(f"Unauthorized access attempt by user {user_id} (@{username}) for command: {message_text}")
     
-    # For first-time users trying to start the bot
-    if message_text.startswith("/start"):
-        try:
-            await update.effective_message.reply_text(
-                "⛔ *Access Denied*\n\n"
-                f"User ID: `{user_id}` (@{username})\n\n"
-                "This bot is restricted to administrators only.\n"
-                "Use /admin to see your status and get your User ID.\n\n"
-                "Please contact the bot owner to request access.",
-                parse_mode="Markdown"
-            )
-        except Exception:
-            # Fallback if Markdown parsing fails
-            await update.effective_message.reply_text(
-                "⛔ Access Denied\n\n"
-                f"User ID: {user_id} (@{username})\n\n"
-                "This bot is restricted to administrators only.\n"
-                "Use /admin to see your status and get your User ID.\n\n"
-                "Please contact the bot owner to request access."
-            )
-    else:
-        # For other commands
-        try:
-            await update.effective_message.reply_text(
-                "⛔ *Access Denied*\n\n"
-                f"User ID: `{user_id}` (@{username})\n\n"
-                "This bot is restricted to administrators only.\n"
-                "Use /admin to see your status and get your User ID.",
-                parse_mode="Markdown"
-            )
-        except Exception:
-            # Fallback if Markdown parsing fails
-            await update.effective_message.reply_text(
-                "⛔ Access Denied\n\n"
-                f"User ID: {user_id}\n\n"
-                "This bot is restricted to administrators only.\n"
-                "Use /admin to check your status."
-            )
+    # For first-time users trying to start the bot, also explain how to get access
+    contact = ACCESS_DENIED_CONTACT if message_text.startswith("/start") else ""
+    await outbox.reply(
+        update,
+        ACCESS_DENIED.render(user_id=user_id, username=username, contact=contact),
+        parse_mode=PARSE_MODE
+    )
     
     # Return False to stop command processing
     return False
 
 
-def register_admin_check(application):
-    """Register the admin check middleware with the application"""
-    application.add_handler(MessageHandler(filters.ALL, admin_only_middleware), group=-1)  # -1 makes it run first
+def register_admin_check(application, outbox):
+    """Register the admin check middleware with the application, answering through outbox"""
+    middleware = functools.partial(admin_only_middleware, outbox=outbox)
+    application.add_handler(MessageHandler(filters.ALL, middleware), group=-1)  # -1 makes it run first
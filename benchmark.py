@@ -0,0 +1,186 @@
+# benchmark.py
+# Compare the Google Sheets backend (googlesheet.py, against fake_sheets.py)
+# and the SQLite backend (database.py) on identical seeded data.
+#
+# Usage:
+#   python benchmark.py                      # 1k, 10k and 50k clients
+#   python benchmark.py --sizes 1000 --latency 0.1 --repeat 3
+#   python benchmark.py --read-quota 60      # let the fake answer 429 like the real API
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+import fake_sheets
+import googlesheet
+
+CLIENT_HEADERS = googlesheet.SHEET_HEADERS[googlesheet.CLIENTS_SHEET]
+BURNED_HEADERS = googlesheet.SHEET_HEADERS[googlesheet.BURNED_SHEET]
+OPERATION_HEADERS = googlesheet.SHEET_HEADERS[googlesheet.OPERATIONS_SHEET]
+DATE_FORMAT = database.DATE_FORMAT
+
+def make_dataset(size, seed=42):
+    """Build the same client, burned token and operation rows for both backends"""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    clients, burned, operations = [], [], []
+
+    for i in range(1, size + 1):
+        token = f"NFX-B{i:06d}-Profile{i % 5}"
+        start = now - timedelta(days=rng.randint(0, 60), minutes=rng.randint(0, 1440))
+        end = start + timedelta(days=rng.choice([1, 7, 30, 30, 30, 90]))
+        status = "Paid" if rng.random() < 0.6 else "Unpaid"
+        amount = str(float(rng.choice([10, 15, 20]))) if status == "Paid" else "0.0"
+        is_burned = rng.random() < 0.03
+        burn_date = (start + timedelta(days=1)).strftime(DATE_FORMAT) if is_burned else ""
+        burn_reason = "Account sharing" if is_burned else ""
+
+        clients.append([
+            str(i), token, f"client_{i}", f"client{i}@example.com", f"Profile{i % 5}",
+            start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT), status, amount,
+            "1" if is_burned else "0", burn_reason, burn_date
+        ])
+        operations.append([str(len(operations) + 1), start.strftime(DATE_FORMAT), "NEW", token, "Profile: bench, Duration: 30", "0", str(i)])
+        if status == "Paid":
+            operations.append([str(len(operations) + 1), start.strftime(DATE_FORMAT), "PAID", token, "Status changed to Paid", amount, str(i)])
+        if is_burned:
+            burned.append([str(len(burned) + 1), token, burn_reason, burn_date, str(i)])
+            operations.append([str(len(operations) + 1), burn_date, "BURN", token, burn_reason, "0", str(i)])
+
+    return clients, burned, operations
+
+def scenarios(clients):
+    """(name, function, argument factory) for every public storage function"""
+    rng = random.Random(7)
+    active = [row[1] for row in clients if row[9] == "0"]
+    counter = iter(range(10 ** 9))
+
+    return [
+        ("add_client", "add_client", lambda: (f"NFX-NEW{next(counter):07d}-Bench", "bench_client", "bench@example.com", "Bench", "30")),
+        ("token_exists (hit)", "token_exists", lambda: (rng.choice(active),)),
+        ("token_exists (miss)", "token_exists", lambda: ("NFX-MISSING-Bench",)),
+        ("get_client_by_token", "get_client_by_token", lambda: (rng.choice(active),)),
+        ("update_status", "update_status", lambda: (rng.choice(active), "Paid", 15.0)),
+        ("extend_subscription", "extend_subscription", lambda: (rng.choice(active), 7)),
+        ("burn_token", "burn_token", lambda: (active.pop(), "Benchmark")),
+        ("get_unpaid_clients", "get_unpaid_clients", lambda: ()),
+        ("get_all_clients", "get_all_clients", lambda: ()),
+        ("get_stats", "get_stats", lambda: ()),
+        ("get_expiring_clients", "get_expiring_clients", lambda: (7,)),
+        ("search_clients", "search_clients", lambda: ("client_12",)),
+        ("get_burned_tokens", "get_burned_tokens", lambda: ()),
+        ("get_recent_operations", "get_recent_operations", lambda: (10,)),
+    ]
+
+def run_scenario(backend, function_name, make_args, repeat, session=None):
+    """Return (cold ms, median warm ms, API calls per warm call) or None if unsupported"""
+    func = getattr(backend, function_name, None)
+    if func is None:
+        return None
+
+    timings, calls = [], []
+    for _ in range(repeat + 1):  # The first call is the cold one
+        args = make_args()
+        before = session.total_calls() if session else 0
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+        calls.append((session.total_calls() - before) if session else None)
+
+    warm = timings[1:] or timings
+    warm_calls = calls[1:] or calls
+    api_calls = statistics.mean(warm_calls) if session else None
+    return timings[0], statistics.median(warm), api_calls
+
+def setup_sheets(dataset, args):
+    """Seed a fresh fake spreadsheet and point googlesheet.py at it"""
+    clients, burned, operations = dataset
+    session = fake_sheets.FakeSheetsSession(
+        latency=args.latency,
+        read_quota_per_minute=args.read_quota,
+        write_quota_per_minute=args.write_quota
+    )
+    session.seed(googlesheet.CLIENTS_SHEET, [CLIENT_HEADERS] + clients)
+    session.seed(googlesheet.BURNED_SHEET, [BURNED_HEADERS] + burned)
+    session.seed(googlesheet.OPERATIONS_SHEET, [OPERATION_HEADERS] + operations)
+    fake_sheets.install(googlesheet, session)
+
+    # Benchmark the backend, not the governor, unless a quota was asked for
+    googlesheet._read_window = googlesheet._RequestWindow(args.read_quota or 10 ** 9)
+    googlesheet._write_window = googlesheet._RequestWindow(args.write_quota or 10 ** 9)
+
+    googlesheet.init_db()
+    session.reset_counters()
+    return session
+
+def setup_sqlite(dataset, path):
+    """Create a fresh SQLite database holding the same rows"""
+    clients, burned, _ = dataset
+    database.close_db()
+    if os.path.exists(path):
+        os.remove(path)
+    database.DB_NAME = path
+    database.init_db()
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO clients (id, token, name, email, profile, start_date, end_date, status, payment_amount, is_burned, burn_reason, burn_date) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULLIF(?, ''), NULLIF(?, ''))",
+        [(int(r[0]), r[1], r[2], r[3], r[4], r[5], r[6], r[7], float(r[8]), int(r[9]), r[10], r[11]) for r in clients]
+    )
+    conn.executemany(
+        "INSERT INTO burned_tokens (id, token, burn_reason, burn_date, client_id) VALUES (?, ?, ?, ?, ?)",
+        [(int(r[0]), r[1], r[2], r[3], int(r[4])) for r in burned]
+    )
+    conn.commit()
+    conn.close()
+
+def format_ms(value):
+    return "-" if value is None else f"{value:9.2f}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Google Sheets and SQLite backends")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="comma-separated client counts")
+    parser.add_argument("--repeat", type=int, default=5, help="warm calls per function")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per Sheets API request")
+    parser.add_argument("--read-quota", type=int, default=None, help="fake Sheets read requests per minute")
+    parser.add_argument("--write-quota", type=int, default=None, help="fake Sheets write requests per minute")
+    args = parser.parse_args()
+
+    # Keep the background log flusher out of the per-call numbers
+    googlesheet.LOG_FLUSH_INTERVAL = 3600
+    googlesheet.LOG_FLUSH_BATCH_SIZE = 10 ** 9
+
+    db_path = os.path.join(tempfile.gettempdir(), "bench_clients.db")
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        dataset = make_dataset(size)
+        session = setup_sheets(dataset, args)
+        setup_sqlite(dataset, db_path)
+
+        print(f"\n=== {size} clients (latency {args.latency * 1000:.0f} ms/request, {args.repeat} warm calls) ===")
+        print(f"{'function':<24} {'sheets cold':>11} {'sheets warm':>11} {'api calls':>9} {'sqlite cold':>11} {'sqlite warm':>11}")
+
+        sheet_runs = scenarios(dataset[0])
+        sqlite_runs = scenarios(dataset[0])
+        for (label, name, make_args), (_, _, make_sqlite_args) in zip(sheet_runs, sqlite_runs):
+            sheets = run_scenario(googlesheet, name, make_args, args.repeat, session)
+            sqlite = run_scenario(database, name, make_sqlite_args, args.repeat)
+            sheets = sheets or (None, None, None)
+            sqlite = sqlite or (None, None, None)
+            calls = "-" if sheets[2] is None else f"{sheets[2]:9.1f}"
+            print(f"{label:<24} {format_ms(sheets[0]):>11} {format_ms(sheets[1]):>11} {calls:>9} {format_ms(sqlite[0]):>11} {format_ms(sqlite[1]):>11}")
+
+        googlesheet.flush_operations_log()
+        if session.throttled:
+            print(f"(fake API answered 429 to {session.throttled} requests)")
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+if __name__ == "__main__":
+    main()
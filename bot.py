@@ -4,29 +4,33 @@ import random
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-from datetime import timedelta
 import re  # For token validation
 # Load environment variables
 load_dotenv()
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes
 
-# Create scheduler at the top level
-scheduler = AsyncIOScheduler()
+# Expiration notifications, persisted across restarts
+import reminders
+from reminders import parse_duration
 
-from database import (
-    init_db, add_client, get_client_by_token, update_status, token_exists,
-    extend_subscription, get_unpaid_clients, get_all_clients, get_stats, get_expiring_clients,
-    search_clients, burn_token, get_burned_tokens
-)
+import database
+from database import init_db, close_db, SEARCH_LIMIT
+from async_storage import AsyncStorage
 from export import export_to_csv, export_to_excel
 from auth import admin_required, load_admin_users, register_admin_check
+from outbox import Outbox, BULK
+from pagination import Paginator, CALLBACK_PATTERN
+import webhook
+from locks import KeyedLocks
+import rendering
+from rendering import PARSE_MODE
 
 # Get configuration from environment variables
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 YOUR_CHAT_ID = int(os.getenv("CHAT_ID", 0))  # Default to 0 if not set
 ADMIN_IDS = os.getenv("ADMIN_IDS", "")  # Admin user IDs
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 16))  # Updates handled at the same time
 
 # Validate configuration
 if not BOT_TOKEN:
@@ -44,30 +48,32 @@ load_admin_users(ADMIN_IDS)
 # Initialize database
 init_db()
 
-def parse_duration(duration_str: str) -> timedelta:
-    duration_str = str(duration_str).lower()
-    if duration_str.endswith("m"):
-        return timedelta(minutes=int(duration_str[:-1]))
-    elif duration_str.endswith("h"):
-        return timedelta(hours=int(duration_str[:-1]))
-    elif duration_str.endswith("d"):
-        return timedelta(days=int(duration_str[:-1]))
-    else:
-        return timedelta(days=int(duration_str))  # default days
+# Handlers reach SQLite through a thread pool so they never block the event loop
+storage = AsyncStorage(database)
+
+# Every message to Telegram goes through the outbox (rate limits, priorities, RetryAfter)
+outbox = Outbox()
+
+# Updates are handled concurrently; commands changing a client hold its token lock
+token_locks = KeyedLocks()
+
+# Long lists are sent one page at a time, later pages come from a cached snapshot
+pages = Paginator(outbox)
 
 async def notify_expiration(app, chat_id, token, name, email, profile, end):
-    await app.bot.send_message(
-        chat_id=chat_id,
-        text=(
+    await outbox.send(
+        chat_id,
+        (
             f"❌ Subscription Expired\n"
             f"🔑 Token: {token}\n"
             f"👤 {name} ({email}) – {profile}\n"
             f"📅 End: {end}"
-        )
+        ),
+        priority=BULK
     )
 
 # توليد Token - Generate more complex and unique tokens
-def generate_token(profile):
+async def generate_token(profile):
     # Create a unique identifier with timestamp and random elements
     timestamp = datetime.now().strftime("%y%m%d%H%M")
     rand_id = random.randint(1000, 9999)
@@ -79,7 +85,7 @@ def generate_token(profile):
     token = f"NFX-{profile_hash}{rand_id}-{profile}"
     
     # Check if token already exists and regenerate if needed
-    while token_exists(token):
+    while await storage.token_exists(token):
         rand_id = random.randint(1000, 9999)
         profile_hash = ''.join(random.choices('ABCDEFGHJKLMNPQRSTUVWXYZ23456789', k=4))
         token = f"NFX-{profile_hash}{rand_id}-{profile}"
@@ -124,7 +130,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # If no arguments, show general help
     if not context.args:
         help_text = get_help_text()
-        await update.message.reply_text(help_text)
+        await outbox.reply(update, help_text)
         return
         
     # If command specified, show detailed help for that command
@@ -132,121 +138,117 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     command_help = {
         "new": (
-            "📝 *Command: /new*\n\n"
-            "*Usage:* /new FullName Email Profile Duration\n\n"
-            "*Description:* Register a new Netflix client\n\n"
-            "*Parameters:*\n"
+            "📝 <b>Command: /new</b>\n\n"
+            "<b>Usage:</b> /new FullName Email Profile Duration\n\n"
+            "<b>Description:</b> Register a new Netflix client\n\n"
+            "<b>Parameters:</b>\n"
             "- FullName: Client's full name\n"
             "- Email: Client's email address (for Netflix account)\n"
             "- Profile: Netflix profile name\n"
             "- Duration: Subscription duration\n  • Regular days: 30, 15, etc.\n  • Minutes: 2m, 30m, etc.\n  • Hours: 1h, 24h, etc.\n\n"
-            "*Examples:*\n"
+            "<b>Examples:</b>\n"
             "/new John Smith john@example.com Profile1 30\n"
             "/new Jane Doe jane@example.com Profile2 2h"
         ),
         "token": (
-            "🔍 *Command: /token*\n\n"
-            "*Usage:* /token TOKEN_ID\n\n"
-            "*Description:* Look up client details using their token\n\n"
-            "*Example:*\n"
+            "🔍 <b>Command: /token</b>\n\n"
+            "<b>Usage:</b> /token TOKEN_ID\n\n"
+            "<b>Description:</b> Look up client details using their token\n\n"
+            "<b>Example:</b>\n"
             "/token NFX-123-Profile1"
         ),
         "pay": (
-            "💰 *Command: /pay*\n\n"
-            "*Usage:* /pay TOKEN_ID [AMOUNT]\n\n"
-            "*Description:* Mark a client's subscription as paid with an optional payment amount\n\n"
-            "*Parameters:*\n"
+            "💰 <b>Command: /pay</b>\n\n"
+            "<b>Usage:</b> /pay TOKEN_ID [AMOUNT]\n\n"
+            "<b>Description:</b> Mark a client's subscription as paid with an optional payment amount\n\n"
+            "<b>Parameters:</b>\n"
             "- TOKEN_ID: Client's token\n"
             "- AMOUNT: (Optional) Payment amount\n\n"
-            "*Examples:*\n"
+            "<b>Examples:</b>\n"
             "/pay NFX-123-Profile1\n"
             "/pay NFX-123-Profile1 50.5"
         ),
         "extend": (
-            "⏳ *Command: /extend*\n\n"
-            "*Usage:* /extend TOKEN_ID DAYS\n\n"
-            "*Description:* Extend a client's subscription by specified days\n\n"
-            "*Parameters:*\n"
+            "⏳ <b>Command: /extend</b>\n\n"
+            "<b>Usage:</b> /extend TOKEN_ID DAYS\n\n"
+            "<b>Description:</b> Extend a client's subscription by specified days\n\n"
+            "<b>Parameters:</b>\n"
             "- TOKEN_ID: Client's token\n"
             "- DAYS: Number of days to extend\n\n"
-            "*Example:*\n"
+            "<b>Example:</b>\n"
             "/extend NFX-123-Profile1 30"
         ),
         "unpaid": (
-            "⚠️ *Command: /unpaid*\n\n"
-            "*Usage:* /unpaid\n\n"
-            "*Description:* List all clients with unpaid status"
+            "⚠️ <b>Command: /unpaid</b>\n\n"
+            "<b>Usage:</b> /unpaid\n\n"
+            "<b>Description:</b> List all clients with unpaid status"
         ),
         "expiring": (
-            "⏰ *Command: /expiring*\n\n"
-            "*Usage:* /expiring DAYS\n\n"
-            "*Description:* List all clients whose subscriptions expire within the specified days\n\n"
-            "*Example:*\n"
+            "⏰ <b>Command: /expiring</b>\n\n"
+            "<b>Usage:</b> /expiring DAYS\n\n"
+            "<b>Description:</b> List all clients whose subscriptions expire within the specified days\n\n"
+            "<b>Example:</b>\n"
             "/expiring 7"
         ),
         "stats": (
-            "📊 *Command: /stats*\n\n"
-            "*Usage:* /stats\n\n"
-            "*Description:* Show subscription statistics including total clients, paid, unpaid, expired, and burned tokens"
+            "📊 <b>Command: /stats</b>\n\n"
+            "<b>Usage:</b> /stats\n\n"
+            "<b>Description:</b> Show subscription statistics including total clients, paid, unpaid, expired, and burned tokens"
         ),
         "search": (
-            "🔎 *Command: /search*\n\n"
-            "*Usage:* /search QUERY\n\n"
-            "*Description:* Search for clients by name, email, profile, or token\n\n"
-            "*Example:*\n"
+            "🔎 <b>Command: /search</b>\n\n"
+            "<b>Usage:</b> /search QUERY\n\n"
+            "<b>Description:</b> Search for clients by name, email, profile, or token\n\n"
+            "<b>Example:</b>\n"
             "/search john"
         ),
         "export": (
-            "📁 *Command: /export*\n\n"
-            "*Usage:* /export [csv|excel]\n\n"
-            "*Description:* Export all client data to CSV or Excel format\n\n"
-            "*Examples:*\n"
+            "📁 <b>Command: /export</b>\n\n"
+            "<b>Usage:</b> /export [csv|excel]\n\n"
+            "<b>Description:</b> Export all client data to CSV or Excel format\n\n"
+            "<b>Examples:</b>\n"
             "/export csv\n"
             "/export excel"
         ),
         "help": (
-            "ℹ️ *Command: /help*\n\n"
-            "*Usage:* /help [command]\n\n"
-            "*Description:* Show general help or detailed help for a specific command\n\n"
-            "*Examples:*\n"
+            "ℹ️ <b>Command: /help</b>\n\n"
+            "<b>Usage:</b> /help [command]\n\n"
+            "<b>Description:</b> Show general help or detailed help for a specific command\n\n"
+            "<b>Examples:</b>\n"
             "/help\n"
             "/help new"
         ),
         "admin": (
-            "🔑 *Command: /admin*\n\n"
-            "*Usage:* /admin\n\n"
-            "*Description:* Check if you have admin privileges\n\n"
+            "🔑 <b>Command: /admin</b>\n\n"
+            "<b>Usage:</b> /admin\n\n"
+            "<b>Description:</b> Check if you have admin privileges\n\n"
             "Admin privileges are required for the following commands:\n"
             "- /pay - Mark subscription as paid\n"
             "- /extend - Extend subscription\n"
             "- /export - Export client data"
         ),
         "burn": (
-            "🔥 *Command: /burn*\n\n"
-            "*Usage:* /burn TOKEN_ID REASON\n\n"
-            "*Description:* Mark a token as burned (permanently disabled) with a reason\n\n"
-            "*Parameters:*\n"
+            "🔥 <b>Command: /burn</b>\n\n"
+            "<b>Usage:</b> /burn TOKEN_ID REASON\n\n"
+            "<b>Description:</b> Mark a token as burned (permanently disabled) with a reason\n\n"
+            "<b>Parameters:</b>\n"
             "- TOKEN_ID: The token to burn\n"
             "- REASON: The reason for burning the token\n\n"
-            "*Example:*\n"
+            "<b>Example:</b>\n"
             "/burn NFX-ABC1234-Profile1 Account sharing detected"
         ),
         "burned": (
-            "📊 *Command: /burned*\n\n"
-            "*Usage:* /burned\n\n"
-            "*Description:* List all burned tokens with their reasons and dates\n\n"
+            "📊 <b>Command: /burned</b>\n\n"
+            "<b>Usage:</b> /burned\n\n"
+            "<b>Description:</b> List all burned tokens with their reasons and dates\n\n"
             "Shows the most recent burned tokens first, limited to 10 entries per page."
         )
     }
     
     if command in command_help:
-        try:
-            await update.message.reply_text(command_help[command], parse_mode="Markdown")
-        except Exception as e:
-            # Fallback if Markdown parsing fails
-            await update.message.reply_text(command_help[command])
+        await outbox.reply(update, command_help[command], parse_mode=PARSE_MODE)
     else:
-        await update.message.reply_text(f"❌ Unknown command: {command}\n\nUse /help to see all available commands.")
+        await outbox.reply(update, f"❌ Unknown command: {command}\n\nUse /help to see all available commands.")
 
 
 # /new
@@ -254,22 +256,27 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def new_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if len(context.args) != 4:
-            await update.message.reply_text(
+            await outbox.reply(
+                update,
                 "❌ Usage: /new FullName Email Profile Duration\n\n"
                 "Duration examples:\n- 30 (days)\n- 2m (minutes)\n- 1h (hours)\n- 1d (1 day)"
             )
             return
 
         name, email, profile, duration_str = context.args
-        token = generate_token(profile)
+        token = await generate_token(profile)
 
         # parse duration
         delta = parse_duration(duration_str)
         start_date = datetime.now()
         end_date = start_date + delta
 
-        # save in DB
-        add_client(token, name, email, profile, duration_str)
+        # save in DB and schedule the reminders before anyone can /pay or /burn the token
+        async with token_locks(token):
+            await storage.add_client(token, name, email, profile, duration_str)
+
+            # 🕒 جدولة إشعار عند الانتهاء
+            reminders.schedule_reminders(token, name, email, profile, start_date, end_date, "Unpaid", end_date.strftime('%d-%m-%Y %H:%M'))
 
         # format display
         reply = (
@@ -283,29 +290,21 @@ async def new_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"🔑 Token: {token}\n"
             f"💰 Status: Unpaid"
         )
-        await update.message.reply_text(reply)
-
-        # 🕒 جدولة إشعار عند الانتهاء
-        scheduler.add_job(
-            notify_expiration,
-            "date",
-            run_date=end,
-            args=[context.application, YOUR_CHAT_ID, token, name, email, profile, end.strftime('%d-%m-%Y %H:%M')]
-        )
+        await outbox.reply(update, reply)
 
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {e}")
+        await outbox.reply(update, f"❌ Error: {e}")
         logger.error(f"Error in new_client: {e}", exc_info=True)
 
 # /token
 @admin_required
 async def token_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /token TOKEN_ID")
+        await outbox.reply(update, "❌ Usage: /token TOKEN_ID")
         return
 
     token = context.args[0]
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if client:
         # Check if the client tuple has payment_amount (for backward compatibility)
         if len(client) >= 9:
@@ -345,7 +344,7 @@ async def token_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     else:
         reply = "❌ Token not found."
-    await update.message.reply_text(reply)
+    await outbox.reply(update, reply)
 
 # /admin - Check if user is an admin
 async def admin_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -355,39 +354,27 @@ async def admin_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from auth import is_admin, ADMIN_USERS
     
     if is_admin(user_id):
-        await update.message.reply_text(
-            f"✅ *Admin Access Granted*\n\n"
-            f"Hello, {first_name}!\n\n"
-            f"User ID: `{user_id}`\n"
-            f"Username: @{username}\n\n"
-            f"You have full administrative access to this bot.\n\n"
-            f"Current admin IDs: `{', '.join(map(str, ADMIN_USERS))}`",
-            parse_mode="Markdown"
+        reply = rendering.ADMIN_GRANTED.render(
+            first_name=first_name, user_id=user_id, username=username,
+            admin_ids=', '.join(map(str, ADMIN_USERS))
         )
     else:
-        await update.message.reply_text(
-            f"❌ *Access Denied*\n\n"
-            f"Hello, {first_name}!\n\n"
-            f"User ID: `{user_id}`\n"
-            f"Username: @{username}\n\n"
-            f"This bot is restricted to administrators only.\n\n"
-            f"To request access, please contact the bot owner with your User ID shown above.",
-            parse_mode="Markdown"
-        )
+        reply = rendering.ADMIN_DENIED.render(first_name=first_name, user_id=user_id, username=username)
+    await outbox.reply(update, reply, parse_mode=PARSE_MODE)
 
 # /pay
 @admin_required
 async def pay_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /pay TOKEN_ID [AMOUNT]")
+        await outbox.reply(update, "❌ Usage: /pay TOKEN_ID [AMOUNT]")
         return
     
     token = context.args[0]
     
     # Check if client exists
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if not client:
-        await update.message.reply_text(f"❌ Token {token} not found.")
+        await outbox.reply(update, f"❌ Token {token} not found.")
         return
     
     # Check if payment amount is provided
@@ -396,26 +383,34 @@ async def pay_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             payment_amount = float(context.args[1])
         except ValueError:
-            await update.message.reply_text("❌ Payment amount must be a number.")
+            await outbox.reply(update, "❌ Payment amount must be a number.")
             return
     
-    # Update status and payment amount
-    update_status(token, "Paid", payment_amount)
+    # Update status and payment amount, then replan the reminders (no more unpaid reminder)
+    async with token_locks(token):
+        paid = await storage.update_status(token, "Paid", payment_amount)
+        reminders.sync_client(token, await storage.get_client_by_token(token))
+    
+    # The client may have been deleted since the lookup
+    if not paid:
+        await outbox.reply(update, f"❌ Token {token} not found.")
+        return
     
     # Prepare response message
     if payment_amount is not None:
-        await update.message.reply_text(
+        await outbox.reply(
+            update,
             f"💰 Token {token} updated → Paid ✅\n"
             f"Payment amount: {payment_amount}"
         )
     else:
-        await update.message.reply_text(f"💰 Token {token} updated → Paid ✅")
+        await outbox.reply(update, f"💰 Token {token} updated → Paid ✅")
 
 # /extend
 @admin_required
 async def extend_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) < 2:
-        await update.message.reply_text("❌ Usage: /extend TOKEN_ID DAYS")
+        await outbox.reply(update, "❌ Usage: /extend TOKEN_ID DAYS")
         return
     
     token = context.args[0]
@@ -424,47 +419,67 @@ async def extend_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         days = int(context.args[1])
         if days <= 0:
-            await update.message.reply_text("❌ Days must be a positive number")
+            await outbox.reply(update, "❌ Days must be a positive number")
             return
     except ValueError:
-        await update.message.reply_text("❌ Days must be a valid number")
+        await outbox.reply(update, "❌ Days must be a valid number")
         return
     
     # Get client info before extending
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if not client:
-        await update.message.reply_text("❌ Token not found.")
+        await outbox.reply(update, "❌ Token not found.")
         return
     
     # Extend subscription
-    new_end = extend_subscription(token, days)
+    async with token_locks(token):
+        new_end = await storage.extend_subscription(token, days)
+        if new_end:
+            # Move the reminders to the new end date
+            reminders.sync_client(token, await storage.get_client_by_token(token))
+    
     if new_end:
         # Format the message as requested
-        await update.message.reply_text(
+        await outbox.reply(
+            update,
             f"➕ Abonnement prolongé\n"
             f"🔑 {token}\n"
             f"+{days} jours → Nouvelle fin: {new_end.strftime('%d-%m-%Y')}"
         )
     else:
-        await update.message.reply_text("❌ Une erreur s'est produite lors de la prolongation.")
+        await outbox.reply(update, "❌ Une erreur s'est produite lors de la prolongation.")
+
+
+# Row renderers for the paginated lists (only called for the page being shown)
+def render_unpaid(row):
+    token, name, profile, start, end = row
+    return f"🔑 {token} – {name} – {profile} (Ends: {end})\n"
 
+def render_expiring(row):
+    token, name, profile, end, status = row
+    return f"🔑 {token} – {name} – {profile} (Ends: {end}, Status: {status})\n"
+
+def render_search(row):
+    token, name, email, profile, start, end, status = row
+    return f"🔑 {token} - {name} ({profile}) - {status}\n"
+
+def render_burned(row):
+    token, reason, date, name, email, profile = row
+    return f"🔑 {token} - {name}\n   📅 {date}\n   📜 {reason}\n\n"
 
 # /unpaid
 @admin_required
 async def unpaid_clients(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    clients = get_unpaid_clients()
+    clients = await storage.get_unpaid_clients()
     if not clients:
-        await update.message.reply_text("🎉 No unpaid clients!")
+        await outbox.reply(update, "🎉 No unpaid clients!")
         return
-    reply = "⚠️ Unpaid Clients:\n"
-    for token, name, profile, start, end in clients:
-        reply += f"🔑 {token} – {name} – {profile} (Ends: {end})\n"
-    await update.message.reply_text(reply)
+    await pages.send(update, ("unpaid",), clients, render_unpaid, "⚠️ Unpaid Clients:")
 
 # /stats
 @admin_required 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    total, paid, unpaid, expired, burned = get_stats()
+    total, paid, unpaid, expired, burned = await storage.get_stats()
     reply = (
         f"📊 Subscription Stats:\n"
         f"👥 Total Clients: {total}\n"
@@ -473,30 +488,27 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"⏳ Expired: {expired}\n"
         f"🔥 Burned: {burned}"
     )
-    await update.message.reply_text(reply)
+    await outbox.reply(update, reply)
 
 # /expiring X
 @admin_required
 async def expiring(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /expiring DAYS")
+        await outbox.reply(update, "❌ Usage: /expiring DAYS")
         return
     
     try:
         days = int(context.args[0])
     except ValueError:
-        await update.message.reply_text("❌ DAYS must be a number.")
+        await outbox.reply(update, "❌ DAYS must be a number.")
         return
 
-    clients = get_expiring_clients(days)
+    clients = await storage.get_expiring_clients(days)
     if not clients:
-        await update.message.reply_text(f"🎉 No clients expiring within {days} days.")
+        await outbox.reply(update, f"🎉 No clients expiring within {days} days.")
         return
     
-    reply = f"⏳ Clients expiring in {days} days:\n"
-    for token, name, profile, end, status in clients:
-        reply += f"🔑 {token} – {name} – {profile} (Ends: {end}, Status: {status})\n"
-    await update.message.reply_text(reply)
+    await pages.send(update, ("expiring", days), clients, render_expiring, f"⏳ Clients expiring in {days} days:")
 
 # Reminders function
 
@@ -505,48 +517,39 @@ async def expiring(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_required
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /search QUERY")
+        await outbox.reply(update, "❌ Usage: /search QUERY")
         return
     
     query = context.args[0]
-    clients = search_clients(query)
+    clients = await storage.search_clients(query)
     
     if not clients:
-        await update.message.reply_text(f"🔎 No clients found matching '{query}'")
+        await outbox.reply(update, f"🔎 No clients found matching '{query}'")
         return
     
-    reply = f"🔎 Search results for '{query}':\n\n"
-    for token, name, email, profile, start, end, status in clients:
-        reply += f"🔑 {token} - {name} ({profile}) - {status}\n"
-    
-    await update.message.reply_text(reply)
+    # The database returns the best SEARCH_LIMIT matches at most
+    if len(clients) >= SEARCH_LIMIT:
+        header = f"🔎 Top {SEARCH_LIMIT} results for '{query}':"
+    else:
+        header = f"🔎 Search results for '{query}':"
+    await pages.send(update, ("search", query.lower()), clients, render_search, header)
 
 # /burned command to list all burned tokens
 @admin_required
 async def list_burned_tokens(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    burned_tokens = get_burned_tokens()
+    burned_tokens = await storage.get_burned_tokens()
     
     if not burned_tokens:
-        await update.message.reply_text("🔎 No burned tokens found.")
+        await outbox.reply(update, "🔎 No burned tokens found.")
         return
     
-    reply = f"🔥 Burned Tokens ({len(burned_tokens)}):\n\n"
-    
-    for token, reason, date, name, email, profile in burned_tokens[:10]:  # Limit to 10 to avoid message too long
-        reply += f"🔑 {token} - {name}\n"
-        reply += f"   📅 {date}\n"
-        reply += f"   📜 {reason}\n\n"
-    
-    if len(burned_tokens) > 10:
-        reply += f"\n...and {len(burned_tokens) - 10} more.\n"
-    
-    await update.message.reply_text(reply)
+    await pages.send(update, ("burned",), burned_tokens, render_burned, f"🔥 Burned Tokens ({len(burned_tokens)}):")
 
 # /burn command to mark tokens as burned
 @admin_required
 async def burn_token_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) < 2:
-        await update.message.reply_text("❌ Usage: /burn TOKEN_ID REASON")
+        await outbox.reply(update, "❌ Usage: /burn TOKEN_ID REASON")
         return
     
     token = context.args[0]
@@ -554,24 +557,29 @@ async def burn_token_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Validate token format
     if not re.match(r'^NFX-[A-Z0-9]+-\w+$', token):
-        await update.message.reply_text("❌ Invalid token format. Token should be in format NFX-XXXX-Profile")
+        await outbox.reply(update, "❌ Invalid token format. Token should be in format NFX-XXXX-Profile")
         return
     
     # Get client info before burning
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if not client:
-        await update.message.reply_text(f"❌ Token {token} not found.")
+        await outbox.reply(update, f"❌ Token {token} not found.")
         return
     
     # Extract client info for the response
     _, _, name, email, profile, _, _, status = client[:8]  # First 8 fields
     
     # Burn the token
-    success, message = burn_token(token, reason)
+    async with token_locks(token):
+        success, message = await storage.burn_token(token, reason)
+        if success:
+            # A burned token must not get any reminder
+            reminders.cancel_reminders(token)
     
     if success:
         # Format the success message
-        await update.message.reply_text(
+        await outbox.reply(
+            update,
             f"🔥 Token Burned Successfully\n"
             f"🔑 {token}\n"
             f"👤 {name} ({email})\n"
@@ -580,7 +588,7 @@ async def burn_token_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             f"📅 Date: {datetime.now().strftime('%d-%m-%Y %H:%M')}\n"
         )
     else:
-        await update.message.reply_text(f"❌ {message}")
+        await outbox.reply(update, f"❌ {message}")
 
 # /export command
 @admin_required
@@ -590,25 +598,21 @@ async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if context.args and context.args[0].lower() in ["csv", "excel"]:
             format_type = context.args[0].lower()
         
-        await update.message.reply_text(f"⏳ Exporting client data to {format_type.upper()}...")
+        await outbox.reply(update, f"⏳ Exporting client data to {format_type.upper()}...")
         
+        # Stream the clients into an in-memory document (on the storage pool)
         if format_type == "csv":
-            filepath = export_to_csv()
-            await update.message.reply_document(
-                document=open(filepath, 'rb'),
-                filename=os.path.basename(filepath),
-                caption="📊 Here's your exported client data in CSV format."
-            )
+            document = await storage.run(export_to_csv, database.iter_clients())
+            caption = "📊 Here's your exported client data in CSV format."
         else:  # Excel
-            filepath = export_to_excel()
-            await update.message.reply_document(
-                document=open(filepath, 'rb'),
-                filename=os.path.basename(filepath),
-                caption="📊 Here's your exported client data in Excel format."
-            )
+            document = await storage.run(export_to_excel, database.iter_clients())
+            caption = "📊 Here's your exported client data in Excel format."
+        
+        with document:
+            await outbox.reply_document(update, document=document, caption=caption)
             
     except Exception as e:
-        await update.message.reply_text(f"❌ Error exporting data: {e}")
+        await outbox.reply(update, f"❌ Error exporting data: {e}")
         logger.error(f"Error in export_data: {e}", exc_info=True)
 
 
@@ -616,30 +620,30 @@ async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_required
 async def startapp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_text = get_help_text()
-    await update.message.reply_text(welcome_text)
+    await outbox.reply(update, welcome_text)
 
-def main():
-    app = Application.builder().token(BOT_TOKEN).build()
-    register_admin_check(app)
+async def post_init(app: Application):
+    outbox.start(app.bot)
+    
+    # Start the scheduler once the bot is initialized, so jobs missed while we were down can send
+    reminders.start(app, YOUR_CHAT_ID, notify_expiration, send=lambda chat_id, text: outbox.send(chat_id, text, priority=BULK))
+    
+    # Jobs are persisted: the full client scan only happens on the very first start
+    if reminders.needs_seeding():
+        reminders.seed(await storage.get_all_clients(), burned=[row[0] for row in await storage.get_burned_tokens()])
 
-    # Load all existing clients and re-schedule jobs
-    for token, name, email, profile, start, end, status in get_all_clients():
-        try:
-            end_date = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            try:
-                end_date = datetime.strptime(end, "%Y-%m-%d")
-            except:
-                continue
-        
-        # إذا الاشتراك مزال ما انتهى
-        if end_date > datetime.now():
-            scheduler.add_job(
-                notify_expiration,
-                "date",
-                run_date=end_date,
-                args=[app, YOUR_CHAT_ID, token, name, email, profile, end]
-            )
+async def post_stop(app: Application):
+    # Give queued replies and reminders a chance to go out, while the bot can still send
+    # (Application.shutdown closes its HTTP client before post_shutdown runs)
+    await outbox.stop()
+
+async def post_shutdown(app: Application):
+    # Checkpoints the WAL back into clients.db
+    close_db()
+
+def main():
+    app = Application.builder().token(BOT_TOKEN).post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown).concurrent_updates(CONCURRENT_UPDATES).build()
+    register_admin_check(app, outbox)
 
     # === Handlers
     app.add_handler(CommandHandler("start", startapp))
@@ -656,9 +660,22 @@ def main():
     app.add_handler(CommandHandler("search", search_command))
     app.add_handler(CommandHandler("burn", burn_token_command))
     app.add_handler(CommandHandler("burned", list_burned_tokens))
+    app.add_handler(CallbackQueryHandler(admin_required(pages.handle_callback), pattern=CALLBACK_PATTERN))
+
+    # Webhook mode when configured in .env, long polling otherwise
+    if webhook.enabled():
+        app.run_webhook(
+            listen=webhook.WEBHOOK_LISTEN,
+            port=webhook.WEBHOOK_PORT,
+            url_path=webhook.WEBHOOK_PATH,
+            webhook_url=webhook.WEBHOOK_URL,
+            secret_token=webhook.WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        app.run_polling()
 
-    scheduler.start()
-    app.run_polling()
+    storage.shutdown()
 
 if __name__ == "__main__":
     main()
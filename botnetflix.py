@@ -4,28 +4,33 @@ import random
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-from datetime import timedelta
 import re  # For token validation
 # Load environment variables
 load_dotenv()
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-
-# Create scheduler at the top level
-scheduler = AsyncIOScheduler()
-
-from googlesheet import (
-    init_db, add_client, get_client_by_token, update_status, token_exists,
-    extend_subscription, get_unpaid_clients, get_all_clients, get_stats, get_expiring_clients,
-    search_clients, burn_token, get_burned_tokens, get_recent_operations
-)
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes
+
+# Expiration notifications, persisted across restarts
+import reminders
+from reminders import parse_duration
+
+import googlesheet
+from googlesheet import init_db, stop_operations_log, SheetsQuotaError, SEARCH_LIMIT
+from async_storage import AsyncStorage
+from export import export_to_csv, export_to_excel
+from outbox import Outbox, BULK
+from pagination import Paginator, CALLBACK_PATTERN
+import webhook
+from locks import KeyedLocks
+import rendering
+from rendering import PARSE_MODE, Raw
 from auth import admin_required, load_admin_users, register_admin_check
 
 # Get configuration from environment variables
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 YOUR_CHAT_ID = int(os.getenv("CHAT_ID", 0))  # Default to 0 if not set
 ADMIN_IDS = os.getenv("ADMIN_IDS", "")  # Admin user IDs
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 16))  # Updates handled at the same time
 
 # Validate configuration
 if not BOT_TOKEN:
@@ -43,44 +48,24 @@ load_admin_users(ADMIN_IDS)
 # Initialize database
 init_db()
 
-def parse_duration(duration_str: str) -> timedelta:
-    duration_str = str(duration_str).lower()
-    if duration_str.endswith("m"):
-        return timedelta(minutes=int(duration_str[:-1]))
-    elif duration_str.endswith("h"):
-        return timedelta(hours=int(duration_str[:-1]))
-    elif duration_str.endswith("d"):
-        return timedelta(days=int(duration_str[:-1]))
-    else:
-        return timedelta(days=int(duration_str))  # default days
+# Handlers reach Google Sheets through a thread pool so they never block the event loop
+storage = AsyncStorage(googlesheet)
+
+# Every message to Telegram goes through the outbox (rate limits, priorities, RetryAfter)
+outbox = Outbox()
+
+# Updates are handled concurrently; commands changing a client hold its token lock
+token_locks = KeyedLocks()
+
+# Long lists are sent one page at a time, later pages come from a cached snapshot
+pages = Paginator(outbox)
 
 async def notify_expiration(app, chat_id, token, name, email, profile, end):
-    try:
-        await app.bot.send_message(
-            chat_id=chat_id,
-            text=(
-                f"❌ *Subscription Expired*\n\n"
-                f"🔑 Token: `{token}`\n"
-                f"👤 {name} ({email}) – {profile}\n"
-                f"📅 End: {end}"
-            ),
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        # Fallback if Markdown parsing fails
-        logger.error(f"Error sending formatted expiration message: {e}")
-        await app.bot.send_message(
-            chat_id=chat_id,
-            text=(
-                f"❌ Subscription Expired\n\n"
-                f"🔑 Token: {token}\n"
-                f"👤 {name} ({email}) – {profile}\n"
-                f"📅 End: {end}"
-            )
-        )
+    text = rendering.EXPIRED.render(token=token, name=name, email=email, profile=profile, end=end)
+    await outbox.send(chat_id, text, priority=BULK, parse_mode=PARSE_MODE)
 
 # توليد Token - Generate more complex and unique tokens
-def generate_token(profile):
+async def generate_token(profile):
     # Create a unique identifier with timestamp and random elements
     timestamp = datetime.now().strftime("%y%m%d%H%M")
     rand_id = random.randint(1000, 9999)
@@ -92,7 +77,7 @@ def generate_token(profile):
     token = f"NFX-{profile_hash}{rand_id}-{profile}"
     
     # Check if token already exists and regenerate if needed
-    while token_exists(token):
+    while await storage.token_exists(token):
         rand_id = random.randint(1000, 9999)
         profile_hash = ''.join(random.choices('ABCDEFGHJKLMNPQRSTUVWXYZ23456789', k=4))
         token = f"NFX-{profile_hash}{rand_id}-{profile}"
@@ -125,7 +110,8 @@ def get_help_text():
         "Help & Support:\n"
         "👉 /help - Show this help message\n"
         "👉 /help COMMAND - Show detailed help for a specific command\n"
-        "👉 /admin - Check your admin status\n\n"
+        "👉 /admin - Check your admin status\n"
+        "👉 /queue - Show the outgoing message queue\n\n"
         "Examples:\n"
         "/new John Smith john@example.com Profile1 30\n"
         "/help new - Get detailed help for the new command\n"
@@ -137,7 +123,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # If no arguments, show general help
     if not context.args:
         help_text = get_help_text()
-        await update.message.reply_text(help_text)
+        await outbox.reply(update, help_text)
         return
         
     # If command specified, show detailed help for that command
@@ -145,120 +131,120 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     command_help = {
         "new": (
-            "📝 *Command: /new*\n\n"
-            "*Usage:* /new FullName Email Profile Duration\n\n"
-            "*Description:* Register a new Netflix client\n\n"
-            "*Parameters:*\n"
+            "📝 <b>Command: /new</b>\n\n"
+            "<b>Usage:</b> /new FullName Email Profile Duration\n\n"
+            "<b>Description:</b> Register a new Netflix client\n\n"
+            "<b>Parameters:</b>\n"
             "- FullName: Client's full name\n"
             "- Email: Client's email address (for Netflix account)\n"
             "- Profile: Netflix profile name\n"
             "- Duration: Subscription duration\n  • Regular days: 30, 15, etc.\n  • Minutes: 2m, 30m, etc.\n  • Hours: 1h, 24h, etc.\n\n"
-            "*Examples:*\n"
+            "<b>Examples:</b>\n"
             "/new John Smith john@example.com Profile1 30\n"
             "/new Jane Doe jane@example.com Profile2 2h"
         ),
         "token": (
-            "🔍 *Command: /token*\n\n"
-            "*Usage:* /token TOKEN_ID\n\n"
-            "*Description:* Look up client details using their token\n\n"
-            "*Example:*\n"
+            "🔍 <b>Command: /token</b>\n\n"
+            "<b>Usage:</b> /token TOKEN_ID\n\n"
+            "<b>Description:</b> Look up client details using their token\n\n"
+            "<b>Example:</b>\n"
             "/token NFX-123-Profile1"
         ),
         "pay": (
-            "💰 *Command: /pay*\n\n"
-            "*Usage:* /pay TOKEN_ID [AMOUNT]\n\n"
-            "*Description:* Mark a client's subscription as paid with an optional payment amount\n\n"
-            "*Parameters:*\n"
+            "💰 <b>Command: /pay</b>\n\n"
+            "<b>Usage:</b> /pay TOKEN_ID [AMOUNT]\n\n"
+            "<b>Description:</b> Mark a client's subscription as paid with an optional payment amount\n\n"
+            "<b>Parameters:</b>\n"
             "- TOKEN_ID: Client's token\n"
             "- AMOUNT: (Optional) Payment amount\n\n"
-            "*Examples:*\n"
+            "<b>Examples:</b>\n"
             "/pay NFX-123-Profile1\n"
             "/pay NFX-123-Profile1 50.5"
         ),
         "extend": (
-            "⏳ *Command: /extend*\n\n"
-            "*Usage:* /extend TOKEN_ID DAYS\n\n"
-            "*Description:* Extend a client's subscription by specified days\n\n"
-            "*Parameters:*\n"
+            "⏳ <b>Command: /extend</b>\n\n"
+            "<b>Usage:</b> /extend TOKEN_ID DAYS\n\n"
+            "<b>Description:</b> Extend a client's subscription by specified days\n\n"
+            "<b>Parameters:</b>\n"
             "- TOKEN_ID: Client's token\n"
             "- DAYS: Number of days to extend\n\n"
-            "*Example:*\n"
+            "<b>Example:</b>\n"
             "/extend NFX-123-Profile1 30"
         ),
         "unpaid": (
-            "⚠️ *Command: /unpaid*\n\n"
-            "*Usage:* /unpaid\n\n"
-            "*Description:* List all clients with unpaid status\n\n"
+            "⚠️ <b>Command: /unpaid</b>\n\n"
+            "<b>Usage:</b> /unpaid\n\n"
+            "<b>Description:</b> List all clients with unpaid status\n\n"
             "Displays each unpaid client with their name, profile, end date, and token.\n"
             "Tokens are formatted in code blocks for easy visibility and copying."
         ),
         "expiring": (
-            "⏰ *Command: /expiring*\n\n"
-            "*Usage:* /expiring DAYS\n\n"
-            "*Description:* List all clients whose subscriptions expire within the specified days\n\n"
+            "⏰ <b>Command: /expiring</b>\n\n"
+            "<b>Usage:</b> /expiring DAYS\n\n"
+            "<b>Description:</b> List all clients whose subscriptions expire within the specified days\n\n"
             "Displays each expiring client with their name, profile, end date, status, remaining time, and token.\n"
             "The remaining time shows exactly how many days or hours are left before expiration.\n"
             "Tokens are formatted in code blocks for easy visibility and copying.\n\n"
-            "*Example:*\n"
+            "<b>Example:</b>\n"
             "/expiring 7"
         ),
         "stats": (
-            "📊 *Command: /stats*\n\n"
-            "*Usage:* /stats\n\n"
-            "*Description:* Show subscription statistics including total clients, paid, unpaid, expired, and burned tokens"
+            "📊 <b>Command: /stats</b>\n\n"
+            "<b>Usage:</b> /stats\n\n"
+            "<b>Description:</b> Show subscription statistics including total clients, paid, unpaid, expired, and burned tokens"
         ),
         "search": (
-            "🔎 *Command: /search*\n\n"
-            "*Usage:* /search QUERY\n\n"
-            "*Description:* Search for clients by name, email, profile, or token\n\n"
-            "*Example:*\n"
+            "🔎 <b>Command: /search</b>\n\n"
+            "<b>Usage:</b> /search QUERY\n\n"
+            "<b>Description:</b> Search for clients by name, email, profile, or token\n\n"
+            "<b>Example:</b>\n"
             "/search john"
         ),
         "export": (
-            "📁 *Command: /export*\n\n"
-            "*Usage:* /export [csv|excel]\n\n"
-            "*Description:* Export all client data to CSV or Excel format\n\n"
-            "*Examples:*\n"
+            "📁 <b>Command: /export</b>\n\n"
+            "<b>Usage:</b> /export [csv|excel]\n\n"
+            "<b>Description:</b> Export all client data to CSV or Excel format\n\n"
+            "<b>Examples:</b>\n"
             "/export csv\n"
             "/export excel"
         ),
         "help": (
-            "ℹ️ *Command: /help*\n\n"
-            "*Usage:* /help [command]\n\n"
-            "*Description:* Show general help or detailed help for a specific command\n\n"
-            "*Examples:*\n"
+            "ℹ️ <b>Command: /help</b>\n\n"
+            "<b>Usage:</b> /help [command]\n\n"
+            "<b>Description:</b> Show general help or detailed help for a specific command\n\n"
+            "<b>Examples:</b>\n"
             "/help\n"
             "/help new"
         ),
         "admin": (
-            "🔑 *Command: /admin*\n\n"
-            "*Usage:* /admin\n\n"
-            "*Description:* Check if you have admin privileges\n\n"
+            "🔑 <b>Command: /admin</b>\n\n"
+            "<b>Usage:</b> /admin\n\n"
+            "<b>Description:</b> Check if you have admin privileges\n\n"
             "Admin privileges are required for the following commands:\n"
             "- /pay - Mark subscription as paid\n"
             "- /extend - Extend subscription\n"
             "- /export - Export client data"
         ),
         "burn": (
-            "🔥 *Command: /burn*\n\n"
-            "*Usage:* /burn TOKEN_ID REASON\n\n"
-            "*Description:* Mark a token as burned (permanently disabled) with a reason\n\n"
-            "*Parameters:*\n"
+            "🔥 <b>Command: /burn</b>\n\n"
+            "<b>Usage:</b> /burn TOKEN_ID REASON\n\n"
+            "<b>Description:</b> Mark a token as burned (permanently disabled) with a reason\n\n"
+            "<b>Parameters:</b>\n"
             "- TOKEN_ID: The token to burn\n"
             "- REASON: The reason for burning the token\n\n"
-            "*Example:*\n"
+            "<b>Example:</b>\n"
             "/burn NFX-ABC1234-Profile1 Account sharing detected"
         ),
         "burned": (
-            "📊 *Command: /burned*\n\n"
-            "*Usage:* /burned\n\n"
-            "*Description:* List all burned tokens with their reasons and dates\n\n"
+            "📊 <b>Command: /burned</b>\n\n"
+            "<b>Usage:</b> /burned\n\n"
+            "<b>Description:</b> List all burned tokens with their reasons and dates\n\n"
             "Shows the most recent burned tokens first, limited to 10 entries per page."
         ),
         "last10": (
-            "📃 *Command: /last10*\n\n"
-            "*Usage:* /last10\n\n"
-            "*Description:* آخر 10 عمليات - Show the last 10 operations\n\n"
+            "📃 <b>Command: /last10</b>\n\n"
+            "<b>Usage:</b> /last10\n\n"
+            "<b>Description:</b> آخر 10 عمليات - Show the last 10 operations\n\n"
             "Displays a simple log of recent operations with icons:\n"
             "🆕 NEW - New client registration\n"
             "💳 PAID - Payment received\n"
@@ -271,20 +257,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "- Client name (when available)\n"
             "- Payment amount and other details\n\n"
             "Format example:\n"
-            "1) 🆕 NEW `NFX-MYP7K29WQ-Profile1` 13-09-2025 10:12 - John Smith\n\n"
-            "2) 💳 PAID `NFX-MYP7K29WQ-Profile1` 13-09-2025 12:35 - John Smith (10 TND)\n\n"
-            "3) ⏳ EXT `NFX-MYP7K29WQ-Profile1` 20-09-2025 09:10 - John Smith (+30 days)"
+            "1) 🆕 NEW <code>NFX-MYP7K29WQ-Profile1</code> 13-09-2025 10:12 - John Smith\n\n"
+            "2) 💳 PAID <code>NFX-MYP7K29WQ-Profile1</code> 13-09-2025 12:35 - John Smith (10 TND)\n\n"
+            "3) ⏳ EXT <code>NFX-MYP7K29WQ-Profile1</code> 20-09-2025 09:10 - John Smith (+30 days)"
         )
     }
     
     if command in command_help:
-        try:
-            await update.message.reply_text(command_help[command], parse_mode="Markdown")
-        except Exception as e:
-            # Fallback if Markdown parsing fails
-            await update.message.reply_text(command_help[command])
+        await outbox.reply(update, command_help[command], parse_mode=PARSE_MODE)
     else:
-        await update.message.reply_text(f"❌ Unknown command: {command}\n\nUse /help to see all available commands.")
+        await outbox.reply(update, f"❌ Unknown command: {command}\n\nUse /help to see all available commands.")
 
 
 # /new
@@ -292,77 +274,49 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def new_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if len(context.args) != 4:
-            await update.message.reply_text(
+            await outbox.reply(
+                update,
                 "❌ Usage: /new FullName Email Profile Duration\n\n"
                 "Duration examples:\n- 30 (days)\n- 2m (minutes)\n- 1h (hours)\n- 1d (1 day)"
             )
             return
 
         name, email, profile, duration_str = context.args
-        token = generate_token(profile)
+        token = await generate_token(profile)
 
         # parse duration
         delta = parse_duration(duration_str)
         start_date = datetime.now()
         end_date = start_date + delta
 
-        # save in DB
-        add_client(token, name, email, profile, duration_str)
+        # save in DB and schedule the reminders before anyone can /pay or /burn the token
+        async with token_locks(token):
+            await storage.add_client(token, name, email, profile, duration_str)
+
+            # 🕒 جدولة إشعار عند الانتهاء
+            reminders.schedule_reminders(token, name, email, profile, start_date, end_date, "Unpaid", end_date.strftime('%d-%m-%Y %H:%M'))
 
         # format display
-        reply = (
-            f"✅ *Registration successful!*\n\n"
-            f"👤 {name}\n"
-            f"📧 {email}\n"
-            f"📺 {profile}\n"
-            f"📅 Start: {start_date.strftime('%d-%m-%Y %H:%M')}\n"
-            f"📅 End: {end_date.strftime('%d-%m-%Y %H:%M')}\n"
-            f"⏱ Duration: {duration_str}\n"
-            f"💰 Status: Unpaid\n\n"
-            f"🔑 *Token:* `{token}`"
-        )
-        
-        try:
-            await update.message.reply_text(reply, parse_mode="Markdown")
-        except Exception as e:
-            # Fallback if Markdown parsing fails
-            logger.error(f"Error sending formatted message: {e}")
-            # Send without formatting
-            simple_reply = (
-                f"✅ Registration successful!\n\n"
-                f"👤 {name}\n"
-                f"📧 {email}\n"
-                f"📺 {profile}\n"
-                f"📅 Start: {start_date.strftime('%d-%m-%Y %H:%M')}\n"
-                f"📅 End: {end_date.strftime('%d-%m-%Y %H:%M')}\n"
-                f"⏱ Duration: {duration_str}\n"
-                f"💰 Status: Unpaid\n\n"
-                f"🔑 TOKEN: {token}\n"
-                f"---------------------------"
-            )
-            await update.message.reply_text(simple_reply)
-
-        # 🕒 جدولة إشعار عند الانتهاء
-        scheduler.add_job(
-            notify_expiration,
-            "date",
-            run_date=end_date,
-            args=[context.application, YOUR_CHAT_ID, token, name, email, profile, end_date.strftime('%d-%m-%Y %H:%M')]
+        reply = rendering.REGISTERED.render(
+            name=name, email=email, profile=profile,
+            start=start_date.strftime('%d-%m-%Y %H:%M'), end=end_date.strftime('%d-%m-%Y %H:%M'),
+            duration=duration_str, token=token
         )
+        await outbox.reply(update, reply, parse_mode=PARSE_MODE)
 
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {e}")
+        await outbox.reply(update, f"❌ Error: {e}")
         logger.error(f"Error in new_client: {e}", exc_info=True)
 
 # /token
 @admin_required
 async def token_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /token TOKEN_ID")
+        await outbox.reply(update, "❌ Usage: /token TOKEN_ID")
         return
 
     token = context.args[0]
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if client:
         # Extract the fields we need from the client tuple
         # The client tuple structure is: [id, token, name, email, profile, start_date, end_date, status, payment_amount, is_burned, burn_reason, burn_date]
@@ -391,7 +345,7 @@ async def token_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Prepare payment info
         payment_info = ""
         if payment_amount and payment_amount > 0:
-            payment_info = f"💵 Payment: {payment_amount} TND\n"
+            payment_info = rendering.TOKEN_PAYMENT.render(amount=payment_amount)
         
         # Format status with emoji
         status_emoji = "✅" if status == "Paid" else "⏳"
@@ -401,41 +355,26 @@ async def token_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if is_burned:
             burn_reason = client[10] if len(client) > 10 else "Unknown reason"
             burn_date = client[11] if len(client) > 11 else ""
-            burned_info = f"🔥 *BURNED*: {burn_reason}\n"
+            burned_info = rendering.TOKEN_BURNED.render(reason=burn_reason)
             if burn_date:
-                burned_info += f"📅 Burned on: {burn_date}\n"
+                burned_info += rendering.TOKEN_BURN_DATE.render(date=burn_date)
             status_emoji = "🔥"  # Override status emoji for burned tokens
         
         # Calculate days left only if not burned
         days_left_info = ""
         if not is_burned:
             days_left = (end_date - datetime.now()).days
-            days_left_info = f"⏱️ Days left: {days_left}\n"
-        
-        # Format the response
-        reply = f"ℹ️ *Token Information*\n\n"
-        reply += f"🔑 Token: `{token}`\n"
-        reply += f"👤 Name: {name}\n"
-        reply += f"📧 Email: {email}\n"
-        reply += f"🖥️ Profile: {profile}\n"
-        reply += f"📅 Start: {start}\n"
-        reply += f"📅 End: {end}\n"
-        reply += days_left_info
-        reply += f"{status_emoji} Status: {status}\n"
-        reply += payment_info
-        reply += burned_info
+            days_left_info = rendering.TOKEN_DAYS_LEFT.render(days=days_left)
         
-        # Add client ID for admin reference
-        reply += f"🆔 Client ID: {client_id}\n"
-        
-        try:
-            await update.message.reply_text(reply, parse_mode="Markdown")
-        except Exception as e:
-            # Fallback if Markdown parsing fails
-            logger.error(f"Error sending formatted message: {e}")
-            await update.message.reply_text(reply)
+        # Format the response (client ID for admin reference)
+        reply = rendering.TOKEN_INFO.render(
+            token=token, name=name, email=email, profile=profile, start=start, end=end,
+            days_left=Raw(days_left_info), status_emoji=status_emoji, status=status,
+            payment=Raw(payment_info), burned=Raw(burned_info), client_id=client_id
+        )
+        await outbox.reply(update, reply, parse_mode=PARSE_MODE)
     else:
-        await update.message.reply_text("❌ Token not found.")
+        await outbox.reply(update, "❌ Token not found.")
 
 # /admin - Check if user is an admin
 async def admin_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -445,39 +384,27 @@ async def admin_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from auth import is_admin, ADMIN_USERS
     
     if is_admin(user_id):
-        await update.message.reply_text(
-            f"✅ *Admin Access Granted*\n\n"
-            f"Hello, {first_name}!\n\n"
-            f"User ID: `{user_id}`\n"
-            f"Username: @{username}\n\n"
-            f"You have full administrative access to this bot.\n\n"
-            f"Current admin IDs: `{', '.join(map(str, ADMIN_USERS))}`",
-            parse_mode="Markdown"
+        reply = rendering.ADMIN_GRANTED.render(
+            first_name=first_name, user_id=user_id, username=username,
+            admin_ids=', '.join(map(str, ADMIN_USERS))
         )
     else:
-        await update.message.reply_text(
-            f"❌ *Access Denied*\n\n"
-            f"Hello, {first_name}!\n\n"
-            f"User ID: `{user_id}`\n"
-            f"Username: @{username}\n\n"
-            f"This bot is restricted to administrators only.\n\n"
-            f"To request access, please contact the bot owner with your User ID shown above.",
-            parse_mode="Markdown"
-        )
+        reply = rendering.ADMIN_DENIED.render(first_name=first_name, user_id=user_id, username=username)
+    await outbox.reply(update, reply, parse_mode=PARSE_MODE)
 
 # /pay
 @admin_required
 async def pay_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /pay TOKEN_ID [AMOUNT]")
+        await outbox.reply(update, "❌ Usage: /pay TOKEN_ID [AMOUNT]")
         return
     
     token = context.args[0]
     
     # Check if client exists
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if not client:
-        await update.message.reply_text(f"❌ Token {token} not found.")
+        await outbox.reply(update, f"❌ Token {token} not found.")
         return
     
     # Check if payment amount is provided
@@ -486,26 +413,34 @@ async def pay_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             payment_amount = float(context.args[1])
         except ValueError:
-            await update.message.reply_text("❌ Payment amount must be a number.")
+            await outbox.reply(update, "❌ Payment amount must be a number.")
             return
     
-    # Update status and payment amount
-    update_status(token, "Paid", payment_amount)
+    # Update status and payment amount, then replan the reminders (no more unpaid reminder)
+    async with token_locks(token):
+        paid = await storage.update_status(token, "Paid", payment_amount)
+        reminders.sync_client(token, await storage.get_client_by_token(token))
+    
+    # The client may have been deleted since the lookup
+    if not paid:
+        await outbox.reply(update, f"❌ Token {token} not found.")
+        return
     
     # Prepare response message
     if payment_amount is not None:
-        await update.message.reply_text(
+        await outbox.reply(
+            update,
             f"💰 Token {token} updated → Paid ✅\n"
             f"Payment amount: {payment_amount}"
         )
     else:
-        await update.message.reply_text(f"💰 Token {token} updated → Paid ✅")
+        await outbox.reply(update, f"💰 Token {token} updated → Paid ✅")
 
 # /extend
 @admin_required
 async def extend_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) < 2:
-        await update.message.reply_text("❌ Usage: /extend TOKEN_ID DAYS")
+        await outbox.reply(update, "❌ Usage: /extend TOKEN_ID DAYS")
         return
     
     token = context.args[0]
@@ -514,87 +449,91 @@ async def extend_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         days = int(context.args[1])
         if days <= 0:
-            await update.message.reply_text("❌ Days must be a positive number")
+            await outbox.reply(update, "❌ Days must be a positive number")
             return
     except ValueError:
-        await update.message.reply_text("❌ Days must be a valid number")
+        await outbox.reply(update, "❌ Days must be a valid number")
         return
     
     # Get client info before extending
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if not client:
-        await update.message.reply_text("❌ Token not found.")
+        await outbox.reply(update, "❌ Token not found.")
         return
     
     # Extend subscription
-    new_end = extend_subscription(token, days)
+    async with token_locks(token):
+        new_end = await storage.extend_subscription(token, days)
+        if new_end:
+            # Move the reminders to the new end date
+            reminders.sync_client(token, await storage.get_client_by_token(token))
+    
     if new_end:
         # Format the message as requested
-        reply = (
-            f"➕ *Abonnement prolongé*\n\n"
-            f"🔑 Token: `{token}`\n"
-            f"+{days} jours → Nouvelle fin: {new_end.strftime('%d-%m-%Y')}"
-        )
-        
-        try:
-            await update.message.reply_text(reply, parse_mode="Markdown")
-        except Exception as e:
-            # Fallback if Markdown parsing fails
-            logger.error(f"Error sending formatted message: {e}")
-            # Send without formatting
-            simple_reply = (
-                f"➕ Abonnement prolongé\n\n"
-                f"🔑 {token}\n"
-                f"+{days} jours → Nouvelle fin: {new_end.strftime('%d-%m-%Y')}"
-            )
-            await update.message.reply_text(simple_reply)
+        reply = rendering.EXTENDED.render(token=token, days=days, end=new_end.strftime('%d-%m-%Y'))
+        await outbox.reply(update, reply, parse_mode=PARSE_MODE)
+    else:
+        await outbox.reply(update, "❌ Une erreur s'est produite lors de la prolongation.")
+
+
+# Row renderers for the paginated lists (only called for the page being shown)
+def format_end_date(end):
+    """End date as dd-mm-YYYY, or the raw value if it can't be parsed"""
+    end_date = reminders.parse_end_date(end)
+    return end_date.strftime("%d-%m-%Y") if end_date else end
+
+def render_unpaid(row):
+    token, name, profile, start, end = row
+    return rendering.UNPAID_ROW.render(name=name, profile=profile, end=format_end_date(end), token=token)
+
+def render_expiring(row):
+    token, name, profile, end, status, payment_amount = row
+    end_date = reminders.parse_end_date(end)
+    if end_date:
+        remaining = end_date - datetime.now()
+        days_remaining = remaining.days
+        hours_remaining = int(remaining.seconds / 3600)
     else:
-        await update.message.reply_text("❌ Une erreur s'est produite lors de la prolongation.")
+        days_remaining = 0
+        hours_remaining = 0
 
+    if days_remaining > 0:
+        remaining_text = f"{days_remaining} days"
+    elif hours_remaining > 0:
+        remaining_text = f"{hours_remaining} hours"
+    else:
+        remaining_text = "less than 1 hour"
+
+    payment = ""
+    if payment_amount and payment_amount > 0:
+        payment = rendering.EXPIRING_PAYMENT.render(amount=payment_amount)
+    return rendering.EXPIRING_ROW.render(
+        name=name, profile=profile, end=format_end_date(end), status=status,
+        remaining=remaining_text, payment=Raw(payment), token=token
+    )
+
+def render_search(row):
+    token, name, email, profile, start, end, status = row
+    return rendering.SEARCH_ROW.render(name=name, profile=profile, status=status, token=token)
+
+def render_burned(row):
+    token, reason, date, name, email, profile = row
+    return rendering.BURNED_ROW.render(name=name, token=token, date=date, reason=reason)
 
 # /unpaid
 @admin_required
 async def unpaid_clients(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    clients = get_unpaid_clients()
+    clients = await storage.get_unpaid_clients()
     if not clients:
-        await update.message.reply_text("🎉 No unpaid clients!")
+        await outbox.reply(update, "🎉 No unpaid clients!")
         return
-    
-    reply = "⚠️ *Unpaid Clients*\n\n"
-    
-    for i, (token, name, profile, start, end) in enumerate(clients):
-        # Format end date for display
-        try:
-            end_date = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-            formatted_end = end_date.strftime("%d-%m-%Y")
-        except ValueError:
-            try:
-                end_date = datetime.strptime(end, "%Y-%m-%d")
-                formatted_end = end_date.strftime("%d-%m-%Y")
-            except ValueError:
-                formatted_end = end
-        
-        # Add client info with token in a code block for easy copying
-        reply += f"👤 *{name}* - {profile}\n"
-        reply += f"📅 Ends: {formatted_end}\n"
-        reply += f"🔑 Token: `{token}`\n\n"
-    
-    try:
-        await update.message.reply_text(reply, parse_mode="Markdown")
-    except Exception as e:
-        # Fallback if Markdown parsing fails
-        logger.error(f"Error sending formatted message: {e}")
-        
-        # Simplified fallback message
-        simple_reply = "⚠️ Unpaid Clients:\n\n"
-        for token, name, profile, start, end in clients:
-            simple_reply += f"🔑 {token} – {name} – {profile} (Ends: {end})\n\n"
-        await update.message.reply_text(simple_reply)
+
+    await pages.send(update, ("unpaid",), clients, render_unpaid, rendering.UNPAID_HEADER.render(), parse_mode=PARSE_MODE)
 
 # /stats
 @admin_required 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    total, paid, unpaid, expired, burned = get_stats()
+    total, paid, unpaid, expired, burned = await storage.get_stats()
     reply = (
         f"📊 Subscription Stats:\n"
         f"👥 Total Clients: {total}\n"
@@ -603,141 +542,64 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"⏳ Expired: {expired}\n"
         f"🔥 Burned: {burned}"
     )
-    await update.message.reply_text(reply)
+    await outbox.reply(update, reply)
 
 # /expiring X
 @admin_required
 async def expiring(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /expiring DAYS")
+        await outbox.reply(update, "❌ Usage: /expiring DAYS")
         return
     
     try:
         days = int(context.args[0])
     except ValueError:
-        await update.message.reply_text("❌ DAYS must be a number.")
+        await outbox.reply(update, "❌ DAYS must be a number.")
         return
 
-    clients = get_expiring_clients(days)
+    clients = await storage.get_expiring_clients(days)
     if not clients:
-        await update.message.reply_text(f"🎉 No clients expiring within {days} days.")
+        await outbox.reply(update, f"🎉 No clients expiring within {days} days.")
         return
-    
-    reply = f"⏳ *Clients expiring in {days} days:*\n\n"
-    
-    for token, name, profile, end, status, payment_amount in clients:
-        # Format end date for display and calculate days remaining
-        try:
-            end_date = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-            formatted_end = end_date.strftime("%d-%m-%Y")
-            days_remaining = (end_date - datetime.now()).days
-            hours_remaining = int((end_date - datetime.now()).seconds / 3600)
-        except ValueError:
-            try:
-                end_date = datetime.strptime(end, "%Y-%m-%d")
-                formatted_end = end_date.strftime("%d-%m-%Y")
-                days_remaining = (end_date - datetime.now()).days
-                hours_remaining = int((end_date - datetime.now()).seconds / 3600)
-            except ValueError:
-                formatted_end = end
-                days_remaining = 0
-                hours_remaining = 0
-        
-        # Prepare remaining time text
-        if days_remaining > 0:
-            remaining_text = f"{days_remaining} days"
-        elif hours_remaining > 0:
-            remaining_text = f"{hours_remaining} hours"
-        else:
-            remaining_text = "less than 1 hour"
-        
-        # Add client info with token in a code block for easy copying
-        reply += f"👤 *{name}* - {profile}\n"
-        reply += f"📅 Ends: {formatted_end} - Status: *{status}*\n"
-        reply += f"⏳ Remaining: {remaining_text}\n"
-        
-        # Add payment amount if available
-        if payment_amount and payment_amount > 0:
-            reply += f"💵 Payment: {payment_amount}\n"
-            
-        reply += f"🔑 Token: `{token}`\n\n"
-    
-    try:
-        await update.message.reply_text(reply, parse_mode="Markdown")
-    except Exception as e:
-        # Fallback if Markdown parsing fails
-        logger.error(f"Error sending formatted message: {e}")
-        
-        # Simplified fallback message
-        simple_reply = f"⏳ Clients expiring in {days} days:\n\n"
-        for token, name, profile, end, status, payment_amount in clients:
-            # Calculate remaining time for fallback message
-            try:
-                end_date = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-                days_remaining = (end_date - datetime.now()).days
-                hours_remaining = int((end_date - datetime.now()).seconds / 3600)
-                
-                if days_remaining > 0:
-                    remaining = f"{days_remaining} days"
-                elif hours_remaining > 0:
-                    remaining = f"{hours_remaining} hours"
-                else:
-                    remaining = "<1 hour"
-            except ValueError:
-                try:
-                    end_date = datetime.strptime(end, "%Y-%m-%d")
-                    days_remaining = (end_date - datetime.now()).days
-                    remaining = f"{days_remaining} days"
-                except ValueError:
-                    remaining = "unknown"
-            
-            payment_info = f", Payment: {payment_amount}" if payment_amount and payment_amount > 0 else ""
-            simple_reply += f"🔑 {token} – {name} – {profile} (Ends: {end}, Remaining: {remaining}, Status: {status}{payment_info})\n\n"
-        await update.message.reply_text(simple_reply)
+
+    await pages.send(
+        update, ("expiring", days), clients, render_expiring,
+        rendering.EXPIRING_HEADER.render(days=days), parse_mode=PARSE_MODE
+    )
 
 # /search command
 @admin_required
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("❌ Usage: /search QUERY")
+        await outbox.reply(update, "❌ Usage: /search QUERY")
         return
     
     query = context.args[0]
-    clients = search_clients(query)
+    clients = await storage.search_clients(query)
     
     if not clients:
-        await update.message.reply_text(f"🔎 No clients found matching '{query}'")
+        await outbox.reply(update, f"🔎 No clients found matching '{query}'")
         return
-    
-    reply = f"🔎 *Search results for '{query}':*\n\n"
-    for token, name, email, profile, start, end, status in clients:
-        reply += f"👤 {name} ({profile}) - {status}\n"
-        reply += f"🔑 Token: `{token}`\n\n"
-    
-    try:
-        await update.message.reply_text(reply, parse_mode="Markdown")
-    except Exception as e:
-        # Fallback if Markdown parsing fails
-        logger.error(f"Error sending formatted message: {e}")
-        
-        # Simplified fallback message
-        simple_reply = f"🔎 Search results for '{query}':\n\n"
-        for token, name, email, profile, start, end, status in clients:
-            simple_reply += f"🔑 {token} - {name} ({profile}) - {status}\n\n"
-        await update.message.reply_text(simple_reply)
+
+    # The backend returns the best SEARCH_LIMIT matches at most
+    if len(clients) >= SEARCH_LIMIT:
+        header = rendering.SEARCH_HEADER_TOP.render(limit=SEARCH_LIMIT, query=query)
+    else:
+        header = rendering.SEARCH_HEADER.render(query=query)
+    await pages.send(update, ("search", query.lower()), clients, render_search, header, parse_mode=PARSE_MODE)
 
 # /last10 command to show recent operations in a concise format
 @admin_required
 async def last10_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get last 10 operations
-    operations = get_recent_operations(10)
+    operations = await storage.get_recent_operations(10)
 
     if not operations:
-        await update.message.reply_text("🔎 لا توجد أي عمليات حديثة.")
+        await outbox.reply(update, "🔎 لا توجد أي عمليات حديثة.")
         return
 
     # Header
-    reply = f"📃 *آخر {len(operations)} عمليات:*\n\n"
+    reply = rendering.RECENT_HEADER.render(count=len(operations))
 
     # Icons for operation types
     op_icons = {
@@ -755,9 +617,6 @@ async def last10_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         op_type = op["type"]
         op_icon = op_icons.get(op_type, "💾")
 
-        # Token (in code block for easy copy)
-        token = f"`{op['token']}`"
-
         # Client name (normalize: replace "_" with space, title case)
         client_name = ""
         if op.get("client_name"):
@@ -771,59 +630,33 @@ async def last10_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Combine
         extra_info = " ".join([amount, details]).strip()
 
-        # Final line
-        reply += f"{i}) {op_icon} {op_type} {token} {formatted_date} {client_name} {extra_info}\n\n"
+        # Final line (token in a code block for easy copy)
+        reply += rendering.RECENT_ROW.render(
+            i=i, icon=op_icon, type=op_type, token=op["token"], date=formatted_date,
+            client=client_name, extra=extra_info
+        )
 
-    # Send message
-    try:
-        await update.message.reply_text(reply, parse_mode="Markdown")
-    except Exception as e:
-        logger.error(f"Markdown error: {e}")
-        await update.message.reply_text(reply.replace("`", ""))  # fallback without code blocks
+    await outbox.reply(update, reply, parse_mode=PARSE_MODE)
 
 # /burned command to list all burned tokens
 @admin_required
 async def list_burned_tokens(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    burned_tokens = get_burned_tokens()
+    burned_tokens = await storage.get_burned_tokens()
     
     if not burned_tokens:
-        await update.message.reply_text("🔎 No burned tokens found.")
+        await outbox.reply(update, "🔎 No burned tokens found.")
         return
-    
-    reply = f"🔥 *Burned Tokens ({len(burned_tokens)}):*\n\n"
-    
-    for token, reason, date, name, email, profile in burned_tokens[:10]:  # Limit to 10 to avoid message too long
-        reply += f"👤 {name}\n"
-        reply += f"🔑 Token: `{token}`\n"
-        reply += f"📅 {date}\n"
-        reply += f"📜 {reason}\n\n"
-    
-    if len(burned_tokens) > 10:
-        reply += f"\n...and {len(burned_tokens) - 10} more.\n"
-    
-    try:
-        await update.message.reply_text(reply, parse_mode="Markdown")
-    except Exception as e:
-        # Fallback if Markdown parsing fails
-        logger.error(f"Error sending formatted message: {e}")
-        
-        # Simplified fallback message
-        simple_reply = f"🔥 Burned Tokens ({len(burned_tokens)}):\n\n"
-        for token, reason, date, name, email, profile in burned_tokens[:10]:
-            simple_reply += f"🔑 {token} - {name}\n"
-            simple_reply += f"   📅 {date}\n"
-            simple_reply += f"   📜 {reason}\n\n"
-        
-        if len(burned_tokens) > 10:
-            simple_reply += f"\n...and {len(burned_tokens) - 10} more.\n"
-            
-        await update.message.reply_text(simple_reply)
+
+    await pages.send(
+        update, ("burned",), burned_tokens, render_burned,
+        rendering.BURNED_HEADER.render(count=len(burned_tokens)), parse_mode=PARSE_MODE
+    )
 
 # /burn command to mark tokens as burned
 @admin_required
 async def burn_token_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) < 2:
-        await update.message.reply_text("❌ Usage: /burn TOKEN_ID REASON")
+        await outbox.reply(update, "❌ Usage: /burn TOKEN_ID REASON")
         return
     
     token = context.args[0]
@@ -831,49 +664,34 @@ async def burn_token_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Validate token format
     if not re.match(r'^NFX-[A-Z0-9]+-\w+$', token):
-        await update.message.reply_text("❌ Invalid token format. Token should be in format NFX-XXXX-Profile")
+        await outbox.reply(update, "❌ Invalid token format. Token should be in format NFX-XXXX-Profile")
         return
     
     # Get client info before burning
-    client = get_client_by_token(token)
+    client = await storage.get_client_by_token(token)
     if not client:
-        await update.message.reply_text(f"❌ Token {token} not found.")
+        await outbox.reply(update, f"❌ Token {token} not found.")
         return
     
     # Extract client info for the response
     _, _, name, email, profile, _, _, status = client[:8]  # First 8 fields
     
     # Burn the token
-    success, message = burn_token(token, reason)
+    async with token_locks(token):
+        success, message = await storage.burn_token(token, reason)
+        if success:
+            # A burned token must not get any reminder
+            reminders.cancel_reminders(token)
     
     if success:
         # Format the success message
-        reply = (
-            f"🔥 *Token Burned Successfully*\n\n"
-            f"🔑 Token: `{token}`\n"
-            f"👤 {name} ({email})\n"
-            f"📺 Profile: {profile}\n"
-            f"📜 Reason: {reason}\n"
-            f"📅 Date: {datetime.now().strftime('%d-%m-%Y %H:%M')}"
+        reply = rendering.BURNED.render(
+            token=token, name=name, email=email, profile=profile, reason=reason,
+            date=datetime.now().strftime('%d-%m-%Y %H:%M')
         )
-        
-        try:
-            await update.message.reply_text(reply, parse_mode="Markdown")
-        except Exception as e:
-            # Fallback if Markdown parsing fails
-            logger.error(f"Error sending formatted message: {e}")
-            # Send without formatting
-            simple_reply = (
-                f"🔥 Token Burned Successfully\n\n"
-                f"🔑 {token}\n"
-                f"👤 {name} ({email})\n"
-                f"📺 Profile: {profile}\n"
-                f"📜 Reason: {reason}\n"
-                f"📅 Date: {datetime.now().strftime('%d-%m-%Y %H:%M')}"
-            )
-            await update.message.reply_text(simple_reply)
+        await outbox.reply(update, reply, parse_mode=PARSE_MODE)
     else:
-        await update.message.reply_text(f"❌ {message}")
+        await outbox.reply(update, f"❌ {message}")
 
 # /export command
 @admin_required
@@ -883,78 +701,74 @@ async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if context.args and context.args[0].lower() in ["csv", "excel"]:
             format_type = context.args[0].lower()
         
-        await update.message.reply_text(f"⏳ Exporting client data to {format_type.upper()}...")
-        
-        # Get all clients from Google Sheets
-        clients = get_all_clients()
-        
-        # Create exports directory if it doesn't exist
-        os.makedirs('exports', exist_ok=True)
-        
-        # Generate timestamp for filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        await outbox.reply(update, f"⏳ Exporting client data to {format_type.upper()}...")
         
+        # Stream the clients from Google Sheets into an in-memory document (on the storage pool)
         if format_type == "csv":
-            import csv
-            filepath = os.path.join('exports', f'netflix_clients_gsheet_{timestamp}.csv')
-            
-            with open(filepath, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Token', 'Name', 'Email', 'Profile', 'Start Date', 'End Date', 'Status'])
-                for client in clients:
-                    writer.writerow(client)
-                    
-            await update.message.reply_document(
-                document=open(filepath, 'rb'),
-                filename=os.path.basename(filepath),
-                caption="📊 Here's your exported client data in CSV format."
-            )
+            document = await storage.run(export_to_csv, googlesheet.iter_clients(), "netflix_clients_gsheet")
+            caption = "📊 Here's your exported client data in CSV format."
         else:  # Excel
-            import pandas as pd
-            filepath = os.path.join('exports', f'netflix_clients_gsheet_{timestamp}.xlsx')
-            
-            df = pd.DataFrame(clients, columns=['Token', 'Name', 'Email', 'Profile', 'Start Date', 'End Date', 'Status'])
-            df.to_excel(filepath, index=False)
-            
-            await update.message.reply_document(
-                document=open(filepath, 'rb'),
-                filename=os.path.basename(filepath),
-                caption="📊 Here's your exported client data in Excel format."
-            )
+            document = await storage.run(export_to_excel, googlesheet.iter_clients(), "netflix_clients_gsheet")
+            caption = "📊 Here's your exported client data in Excel format."
+        
+        with document:
+            await outbox.reply_document(update, document=document, caption=caption)
             
     except Exception as e:
-        await update.message.reply_text(f"❌ Error exporting data: {e}")
+        await outbox.reply(update, f"❌ Error exporting data: {e}")
         logger.error(f"Error in export_data: {e}", exc_info=True)
 
 
+# /queue - outgoing message queue metrics
+@admin_required
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    m = outbox.metrics()
+    await outbox.reply(
+        update,
+        f"📤 Outgoing messages\n\n"
+        f"Waiting (interactive): {m['interactive_waiting']}\n"
+        f"Waiting (reminders): {m['bulk_waiting']}\n"
+        f"In flight: {m['in_flight']}\n"
+        f"Sent: {m['sent']}\n"
+        f"Failed: {m['failed']}\n"
+        f"Rate limited (RetryAfter): {m['retry_after']}\n"
+        f"Paused for: {m['paused_for']}s"
+    )
+
+# Errors raised by handlers
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    if isinstance(context.error, SheetsQuotaError):
+        # The command waited its whole budget for Google Sheets quota
+        logger.warning(f"Command dropped after waiting for Sheets quota: {context.error}")
+        if isinstance(update, Update) and update.effective_message:
+            await outbox.reply(update, f"⏳ {context.error}")
+        return
+    logger.error(f"Unhandled error: {context.error}", exc_info=context.error)
+
 # /start command
 @admin_required
 async def startapp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_text = get_help_text()
-    await update.message.reply_text(welcome_text)
+    await outbox.reply(update, welcome_text)
 
-def main():
-    app = Application.builder().token(BOT_TOKEN).build()
-    register_admin_check(app)
+async def post_init(app: Application):
+    outbox.start(app.bot)
+    
+    # Start the scheduler once the bot is initialized, so jobs missed while we were down can send
+    reminders.start(app, YOUR_CHAT_ID, notify_expiration, send=lambda chat_id, text: outbox.send(chat_id, text, priority=BULK))
+    
+    # Jobs are persisted: the full client scan only happens on the very first start
+    if reminders.needs_seeding():
+        reminders.seed(await storage.get_all_clients(), burned=[row[0] for row in await storage.get_burned_tokens()])
 
-    # Load all existing clients and re-schedule jobs
-    for token, name, email, profile, start, end, status in get_all_clients():
-        try:
-            end_date = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            try:
-                end_date = datetime.strptime(end, "%Y-%m-%d")
-            except:
-                continue
-        
-        # إذا الاشتراك مزال ما انتهى
-        if end_date > datetime.now():
-            scheduler.add_job(
-                notify_expiration,
-                "date",
-                run_date=end_date,
-                args=[app, YOUR_CHAT_ID, token, name, email, profile, end]
-            )
+async def post_stop(app: Application):
+    # Give queued replies and reminders a chance to go out, while the bot can still send
+    # (Application.shutdown closes its HTTP client before post_shutdown runs)
+    await outbox.stop()
+
+def main():
+    app = Application.builder().token(BOT_TOKEN).post_init(post_init).post_stop(post_stop).concurrent_updates(CONCURRENT_UPDATES).build()
+    register_admin_check(app, outbox)
 
     # === Handlers
     app.add_handler(CommandHandler("start", startapp))
@@ -972,9 +786,26 @@ def main():
     app.add_handler(CommandHandler("burn", burn_token_command))
     app.add_handler(CommandHandler("burned", list_burned_tokens))
     app.add_handler(CommandHandler("last10", last10_command))
-
-    scheduler.start()
-    app.run_polling()
+    app.add_handler(CommandHandler("queue", queue_command))
+    app.add_handler(CallbackQueryHandler(admin_required(pages.handle_callback), pattern=CALLBACK_PATTERN))
+    app.add_error_handler(error_handler)
+
+    # Webhook mode when configured in .env, long polling otherwise
+    if webhook.enabled():
+        app.run_webhook(
+            listen=webhook.WEBHOOK_LISTEN,
+            port=webhook.WEBHOOK_PORT,
+            url_path=webhook.WEBHOOK_PATH,
+            webhook_url=webhook.WEBHOOK_URL,
+            secret_token=webhook.WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        app.run_polling()
+    
+    # Write out operations still waiting in the log queue before exiting
+    storage.shutdown()
+    stop_operations_log()
 
 if __name__ == "__main__":
     main()
@@ -1,69 +1,250 @@
 # database.py
 import sqlite3
+import threading
 from datetime import datetime, timedelta
 
 DB_NAME = "clients.db"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # How dates are stored: sorts as text, so end_date comparisons use its index
+SEARCH_LIMIT = 50  # Best matches returned by search_clients
+SEARCH_RANK_MAX_MATCHES = 1000  # Broader queries skip the ranking, which costs per match
+BUSY_TIMEOUT_MS = 5000  # Wait for a concurrent writer instead of failing with "database is locked"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+# Long-lived connections: one per thread (sqlite3 connections must not be
+# shared between threads), opened on first use and kept until close_db().
+# WAL lets readers run while a write is in progress, and synchronous=NORMAL
+# only syncs at checkpoints, which is safe in WAL mode.
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # Bumped by close_db so threads reopen instead of reusing a closed connection
+_fts_enabled = True  # Set by init_db: False if this SQLite has no FTS5 trigram tokenizer
+
+def get_connection():
+    """The calling thread's connection to DB_NAME, opened and configured on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key == (DB_NAME, _generation):
+        return conn
+    if conn is not None:
+        # DB_NAME changed (benchmark): drop the connection to the old file
+        with _connections_lock:
+            if conn in _connections:
+                _connections.remove(conn)
+        conn.close()
+    conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    _local.conn, _local.key = conn, (DB_NAME, _generation)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def close_db():
+    """Close every thread's connection (shutdown, or before replacing the database file)"""
+    global _generation
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in connections:
+        conn.close()
+
+# IS (not =) so a NULL status or is_burned counts as 0 instead of nulling the counter
+STATS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS client_stats_insert AFTER INSERT ON clients BEGIN
+        UPDATE client_stats SET
+            total = total + 1,
+            paid = paid + (NEW.status IS 'Paid'),
+            unpaid = unpaid + (NEW.status IS 'Unpaid'),
+            burned = burned + (NEW.is_burned IS 1);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_stats_delete AFTER DELETE ON clients BEGIN
+        UPDATE client_stats SET
+            total = total - 1,
+            paid = paid - (OLD.status IS 'Paid'),
+            unpaid = unpaid - (OLD.status IS 'Unpaid'),
+            burned = burned - (OLD.is_burned IS 1);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_stats_update AFTER UPDATE OF status, is_burned ON clients BEGIN
+        UPDATE client_stats SET
+            paid = paid + (NEW.status IS 'Paid') - (OLD.status IS 'Paid'),
+            unpaid = unpaid + (NEW.status IS 'Unpaid') - (OLD.status IS 'Unpaid'),
+            burned = burned + (NEW.is_burned IS 1) - (OLD.is_burned IS 1);
+    END
+    """,
+]
+
+# Full-text index for /search: external content table over clients, trigram
+# tokenizer so any substring of 3+ characters is an index lookup
+FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5(
+        token, name, email, profile,
+        content='clients', content_rowid='id', tokenize='trigram'
+    )
+"""
+FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_fts_insert AFTER INSERT ON clients BEGIN
+        INSERT INTO clients_fts (rowid, token, name, email, profile)
+        VALUES (NEW.id, NEW.token, NEW.name, NEW.email, NEW.profile);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_fts_delete AFTER DELETE ON clients BEGIN
+        INSERT INTO clients_fts (clients_fts, rowid, token, name, email, profile)
+        VALUES ('delete', OLD.id, OLD.token, OLD.name, OLD.email, OLD.profile);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_fts_update AFTER UPDATE OF token, name, email, profile ON clients BEGIN
+        INSERT INTO clients_fts (clients_fts, rowid, token, name, email, profile)
+        VALUES ('delete', OLD.id, OLD.token, OLD.name, OLD.email, OLD.profile);
+        INSERT INTO clients_fts (rowid, token, name, email, profile)
+        VALUES (NEW.id, NEW.token, NEW.name, NEW.email, NEW.profile);
+    END
+    """,
+]
+
+# --- Schema migrations --------------------------------------------------
+# The schema version lives in PRAGMA user_version. init_db reads it and runs
+# only the migrations above it, each in its own transaction together with the
+# version bump. Append new migrations to MIGRATIONS, never edit a released one.
+# They are written to be idempotent: databases created before versioning
+# (user_version 0) may already have some of their tables and indexes.
+
+def _migration_1_base_tables(c):
+    """clients and burned_tokens, including the columns added over time"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token TEXT UNIQUE,
+            name TEXT,
+            email TEXT,
+            profile TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            status TEXT,
+            payment_amount REAL DEFAULT 0.0,
+            is_burned INTEGER DEFAULT 0,
+            burn_reason TEXT DEFAULT NULL,
+            burn_date TEXT DEFAULT NULL
+        )
+    ''')
     
-    # Check if the clients table exists
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='clients'")
-    table_exists = c.fetchone() is not None
+    # Tables created by older versions of the bot may lack the later columns
+    existing = {row[1] for row in c.execute("PRAGMA table_info(clients)")}
+    columns_to_add = [
+        ("payment_amount", "REAL DEFAULT 0.0"),
+        ("is_burned", "INTEGER DEFAULT 0"),
+        ("burn_reason", "TEXT DEFAULT NULL"),
+        ("burn_date", "TEXT DEFAULT NULL")
+    ]
+    for column_name, column_type in columns_to_add:
+        if column_name not in existing:
+            c.execute(f"ALTER TABLE clients ADD COLUMN {column_name} {column_type}")
     
-    if not table_exists:
-        # Create new table with payment_amount field
-        c.execute('''
-            CREATE TABLE clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                token TEXT UNIQUE,
-                name TEXT,
-                email TEXT,
-                profile TEXT,
-                start_date TEXT,
-                end_date TEXT,
-                status TEXT,
-                payment_amount REAL DEFAULT 0.0,
-                is_burned INTEGER DEFAULT 0,
-                burn_reason TEXT DEFAULT NULL,
-                burn_date TEXT DEFAULT NULL
-            )
-        ''')
-    else:
-        # Check and add columns if they don't exist
-        columns_to_add = [
-            ("payment_amount", "REAL DEFAULT 0.0"),
-            ("is_burned", "INTEGER DEFAULT 0"),
-            ("burn_reason", "TEXT DEFAULT NULL"),
-            ("burn_date", "TEXT DEFAULT NULL")
-        ]
-        
-        for column_name, column_type in columns_to_add:
-            try:
-                c.execute(f"SELECT {column_name} FROM clients LIMIT 1")
-            except sqlite3.OperationalError:
-                # Add column to existing table
-                c.execute(f"ALTER TABLE clients ADD COLUMN {column_name} {column_type}")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS burned_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token TEXT UNIQUE,
+            burn_reason TEXT,
+            burn_date TEXT,
+            client_id INTEGER,
+            FOREIGN KEY (client_id) REFERENCES clients (id)
+        )
+    ''')
+
+def _migration_2_date_indexes(c):
+    """DATE_FORMAT end dates and the indexes of the list and stats queries"""
+    # Older rows may hold a bare date for end_date; give them the full
+    # DATE_FORMAT so plain text comparisons against a timestamp are exact
+    c.execute("UPDATE clients SET end_date = end_date || ' 00:00:00' WHERE length(end_date) = 10")
+    
+    # token already has its UNIQUE index
+    c.execute("CREATE INDEX IF NOT EXISTS idx_clients_status ON clients (status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_clients_is_burned ON clients (is_burned)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_clients_end_date ON clients (end_date)")
+
+def _migration_3_stats_counters(c):
+    """/stats counters, kept current by triggers so get_stats never counts rows"""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS client_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL,
+            paid INTEGER NOT NULL,
+            unpaid INTEGER NOT NULL,
+            burned INTEGER NOT NULL
+        )
+    """)
+    for statement in STATS_TRIGGERS:
+        c.execute(statement)
+    # Count the existing clients once
+    c.execute("""
+        INSERT OR IGNORE INTO client_stats (id, total, paid, unpaid, burned)
+        SELECT 1, COUNT(*), COALESCE(SUM(status IS 'Paid'), 0),
+               COALESCE(SUM(status IS 'Unpaid'), 0), COALESCE(SUM(is_burned IS 1), 0)
+        FROM clients
+    """)
+
+def _migration_4_search_index(c):
+    """Full-text search index and its triggers, indexing the existing clients once"""
+    try:
+        c.execute(FTS_TABLE)
+    except sqlite3.OperationalError as e:
+        # No FTS5, or SQLite older than 3.34 (no trigram tokenizer)
+        print(f"Full-text search unavailable ({e}), /search will scan the clients table")
+        return
+    c.execute("INSERT INTO clients_fts (clients_fts) VALUES ('rebuild')")
+    for statement in FTS_TRIGGERS:
+        c.execute(statement)
+
+MIGRATIONS = [
+    _migration_1_base_tables,
+    _migration_2_date_indexes,
+    _migration_3_stats_counters,
+    _migration_4_search_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def init_db():
+    """Bring the database schema up to SCHEMA_VERSION
     
-    # Create burned_tokens table if it doesn't exist
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='burned_tokens'")
-    burned_table_exists = c.fetchone() is not None
+    An up to date database costs a single query: the schema version and
+    whether the search index exists.
+    """
+    global _fts_enabled
+    conn = get_connection()
+    c = conn.cursor()
     
-    if not burned_table_exists:
-        c.execute('''
-            CREATE TABLE burned_tokens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                token TEXT UNIQUE,
-                burn_reason TEXT,
-                burn_date TEXT,
-                client_id INTEGER,
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
+    c.execute("""
+        SELECT (SELECT user_version FROM pragma_user_version),
+               EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'clients_fts')
+    """)
+    version, has_fts = c.fetchone()
+    if version > SCHEMA_VERSION:
+        print(f"Database schema version {version} is newer than this bot ({SCHEMA_VERSION}), not migrating")
+    
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        print(f"Migrating database to schema version {number}: {migration.__doc__}")
+        c.execute("BEGIN")
+        try:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
     
-    conn.commit()
-    conn.close()
+    if version < SCHEMA_VERSION:
+        # The search index migration may have been skipped
+        c.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'clients_fts')")
+        has_fts = c.fetchone()[0]
+    _fts_enabled = bool(has_fts)
 
 def parse_duration(duration):
     """Parse duration string like '30', '2m', '1h' into timedelta"""
@@ -88,118 +269,99 @@ def parse_duration(duration):
         raise ValueError(f"Unsupported duration format: {duration}")
 
 def add_client(token, name, email, profile, duration):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
     start = datetime.now()
     
     # Parse duration (can be days, minutes, or hours)
     duration_delta = parse_duration(duration)
     end = start + duration_delta
     
-    c.execute('''
-        INSERT INTO clients (token, name, email, profile, start_date, end_date, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (token, name, email, profile, start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S"), "Unpaid"))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:  # Commits, or rolls back if the insert fails
+        conn.execute('''
+            INSERT INTO clients (token, name, email, profile, start_date, end_date, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (token, name, email, profile, start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT), "Unpaid"))
     return start, end
 
 def token_exists(token):
     """Check if a token already exists in the database"""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM clients WHERE token=?", (token,))
-    count = c.fetchone()[0]
-    conn.close()
-    return count > 0
+    c = get_connection().execute("SELECT COUNT(*) FROM clients WHERE token=?", (token,))
+    return c.fetchone()[0] > 0
 
 def get_client_by_token(token):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM clients WHERE token=?", (token,))
-    client = c.fetchone()
-    conn.close()
-    return client
+    c = get_connection().execute("SELECT * FROM clients WHERE token=?", (token,))
+    return c.fetchone()
 
 def update_status(token, new_status, payment_amount=None):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    if payment_amount is not None:
-        # Update both status and payment amount
-        c.execute("UPDATE clients SET status=?, payment_amount=? WHERE token=?", 
-                 (new_status, payment_amount, token))
-    else:
-        # Update only status
-        c.execute("UPDATE clients SET status=? WHERE token=?", (new_status, token))
-    
-    conn.commit()
-    conn.close()
+    """Returns False if the token was not found"""
+    conn = get_connection()
+    with conn:
+        if payment_amount is not None:
+            # Update both status and payment amount
+            c = conn.execute("UPDATE clients SET status=?, payment_amount=? WHERE token=?", 
+                             (new_status, payment_amount, token))
+        else:
+            # Update only status
+            c = conn.execute("UPDATE clients SET status=? WHERE token=?", (new_status, token))
+    return c.rowcount > 0
 
 def extend_subscription(token, extra_days):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT end_date FROM clients WHERE token=?", (token,))
-    result = c.fetchone()
+    conn = get_connection()
+    result = conn.execute("SELECT end_date FROM clients WHERE token=?", (token,)).fetchone()
     if not result:
-        conn.close()
         return None
     
     # Try to parse with time component first, then fall back to just date
     try:
-        old_end = datetime.strptime(result[0], "%Y-%m-%d %H:%M:%S")
+        old_end = datetime.strptime(result[0], DATE_FORMAT)
     except ValueError:
         try:
             old_end = datetime.strptime(result[0], "%Y-%m-%d")
         except ValueError:
             # If both formats fail, log error and return None
             print(f"Error parsing date: {result[0]}")
-            conn.close()
             return None
     
     new_end = old_end + timedelta(days=extra_days)
     
-    # Preserve the time component if it existed in the original date
-    if ":" in result[0]:
-        new_end_str = new_end.strftime("%Y-%m-%d %H:%M:%S")
-    else:
-        new_end_str = new_end.strftime("%Y-%m-%d")
-    
-    c.execute("UPDATE clients SET end_date=? WHERE token=?", (new_end_str, token))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("UPDATE clients SET end_date=? WHERE token=?", (new_end.strftime(DATE_FORMAT), token))
     return new_end
 
 def get_unpaid_clients():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT token, name, profile, start_date, end_date FROM clients WHERE status='Unpaid'")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    c = get_connection().execute("SELECT token, name, profile, start_date, end_date FROM clients WHERE status='Unpaid'")
+    return c.fetchall()
 
 def get_all_clients():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT token, name, email, profile, start_date, end_date, status FROM clients")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    c = get_connection().execute("SELECT token, name, email, profile, start_date, end_date, status FROM clients")
+    return c.fetchall()
+
+def iter_clients(batch_size=500):
+    """Yield the rows of get_all_clients without loading them all at once (exports)"""
+    # Own cursor on the thread's connection; closed even if the export stops early
+    c = get_connection().execute("SELECT token, name, email, profile, start_date, end_date, status FROM clients")
+    try:
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        c.close()
 
 def burn_token(token, reason):
     """Mark a token as burned with a reason"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     c = conn.cursor()
     
     # Get current time
-    burn_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    burn_date = datetime.now().strftime(DATE_FORMAT)
     
     # First check if token exists
     c.execute("SELECT id FROM clients WHERE token=?", (token,))
     result = c.fetchone()
     
     if not result:
-        conn.close()
         return False, "Token not found"
     
     client_id = result[0]
@@ -209,91 +371,104 @@ def burn_token(token, reason):
     is_burned = c.fetchone()[0]
     
     if is_burned:
-        conn.close()
         return False, "Token is already burned"
     
-    # Update client record
-    c.execute("UPDATE clients SET is_burned=1, burn_reason=?, burn_date=? WHERE token=?", 
-              (reason, burn_date, token))
-    
-    # Add to burned_tokens table
-    c.execute("INSERT INTO burned_tokens (token, burn_reason, burn_date, client_id) VALUES (?, ?, ?, ?)",
-              (token, reason, burn_date, client_id))
-    
-    conn.commit()
-    conn.close()
+    with conn:  # Both rows or neither
+        # Update client record
+        c.execute("UPDATE clients SET is_burned=1, burn_reason=?, burn_date=? WHERE token=?", 
+                  (reason, burn_date, token))
+        
+        # Add to burned_tokens table
+        c.execute("INSERT INTO burned_tokens (token, burn_reason, burn_date, client_id) VALUES (?, ?, ?, ?)",
+                  (token, reason, burn_date, client_id))
     return True, f"Token {token} has been burned successfully"
 
 def get_burned_tokens():
     """Get all burned tokens"""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    c = get_connection().cursor()
     c.execute("""SELECT bt.token, bt.burn_reason, bt.burn_date, c.name, c.email, c.profile 
                FROM burned_tokens bt 
                JOIN clients c ON bt.client_id = c.id 
                ORDER BY bt.burn_date DESC""")
-    tokens = c.fetchall()
-    conn.close()
-    return tokens
+    return c.fetchall()
 
 def get_stats():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # Total clients
-    c.execute("SELECT COUNT(*) FROM clients")
-    total = c.fetchone()[0]
-    
-    # Paid clients
-    c.execute("SELECT COUNT(*) FROM clients WHERE status='Paid'")
-    paid = c.fetchone()[0]
+    c = get_connection().cursor()
     
-    # Unpaid clients
-    c.execute("SELECT COUNT(*) FROM clients WHERE status='Unpaid'")
-    unpaid = c.fetchone()[0]
+    # Total, paid, unpaid and burned come from the trigger-maintained counters
+    c.execute("SELECT total, paid, unpaid, burned FROM client_stats WHERE id = 1")
+    total, paid, unpaid, burned = c.fetchone()
     
-    # Expired clients
-    c.execute("SELECT COUNT(*) FROM clients WHERE datetime(end_date) < datetime('now')")
+    # Expired depends on the current time: range count on idx_clients_end_date
+    # (dates are stored in local time, like datetime.now())
+    c.execute("SELECT COUNT(*) FROM clients WHERE end_date < ?", (datetime.now().strftime(DATE_FORMAT),))
     expired = c.fetchone()[0]
     
-    # Burned tokens
-    c.execute("SELECT COUNT(*) FROM clients WHERE is_burned=1")
-    burned = c.fetchone()[0]
-    
-    conn.close()
     return total, paid, unpaid, expired, burned
 
 def get_expiring_clients(days):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    c = get_connection().cursor()
     today = datetime.now()
     limit = today + timedelta(days=days)
-    c.execute("SELECT token, name, profile, end_date, status FROM clients WHERE end_date <= ?", (limit.strftime("%Y-%m-%d"),))
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    # Range scan on idx_clients_end_date, which also gives the soonest first
+    c.execute("SELECT token, name, profile, end_date, status FROM clients WHERE end_date <= ? ORDER BY end_date",
+              (limit.strftime(DATE_FORMAT),))
+    return c.fetchall()
 
-def search_clients(query):
+def search_clients(query, limit=SEARCH_LIMIT):
     """
     Search for clients by name, email, profile, or token
-    Returns matching clients
+    Returns at most limit matches: exact token first, then prefix matches,
+    then the other substring matches by bm25. Queries too short for the
+    trigram index or matching more than SEARCH_RANK_MAX_MATCHES clients
+    only put the exact token first.
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    c = get_connection().cursor()
+    columns = "c.token, c.name, c.email, c.profile, c.start_date, c.end_date, c.status"
     
-    # Use LIKE for case-insensitive partial matching
-    search_query = f"%{query}%"
-    
-    c.execute("""
-        SELECT token, name, email, profile, start_date, end_date, status 
-        FROM clients 
-        WHERE 
-            token LIKE ? OR 
-            name LIKE ? OR 
-            email LIKE ? OR 
-            profile LIKE ?
-    """, (search_query, search_query, search_query, search_query))
+    if _fts_enabled and len(query) >= 3:
+        # Whole query as one phrase: trigram phrases match substrings
+        phrase = '"' + query.replace('"', '""') + '"'
+        c.execute("SELECT COUNT(*) FROM (SELECT 1 FROM clients_fts WHERE clients_fts MATCH ? LIMIT ?)",
+                  (phrase, SEARCH_RANK_MAX_MATCHES + 1))
+        if c.fetchone()[0] <= SEARCH_RANK_MAX_MATCHES:
+            prefix = _like_escape(query) + "%"
+            c.execute(f"""
+                SELECT {columns}
+                FROM clients_fts
+                JOIN clients c ON c.id = clients_fts.rowid
+                WHERE clients_fts MATCH ?
+                ORDER BY
+                    CASE WHEN c.token = ? COLLATE NOCASE THEN 0
+                         WHEN c.token LIKE ? ESCAPE '\\' OR c.name LIKE ? ESCAPE '\\'
+                           OR c.email LIKE ? ESCAPE '\\' OR c.profile LIKE ? ESCAPE '\\' THEN 1
+                         ELSE 2 END,
+                    clients_fts.rank
+                LIMIT ?
+            """, (phrase, query, prefix, prefix, prefix, prefix, limit))
+            return c.fetchall()
+        matches = f"SELECT {columns} FROM clients_fts JOIN clients c ON c.id = clients_fts.rowid WHERE clients_fts MATCH ?"
+        args = (phrase,)
+    else:
+        # Fewer than 3 characters can't use trigrams: partial matching with LIKE
+        search_query = "%" + _like_escape(query) + "%"
+        matches = f"""
+            SELECT {columns}
+            FROM clients c
+            WHERE 
+                c.token LIKE ? ESCAPE '\\' OR 
+                c.name LIKE ? ESCAPE '\\' OR 
+                c.email LIKE ? ESCAPE '\\' OR 
+                c.profile LIKE ? ESCAPE '\\'
+        """
+        args = (search_query, search_query, search_query, search_query)
     
+    # Broad query: the exact token (UNIQUE index), then the first matches in table order
+    c.execute(f"SELECT {columns} FROM clients c WHERE c.token = ?", (query,))
     rows = c.fetchall()
-    conn.close()
-    return rows
+    c.execute(f"SELECT * FROM ({matches}) WHERE token IS NOT ? LIMIT ?", args + (query, limit - len(rows)))
+    return rows + c.fetchall()
+
+def _like_escape(text):
+    """Escape LIKE wildcards so they match literally (with ESCAPE '\\')"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
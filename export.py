@@ -1,44 +1,70 @@
 # export.py
+# Streaming client exports for /export
+#
+# Rows come from a generator (iter_clients of database.py or googlesheet.py)
+# and are written straight into a SpooledTemporaryFile: it stays in memory up
+# to SPOOL_MAX_BYTES and only then rolls over to an anonymous temp file that
+# disappears once closed. Nothing is left in an exports/ directory and the
+# caller closes the buffer with a with block once it has been sent. The
+# buffer carries the timestamped file name, so it can be passed as is to
+# send_document.
 import csv
-import os
+import io
+import tempfile
 from datetime import datetime
-import pandas as pd
-from database import get_all_clients
-
-def export_to_csv(filename=None):
-    """Export all client data to a CSV file"""
-    if filename is None:
-        filename = f"netflix_clients_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    clients = get_all_clients()
-    
-    # Create directory if it doesn't exist
-    os.makedirs('exports', exist_ok=True)
-    filepath = os.path.join('exports', filename)
-    
-    with open(filepath, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Token', 'Name', 'Email', 'Profile', 'Start Date', 'End Date', 'Status'])
-        for client in clients:
-            writer.writerow(client)
-    
-    return filepath
-
-def export_to_excel(filename=None):
-    """Export all client data to an Excel file"""
-    if filename is None:
-        filename = f"netflix_clients_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
-    clients = get_all_clients()
-    
-    # Create directory if it doesn't exist
-    os.makedirs('exports', exist_ok=True)
-    filepath = os.path.join('exports', filename)
-    
-    # Convert to pandas DataFrame
-    df = pd.DataFrame(clients, columns=['Token', 'Name', 'Email', 'Profile', 'Start Date', 'End Date', 'Status'])
-    
-    # Export to Excel
-    df.to_excel(filepath, index=False)
-    
-    return filepath
+
+EXPORT_HEADERS = ['Token', 'Name', 'Email', 'Profile', 'Start Date', 'End Date', 'Status']
+SPOOL_MAX_BYTES = 8 * 1024 * 1024  # Bigger exports spill to an unnamed temp file
+
+class ExportBuffer(tempfile.SpooledTemporaryFile):
+    """Spooled buffer named after the exported document
+
+    A plain SpooledTemporaryFile has no usable name (None in memory, a file
+    descriptor once rolled over), which send_document can't handle.
+    """
+
+    def __init__(self, filename):
+        super().__init__(max_size=SPOOL_MAX_BYTES)
+        self._filename = filename
+
+    @property
+    def name(self):
+        return self._filename
+
+def _new_buffer(prefix, extension):
+    return ExportBuffer(f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}")
+
+def export_to_csv(rows, prefix="netflix_clients"):
+    """Write rows as CSV into a spooled buffer, rewound and ready to send
+
+    Usage:
+        with export_to_csv(database.iter_clients()) as document:
+            await outbox.reply_document(update, document=document)
+    """
+    buffer = _new_buffer(prefix, "csv")
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_HEADERS)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()  # Keep the buffer open once the wrapper goes away
+    buffer.seek(0)
+    return buffer
+
+def export_to_excel(rows, prefix="netflix_clients"):
+    """Write rows as an .xlsx workbook into a spooled buffer, rewound and ready to send
+
+    openpyxl's write-only mode streams rows out instead of keeping every cell in memory.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Clients")
+    sheet.append(EXPORT_HEADERS)
+    for row in rows:
+        sheet.append(list(row))
+
+    buffer = _new_buffer(prefix, "xlsx")
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
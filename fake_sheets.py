@@ -0,0 +1,314 @@
+# fake_sheets.py
+# In-process stand-in for the Google Sheets API, used by benchmark.py.
+#
+# FakeSheetsSession replaces the HTTP session under gspread, so the real
+# gspread Spreadsheet/Worksheet objects and the request governor of
+# googlesheet.py run unchanged while every request is answered from memory.
+# Latency and per-minute quotas can be configured to mimic the real API.
+import collections
+import re
+import threading
+import time
+from urllib.parse import unquote
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+SHEETS_URL = "https://sheets.googleapis.com/v4/spreadsheets/"
+DRIVE_URL = "https://www.googleapis.com/drive/v3/files/"
+
+class FakeResponse:
+    """Minimal requests.Response look-alike"""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return str(self._payload)
+
+    def json(self):
+        return self._payload
+
+class FakeSheet:
+    """One worksheet: its grid size and its values (lists of strings)"""
+
+    def __init__(self, sheet_id, title, rows, cols, index):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self.index = index
+        self.values = []
+
+    def properties(self):
+        return {
+            "sheetId": self.sheet_id,
+            "title": self.title,
+            "index": self.index,
+            "sheetType": "GRID",
+            "gridProperties": {"rowCount": self.row_count, "columnCount": self.col_count}
+        }
+
+class FakeSheetsSession:
+    """Session answering gspread's Sheets and Drive requests from memory
+
+    latency: seconds slept for every request (network round trip)
+    read_quota_per_minute / write_quota_per_minute: requests allowed in any
+        quota window before the fake answers 429, like the real API (None = unlimited)
+    quota_window: length of the quota window in seconds (60 for the real API)
+    """
+
+    def __init__(self, latency=0.0, read_quota_per_minute=None, write_quota_per_minute=None, quota_window=60):
+        self.latency = latency
+        self.quota_window = quota_window
+        self.quotas = {"read": read_quota_per_minute, "write": write_quota_per_minute}
+        self.headers = {}
+        self.sheets = collections.OrderedDict()
+        self.calls = collections.Counter()  # Requests served, by kind ("read"/"write") and endpoint
+        self.throttled = 0  # Requests answered with 429
+        self._windows = {"read": collections.deque(), "write": collections.deque()}
+        self._modified = 0
+        self._next_sheet_id = 1
+        self._lock = threading.Lock()
+
+    # --- Helpers for tests and benchmarks -------------------------------
+
+    def add_sheet(self, title, rows=100, cols=26):
+        """Create a worksheet directly, without going through the API"""
+        sheet = FakeSheet(self._next_sheet_id, title, rows, cols, len(self.sheets))
+        self._next_sheet_id += 1
+        self.sheets[title] = sheet
+        return sheet
+
+    def seed(self, title, rows):
+        """Fill a worksheet (header included) without counting API calls"""
+        sheet = self.sheets.get(title) or self.add_sheet(title)
+        sheet.values = [[str(v) for v in row] for row in rows]
+        sheet.row_count = max(sheet.row_count, len(sheet.values))
+        sheet.col_count = max([sheet.col_count] + [len(row) for row in sheet.values])
+        self._modified += 1
+        return sheet
+
+    def total_calls(self):
+        """Number of API requests served so far (throttled ones excluded)"""
+        return self.calls["read"] + self.calls["write"]
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.throttled = 0
+
+    # --- requests.Session interface -------------------------------------
+
+    def request(self, method, url, json=None, params=None, data=None, files=None, headers=None, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        kind = "read" if method.lower() == "get" else "write"
+        with self._lock:
+            if self._over_quota(kind):
+                self.throttled += 1
+                return self._error(429, "Quota exceeded for quota metric 'Requests' (fake)", "RESOURCE_EXHAUSTED")
+
+            try:
+                endpoint, payload = self._route(method.lower(), url, params or {}, json or {})
+            except KeyError as e:
+                return self._error(400, f"Unable to parse range: {e}", "INVALID_ARGUMENT")
+            except ValueError as e:
+                return self._error(400, str(e), "INVALID_ARGUMENT")
+
+            self.calls[kind] += 1
+            self.calls[endpoint] += 1
+            if kind == "write":
+                self._modified += 1
+            return FakeResponse(200, payload)
+
+    def close(self):
+        pass
+
+    # --- Internals ------------------------------------------------------
+
+    def _over_quota(self, kind):
+        quota = self.quotas[kind]
+        if quota is None:
+            return False
+        window = self._windows[kind]
+        now = time.monotonic()
+        while window and now - window[0] >= self.quota_window:
+            window.popleft()
+        if len(window) >= quota:
+            return True
+        window.append(now)
+        return False
+
+    def _error(self, code, message, status):
+        return FakeResponse(code, {"error": {"code": code, "message": message, "status": status}})
+
+    def _route(self, method, url, params, body):
+        if url.startswith(DRIVE_URL):
+            return "drive.get", {"id": url[len(DRIVE_URL):], "modifiedTime": self._modified_time()}
+
+        path = url[len(SHEETS_URL):]
+        spreadsheet_id, _, rest = path.partition("/")
+        if ":batchUpdate" in spreadsheet_id:
+            return "spreadsheets.batchUpdate", self._batch_update(spreadsheet_id.split(":")[0], body)
+        if not rest:
+            return "spreadsheets.get", self._metadata(spreadsheet_id)
+        if rest == "values:batchUpdate":
+            return "values.batchUpdate", self._values_batch_update(body)
+        if rest == "values:batchGet":
+            ranges = params.get("ranges", [])
+            if isinstance(ranges, str):
+                ranges = [ranges]
+            return "values.batchGet", {"valueRanges": [self._values_get(r, params) for r in ranges]}
+
+        range_name = unquote(rest[len("values/"):])
+        if range_name.endswith(":append"):
+            return "values.append", self._values_append(range_name[:-len(":append")], body)
+        if range_name.endswith(":clear"):
+            return "values.clear", self._values_clear(range_name[:-len(":clear")])
+        if method == "put":
+            return "values.update", self._values_update(range_name, body)
+        return "values.get", self._values_get(range_name, params)
+
+    def _modified_time(self):
+        # Any string that changes on every write is enough for the callers
+        return f"2025-01-01T00:00:00.{self._modified:06d}Z"
+
+    def _metadata(self, spreadsheet_id):
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "properties": {"title": "Netflix Clients DB (fake)", "locale": "en_US", "timeZone": "UTC"},
+            "sheets": [{"properties": sheet.properties()} for sheet in self.sheets.values()]
+        }
+
+    def _batch_update(self, spreadsheet_id, body):
+        replies = []
+        for request in body.get("requests", []):
+            if "addSheet" not in request:
+                raise ValueError(f"Unsupported batchUpdate request: {list(request)}")
+            props = request["addSheet"]["properties"]
+            if props["title"] in self.sheets:
+                raise ValueError(f"A sheet with the name \"{props['title']}\" already exists")
+            grid = props.get("gridProperties", {})
+            sheet = self.add_sheet(props["title"], grid.get("rowCount", 1000), grid.get("columnCount", 26))
+            replies.append({"addSheet": {"properties": sheet.properties()}})
+        return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+    def _parse_range(self, range_name):
+        """Split "'title'!A1:C" into (sheet, first row, first col, last row, last col), 1-based"""
+        title, _, a1 = range_name.partition("!")
+        title = title.strip("'").replace("''", "'")
+        sheet = self.sheets[title]  # KeyError -> 400 like the real API
+        if not a1:
+            return sheet, 1, 1, None, None
+
+        start, _, end = a1.partition(":")
+        row1, col1 = self._parse_cell(start)
+        if not end:
+            return sheet, row1 or 1, col1 or 1, row1 or None, col1 or None
+        row2, col2 = self._parse_cell(end)
+        return sheet, row1 or 1, col1 or 1, row2 or None, col2 or None
+
+    def _parse_cell(self, label):
+        match = re.fullmatch(r"([A-Za-z]*)(\d*)", label)
+        if not match:
+            raise ValueError(f"Unable to parse range: {label}")
+        letters, digits = match.groups()
+        row = int(digits) if digits else 0
+        col = a1_to_rowcol(f"{letters}1")[1] if letters else 0
+        return row, col
+
+    def _values_get(self, range_name, params):
+        sheet, row1, col1, row2, col2 = self._parse_range(range_name)
+        rows = sheet.values[row1 - 1:row2]
+        values = [row[col1 - 1:col2] for row in rows]
+
+        # The API trims trailing empty cells and rows
+        values = [self._trim(row) for row in values]
+        while values and not values[-1]:
+            values.pop()
+
+        if params.get("majorDimension") == "COLUMNS":
+            width = max((len(row) for row in values), default=0)
+            values = [[row[c] if c < len(row) else "" for row in values] for c in range(width)]
+            values = [self._trim(col) for col in values]
+
+        result = {"range": range_name, "majorDimension": params.get("majorDimension", "ROWS")}
+        if values:
+            result["values"] = values
+        return result
+
+    def _trim(self, row):
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        return row
+
+    def _write(self, sheet, row1, col1, values):
+        for i, row in enumerate(values):
+            r = row1 + i
+            if r > sheet.row_count or col1 + len(row) - 1 > sheet.col_count:
+                raise ValueError(f"Range ('{sheet.title}'!R{r}C{col1}) exceeds grid limits. "
+                                 f"Max rows: {sheet.row_count}, max columns: {sheet.col_count}")
+            while len(sheet.values) < r:
+                sheet.values.append([])
+            target = sheet.values[r - 1]
+            if len(target) < col1 - 1 + len(row):
+                target.extend([""] * (col1 - 1 + len(row) - len(target)))
+            for j, value in enumerate(row):
+                target[col1 - 1 + j] = "" if value is None else str(value)
+
+    def _values_update(self, range_name, body):
+        sheet, row1, col1, _, _ = self._parse_range(range_name)
+        values = body.get("values", [])
+        self._write(sheet, row1, col1, values)
+        return {"updatedRange": range_name, "updatedRows": len(values)}
+
+    def _values_batch_update(self, body):
+        responses = [self._values_update(item["range"], item) for item in body.get("data", [])]
+        return {"totalUpdatedRows": sum(r["updatedRows"] for r in responses), "responses": responses}
+
+    def _values_append(self, range_name, body):
+        sheet, _, _, _, _ = self._parse_range(range_name)
+        values = body.get("values", [])
+        # Append after the last non-empty row and grow the grid as needed
+        last = len(sheet.values)
+        while last and not any(sheet.values[last - 1]):
+            last -= 1
+        sheet.row_count = max(sheet.row_count, last + len(values))
+        sheet.col_count = max([sheet.col_count] + [len(row) for row in values])
+        del sheet.values[last:]
+        self._write(sheet, last + 1, 1, values)
+        return {"updates": {"updatedRange": f"'{sheet.title}'!A{last + 1}", "updatedRows": len(values)}}
+
+    def _values_clear(self, range_name):
+        sheet, _, _, _, _ = self._parse_range(range_name)
+        sheet.values = []
+        return {"clearedRange": range_name}
+
+def install(googlesheet, session=None):
+    """Point the googlesheet module at a fake spreadsheet and reset its caches
+
+    The real gspread client classes are used, with googlesheet's governed
+    HTTP client on top of the fake session. Returns the session.
+    """
+    if session is None:
+        session = FakeSheetsSession()
+
+    client = gspread.Client(None, session=session, http_client=googlesheet._GovernedHTTPClient)
+    googlesheet._client = client
+    googlesheet._spreadsheet = client.open_by_key(googlesheet.SPREADSHEET_ID or "fake-spreadsheet")
+
+    googlesheet._worksheets.clear()
+    googlesheet._column_maps.clear()
+    googlesheet.reset_token_index()
+    with googlesheet._log_lock:
+        googlesheet._log_buffer.clear()
+        googlesheet._log_next_id = None
+    return session
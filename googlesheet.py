@@ -1,10 +1,20 @@
 # googlesheet.py
 import os
 import gspread
+from gspread.utils import rowcol_to_a1, ValueInputOption
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from typing import List, Tuple, Optional
 import json
 import sys
+import atexit
+import bisect
+import functools
+import heapq
+import random
+import re
+import threading
+import time
 
 # Google Sheets configuration
 SPREADSHEET_NAME = "Netflix Clients DB"
@@ -17,6 +27,39 @@ SPREADSHEET_ID = "1a5Pls1g1D_dJ4LGH1uAepUyfZBrZ3yNEtcXs_GCfDsg"  # ID de votre s
 CLIENTS_SHEET = "clients"
 BURNED_SHEET = "burned_tokens"
 OPERATIONS_SHEET = "operations_log"
+META_SHEET = "_meta"  # A1:B1 = "schema_version", version number (see SHEETS_MIGRATIONS)
+
+# Header row of each data sheet
+SHEET_HEADERS = {
+    CLIENTS_SHEET: ["id", "token", "name", "email", "profile", "start_date", "end_date", "status", "payment_amount", "is_burned", "burn_reason", "burn_date"],
+    BURNED_SHEET: ["id", "token", "burn_reason", "burn_date", "client_id"],
+    OPERATIONS_SHEET: ["id", "timestamp", "operation_type", "token", "details", "amount", "client_id"],
+}
+
+# Operations log write-behind queue
+LOG_FLUSH_INTERVAL = 5  # Seconds between background flushes
+LOG_FLUSH_BATCH_SIZE = 20  # Flush early once this many entries are waiting
+
+# Request governor for every Google Sheets API call
+# Default Sheets quotas are 60 read and 60 write requests per minute per user
+READ_REQUESTS_PER_MINUTE = 60
+WRITE_REQUESTS_PER_MINUTE = 60
+QUOTA_WINDOW_SECONDS = 60  # The quotas count requests over any sliding minute
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+# A request that is not idempotent (values:append, spreadsheet batchUpdate)
+# may have been applied before a timeout or 5xx answer, so only the 429s
+# (rejected before running) are retried for it
+NON_IDEMPOTENT_RETRY_STATUS_CODES = (429,)
+IDEMPOTENT_POST_SUFFIXES = ("values:batchUpdate", "values:batchClear", ":clear")
+MAX_RETRIES = 5
+BACKOFF_BASE = 1  # Seconds before the first retry, doubled on each attempt
+BACKOFF_MAX = 32  # Upper bound for a single backoff wait
+COMMAND_BUDGET_SECONDS = 45  # Longest a single command may spend waiting on quota
+
+# Incremental sync of the clients sheet replica
+SYNC_MIN_INTERVAL = 2  # Seconds during which reads reuse the replica without any request
+SYNC_FULL_REFRESH_SECONDS = 600  # Full re-read picking up manual edits of existing rows
+SYNC_ATTEMPTS = 3  # Syncs redone because the replica changed meanwhile, before one under the lock
 
 # Define the service account file
 SERVICE_ACCOUNT_FILE = 'bot-netflix.json'
@@ -25,6 +68,183 @@ SERVICE_ACCOUNT_FILE = 'bot-netflix.json'
 _client = None
 _spreadsheet = None
 
+# Storage calls may run on several threads (see async_storage.py): appends
+# (id allocation) and replica changes are serialized, plain reads run in
+# parallel. Syncs read the sheet without the lock and take it to apply.
+_write_lock = threading.RLock()
+
+# Cell updates of different clients run in parallel; updates of one client are
+# serialized by the stripe its token hashes to
+ROW_LOCK_STRIPES = 64
+_row_locks = [threading.Lock() for _ in range(ROW_LOCK_STRIPES)]
+_burned_lock = threading.Lock()  # Allocates burned_tokens ids
+
+# Lock order: row lock, _burned_lock, _log_flush_lock, _write_lock, _log_lock.
+# A thread holding one of them only takes those after it; _log_lock is the
+# innermost and nothing under it talks to the sheet.
+
+# Schema cache: worksheet handles and header -> column index maps, resolved once per sheet
+_worksheets = {}
+_column_maps = {}
+
+# Local replica of the clients sheet: every data row in sheet order, plus the
+# token index (token -> (row number, row values)) sharing the same row lists.
+# Kept current by every write in this module and synced by _sync_clients
+_clients_rows = None
+_token_index = None
+_client_names = None  # client id -> name, for the operations log
+_max_client_id = 0  # Highest numeric id in the replica; add_client allocates the next one
+_clients_synced_at = 0  # time.monotonic() of the last sync check
+_clients_loaded_at = 0  # time.monotonic() of the last full read
+_clients_modified_time = None  # Spreadsheet modifiedTime seen at the last sync
+_clients_generation = 0  # Bumped by every change of the replica; a sync started before a change is redone
+_drive_check_enabled = True  # Cleared if the Drive API refuses the modifiedTime lookup
+_burned_row_count = None  # Number of data rows in the burned tokens sheet
+
+# /stats aggregates over the replica, updated row by row as the replica changes
+# (_count_client_row), so get_stats never walks or parses the rows
+_stats_counts = {"total": 0, "paid": 0, "unpaid": 0, "burned": 0}
+_end_dates = []  # Sorted end dates as "%Y-%m-%d %H:%M:%S" strings; expired = bisect of now
+_END_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")  # Already in sortable form
+
+# /search index over the replica: the lowercased searchable fields of each
+# row (by position in _clients_rows) and trigram -> positions containing it.
+# Built by search_clients itself, which indexes the rows appended since the
+# last search. A full load keeps the entries of the rows it reads back
+# unchanged and drops the others (from the first changed row on); the bot
+# never rewrites searchable fields in place.
+SEARCH_FIELDS = ("token", "name", "email", "profile")
+SEARCH_LIMIT = 50  # Best matches returned by search_clients
+SEARCH_RANK_MAX_MATCHES = 1000  # Broader queries skip the ranking
+_search_texts = []
+_trigram_rows = defaultdict(list)
+
+# Buffered operations log entries waiting to be appended by the flusher thread
+_log_buffer = []
+_log_next_id = None  # Next operation id, allocated locally
+_log_lock = threading.Lock()  # Guards _log_buffer and _log_next_id
+_log_flush_lock = threading.Lock()  # Only one flush talks to the sheet at a time
+_log_wakeup = threading.Event()
+_log_stopping = False
+_log_thread = None
+
+class SheetsQuotaError(Exception):
+    """Raised when a command would exceed its time budget waiting for Sheets quota"""
+
+class _RequestWindow:
+    """Sliding-window limiter: at most per_minute requests in any QUOTA_WINDOW_SECONDS
+    
+    A token bucket holding a full minute of tokens lets up to twice the quota
+    through in 60 s (the burst, then the refill), so each request gets a send
+    time instead, as soon as fewer than per_minute requests fall in the
+    window before it. Send times are handed out in order: callers queue
+    behind each other instead of failing.
+    """
+    
+    def __init__(self, per_minute):
+        self.limit = per_minute
+        self.slots = deque()  # Send times (time.monotonic()) within the last window, ascending
+        self.lock = threading.Lock()
+    
+    def reserve(self):
+        """Book the next send time and return it"""
+        with self.lock:
+            now = time.monotonic()
+            while self.slots and self.slots[0] <= now - QUOTA_WINDOW_SECONDS:
+                self.slots.popleft()
+            slot = max(now, self.slots[-1]) if self.slots else now
+            if len(self.slots) >= self.limit:
+                slot = max(slot, self.slots[-self.limit] + QUOTA_WINDOW_SECONDS)
+            self.slots.append(slot)
+            return slot
+    
+    def refund(self, slot):
+        """Give back a send time booked by a request that will not be sent"""
+        with self.lock:
+            try:
+                self.slots.remove(slot)
+            except ValueError:
+                pass  # Already out of the window
+
+_read_window = _RequestWindow(READ_REQUESTS_PER_MINUTE)
+_write_window = _RequestWindow(WRITE_REQUESTS_PER_MINUTE)
+
+# Deadline of the command running on the current thread (None outside commands)
+_budget = threading.local()
+
+def _governed(func):
+    """Give a public function a COMMAND_BUDGET_SECONDS budget for quota waits
+    
+    Nested calls share the budget of the outermost one.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_budget, "deadline", None) is not None:
+            return func(*args, **kwargs)
+        _budget.deadline = time.monotonic() + COMMAND_BUDGET_SECONDS
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _budget.deadline = None
+    return wrapper
+
+def _row_serialized(func):
+    """Run a function whose first argument is a token while holding that token's row lock"""
+    @functools.wraps(func)
+    def wrapper(token, *args, **kwargs):
+        with _row_locks[hash(token) % ROW_LOCK_STRIPES]:
+            return func(token, *args, **kwargs)
+    return wrapper
+
+def _governor_sleep(seconds):
+    """Sleep for a quota or backoff wait, unless it would overrun the command budget"""
+    if seconds <= 0:
+        return
+    deadline = getattr(_budget, "deadline", None)
+    if deadline is not None and time.monotonic() + seconds > deadline:
+        raise SheetsQuotaError("Google Sheets is busy (quota exceeded), please try again in a minute")
+    time.sleep(seconds)
+
+def _is_idempotent(method, endpoint):
+    """Tell whether sending a request twice leaves the sheet as sending it once"""
+    method = method.lower()
+    if method in ("get", "put", "delete"):
+        return True
+    return method == "post" and endpoint.endswith(IDEMPOTENT_POST_SUFFIXES)
+
+class _GovernedHTTPClient(gspread.http_client.HTTPClient):
+    """gspread HTTP client that sends every request through the request governor
+    
+    Requests wait for a send time from the read (GET) or write window, and 429/5xx
+    answers are retried with exponential backoff and jitter (only 429s for
+    requests that could be applied twice).
+    """
+    
+    def request(self, method, endpoint, *args, **kwargs):
+        window = _read_window if method.lower() == "get" else _write_window
+        retry_codes = RETRY_STATUS_CODES if _is_idempotent(method, endpoint) else NON_IDEMPOTENT_RETRY_STATUS_CODES
+        attempt = 0
+        while True:
+            slot = window.reserve()
+            try:
+                _governor_sleep(slot - time.monotonic())
+            except SheetsQuotaError:
+                window.refund(slot)
+                raise
+            
+            try:
+                return super().request(method, endpoint, *args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                if e.code not in retry_codes or attempt >= MAX_RETRIES:
+                    raise
+                
+                # Exponential backoff with jitter (half fixed, half random)
+                backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                delay = backoff / 2 + random.uniform(0, backoff / 2)
+                attempt += 1
+                print(f"Google Sheets returned {e.code}, retrying in {delay:.1f}s (attempt {attempt}/{MAX_RETRIES})")
+                _governor_sleep(delay)
+
 def _connect():
     """Connect to Google Sheets API"""
     global _client, _spreadsheet
@@ -40,7 +260,7 @@ def _connect():
             # Check if service account file exists
             if os.path.exists(SERVICE_ACCOUNT_FILE):
                 # Use the service account file directly
-                _client = gspread.service_account(filename=SERVICE_ACCOUNT_FILE)
+                _client = gspread.service_account(filename=SERVICE_ACCOUNT_FILE, http_client=_GovernedHTTPClient)
                 print(f"Authentication successful using service account: {SERVICE_ACCOUNT_FILE}")
             else:
                 print(f"Service account file {SERVICE_ACCOUNT_FILE} not found.")
@@ -91,49 +311,123 @@ def _get_sheet(sheet_name):
     if _spreadsheet is None:
         _connect()
     
+    # Reuse the handle resolved earlier instead of fetching sheet metadata again
+    worksheet = _worksheets.get(sheet_name)
+    if worksheet is not None:
+        return worksheet
+    
+    with _write_lock:
+        if sheet_name not in _worksheets:
+            _worksheets[sheet_name] = _open_or_create_sheet(sheet_name)
+    return _worksheets[sheet_name]
+
+def _open_or_create_sheet(sheet_name):
+    """Fetch a worksheet by name, creating it with its headers if it doesn't exist"""
     try:
         # Try to get the existing sheet
         worksheet = _spreadsheet.worksheet(sheet_name)
-        return worksheet
     except gspread.WorksheetNotFound:
         # Sheet doesn't exist, create it based on the sheet name
         if sheet_name == CLIENTS_SHEET:
             print(f"Creating sheet {CLIENTS_SHEET}...")
             worksheet = _spreadsheet.add_worksheet(title=CLIENTS_SHEET, rows=100, cols=12)
-            headers = ["id", "token", "name", "email", "profile", "start_date", "end_date", "status", "payment_amount", "is_burned", "burn_reason", "burn_date"]
-            worksheet.append_row(headers)
+            worksheet.append_row(SHEET_HEADERS[CLIENTS_SHEET])
             print(f"Sheet {CLIENTS_SHEET} created successfully.")
         elif sheet_name == BURNED_SHEET:
             print(f"Creating sheet {BURNED_SHEET}...")
             worksheet = _spreadsheet.add_worksheet(title=BURNED_SHEET, rows=100, cols=5)
-            headers = ["id", "token", "burn_reason", "burn_date", "client_id"]
-            worksheet.append_row(headers)
+            worksheet.append_row(SHEET_HEADERS[BURNED_SHEET])
             print(f"Sheet {BURNED_SHEET} created successfully.")
         elif sheet_name == OPERATIONS_SHEET:
             print(f"Creating sheet {OPERATIONS_SHEET}...")
             worksheet = _spreadsheet.add_worksheet(title=OPERATIONS_SHEET, rows=1000, cols=10)
-            headers = ["id", "timestamp", "operation_type", "token", "details", "amount", "client_id"]
-            worksheet.append_row(headers)
+            worksheet.append_row(SHEET_HEADERS[OPERATIONS_SHEET])
             print(f"Sheet {OPERATIONS_SHEET} created successfully.")
         else:
             # Generic sheet creation
             worksheet = _spreadsheet.add_worksheet(title=sheet_name, rows=100, cols=10)
             print(f"Generic sheet {sheet_name} created.")
-        
-        return worksheet
+    
+    return worksheet
+
+def _cache_headers(sheet_name, headers):
+    """Store the header -> column index map of a sheet"""
+    columns = {}
+    for i, header in enumerate(headers):
+        columns.setdefault(header, i)  # First occurrence wins, like list.index
+    _column_maps[sheet_name] = columns
+    return columns
+
+def _verify_headers(sheet, sheet_name, default_headers):
+    """Check the header row once per sheet, adding the default headers if it is empty"""
+    if sheet_name in _column_maps:
+        return
+    
+    with _write_lock:
+        if sheet_name not in _column_maps:
+            _check_header_row(sheet, sheet_name, default_headers)
+
+def _check_header_row(sheet, sheet_name, default_headers):
+    """Read the header row of a sheet, adding the default headers if it is empty"""
+    headers = sheet.row_values(1)
+    if not headers or len(headers) < 3:  # Check that there are at least some headers
+        print(f"Sheet {sheet_name} exists but has no headers. Adding headers...")
+        headers = list(default_headers)
+        sheet.clear()
+        sheet.append_row(headers)
+        print("Headers added successfully.")
+    
+    _cache_headers(sheet_name, headers)
+
+def _get_columns(sheet_name):
+    """Return the cached header -> column index map (0-based) of a sheet"""
+    if sheet_name not in _column_maps:
+        if sheet_name == CLIENTS_SHEET:
+            _get_clients_sheet()
+        elif sheet_name == BURNED_SHEET:
+            _get_burned_sheet()
+        elif sheet_name == OPERATIONS_SHEET:
+            _get_operations_sheet()
+        else:
+            _cache_headers(sheet_name, _get_sheet(sheet_name).row_values(1))
+    return _column_maps[sheet_name]
+
+def _invalidate_schema(sheet_name):
+    """Forget the cached handle and headers of a sheet so they are resolved again"""
+    global _burned_row_count
+    with _write_lock:
+        _worksheets.pop(sheet_name, None)
+        _column_maps.pop(sheet_name, None)
+        if sheet_name == CLIENTS_SHEET:
+            # Row numbers may have moved too
+            reset_token_index()
+        elif sheet_name == BURNED_SHEET:
+            _burned_row_count = None
+
+def _is_layout_error(error):
+    """Tell whether a failed write points at a stale sheet layout"""
+    if isinstance(error, KeyError):
+        return True  # A column we expected is missing from the cached headers
+    # 400 covers ranges outside the grid and sheets that were renamed or deleted
+    return isinstance(error, gspread.exceptions.APIError) and error.code == 400
+
+def _write_with_schema_retry(sheet_name, write):
+    """Run a write; if it fails on a layout mismatch, reload the schema and retry once"""
+    try:
+        return write()
+    except (KeyError, gspread.exceptions.APIError) as e:
+        if not _is_layout_error(e):
+            raise
+        print(f"Layout of sheet {sheet_name} changed ({e}), reloading schema...")
+        _invalidate_schema(sheet_name)
+        return write()
 
 def _get_clients_sheet():
     """Get or create the clients worksheet"""
     clients_sheet = _get_sheet(CLIENTS_SHEET)
     
-    # Verify headers
-    headers = clients_sheet.row_values(1)
-    if not headers or len(headers) < 3:  # Check that there are at least some headers
-        print(f"Sheet {CLIENTS_SHEET} exists but has no headers. Adding headers...")
-        headers = ["id", "token", "name", "email", "profile", "start_date", "end_date", "status", "payment_amount", "is_burned", "burn_reason", "burn_date"]
-        clients_sheet.clear()
-        clients_sheet.append_row(headers)
-        print("Headers added successfully.")
+    # Verify headers (only the first time)
+    _verify_headers(clients_sheet, CLIENTS_SHEET, SHEET_HEADERS[CLIENTS_SHEET])
     
     return clients_sheet
 
@@ -141,21 +435,79 @@ def _get_burned_sheet():
     """Get or create the burned tokens worksheet"""
     burned_sheet = _get_sheet(BURNED_SHEET)
     
-    # Verify headers
-    headers = burned_sheet.row_values(1)
-    if not headers or len(headers) < 3:  # Check that there are at least some headers
-        print(f"Sheet {BURNED_SHEET} exists but has no headers. Adding headers...")
-        headers = ["id", "token", "burn_reason", "burn_date", "client_id"]
-        burned_sheet.clear()
-        burned_sheet.append_row(headers)
-        print("Headers added successfully.")
+    # Verify headers (only the first time)
+    _verify_headers(burned_sheet, BURNED_SHEET, SHEET_HEADERS[BURNED_SHEET])
     
     return burned_sheet
 
+# --- Schema migrations --------------------------------------------------
+# The schema version is stored in the META_SHEET cell B1. init_db reads it
+# together with every header row and runs only the migrations above it,
+# recording the new version after each one. Append new migrations to
+# SHEETS_MIGRATIONS, never edit a released one; spreadsheets from before
+# versioning have no META_SHEET and start at version 0.
+
+def _sheets_migration_1_data_sheets():
+    """clients, burned_tokens and operations_log with their header rows"""
+    for sheet_name, headers in SHEET_HEADERS.items():
+        # Creates missing sheets with their headers, fills in empty header rows
+        _check_header_row(_get_sheet(sheet_name), sheet_name, headers)
+
+SHEETS_MIGRATIONS = [
+    _sheets_migration_1_data_sheets,
+]
+SHEETS_SCHEMA_VERSION = len(SHEETS_MIGRATIONS)
+
+def _load_schema():
+    """Resolve the worksheets and read the schema version and header rows
+    
+    One metadata request for every worksheet handle and one batchGet for the
+    version cell and all header rows. Headers are cached only if the schema
+    is current (migrations may still change them). Returns the version.
+    """
+    worksheets = {worksheet.title: worksheet for worksheet in _spreadsheet.worksheets()}
+    if META_SHEET not in worksheets:
+        return 0
+    
+    sheet_names = [name for name in SHEET_HEADERS if name in worksheets]
+    ranges = [f"'{META_SHEET}'!A1:B1"] + [f"'{name}'!1:1" for name in sheet_names]
+    value_ranges = _spreadsheet.values_batch_get(ranges)["valueRanges"]
+    meta = value_ranges[0].get("values", [[]])[0]
+    version = int(meta[1]) if len(meta) > 1 and meta[1].isdigit() else 0
+    
+    with _write_lock:
+        for name, worksheet in worksheets.items():
+            _worksheets.setdefault(name, worksheet)
+        if version == SHEETS_SCHEMA_VERSION:
+            for name, value_range in zip(sheet_names, value_ranges[1:]):
+                headers = value_range.get("values", [[]])[0]
+                if len(headers) >= 3:  # Otherwise _verify_headers repairs the row later
+                    _cache_headers(name, headers)
+    return version
+
+def _migrate_sheets(version):
+    """Run the migrations above version, recording each one in META_SHEET"""
+    meta_sheet = _get_sheet(META_SHEET)
+    for number, migration in enumerate(SHEETS_MIGRATIONS[version:], start=version + 1):
+        print(f"Migrating Google Sheets schema to version {number}: {migration.__doc__}")
+        migration()
+        meta_sheet.update(values=[["schema_version", str(number)]], range_name="A1:B1")
+
+@_governed
 def init_db():
-    """Initialize the database (create spreadsheet and worksheets if needed)"""
+    """Initialize the database (create spreadsheet and worksheets if needed)
+    
+    An up to date spreadsheet costs one metadata and one values request.
+    """
     try:
         _connect()
+        version = _load_schema()
+        if version > SHEETS_SCHEMA_VERSION:
+            print(f"Spreadsheet schema version {version} is newer than this bot ({SHEETS_SCHEMA_VERSION}), not migrating")
+        elif version < SHEETS_SCHEMA_VERSION:
+            _migrate_sheets(version)
+        
+        # No requests once _load_schema or the migrations cached the headers
         _get_clients_sheet()
         _get_burned_sheet()
         _get_operations_sheet()  # Initialize operations log sheet
@@ -170,29 +522,460 @@ def init_db():
         print("   db-netflix@bot-netflix-473417-473511.iam.gserviceaccount.com\n")
         raise
 
-def _find_row_by_token(token):
-    """Find a row by token and return row number and data"""
-    sheet = _get_clients_sheet()
-    all_values = sheet.get_all_values()
+def _load_clients():
+    """Re-read the whole clients sheet and rebuild the replica and the token index"""
+    return _sync_clients(force=True, full=True)
+
+def _apply_clients(all_values):
+    """Rebuild the replica from a full read of the clients sheet (caller holds _write_lock)"""
+    global _clients_rows, _token_index, _client_names, _clients_loaded_at, _max_client_id
+    _replica_changed()
     headers = all_values[0]
     
-    # Find token column index
-    token_idx = headers.index("token")
+    # The full read gives us fresh headers for free
+    _cache_headers(CLIENTS_SHEET, headers)
+    
+    _clients_rows = []
+    _token_index = {}
+    _client_names = {}
+    _max_client_id = 0
+    _reset_stats()
+    _add_replica_rows(all_values[1:])
+    _truncate_search_index(_unchanged_search_prefix())
+    _clients_loaded_at = time.monotonic()
+    return _clients_rows
+
+def _add_replica_rows(rows):
+    """Append rows read from (or written to) the sheet to the replica and index their tokens"""
+    global _max_client_id
+    _replica_changed()
+    columns = _column_maps[CLIENTS_SHEET]
+    token_idx = columns["token"]
+    id_idx = columns["id"]
+    name_idx = columns["name"]
+    width = max(columns.values()) + 1
+    
+    new_end_dates = []
+    for row in rows:
+        if len(row) < width:
+            # The API trims trailing empty cells; pad so every column can be indexed
+            row.extend([""] * (width - len(row)))
+        _clients_rows.append(row)
+        _count_client_row(row, 1, new_end_dates)
+        if row[token_idx]:
+            # Keep the first occurrence, like the old linear scan did
+            # len + 1 because row 1 is the header
+            _token_index.setdefault(row[token_idx], (len(_clients_rows) + 1, row))
+        _client_names[row[id_idx]] = row[name_idx]
+        if row[id_idx].isdigit():
+            _max_client_id = max(_max_client_id, int(row[id_idx]))
+    
+    # One sort for a whole load instead of an insort per row
+    _end_dates.extend(new_end_dates)
+    _end_dates.sort()
+
+def _get_modified_time():
+    """Last modification time of the spreadsheet (Drive API), or None if unavailable"""
+    global _drive_check_enabled
+    if not _drive_check_enabled:
+        return None
+    try:
+        return _spreadsheet.get_lastUpdateTime()
+    except gspread.exceptions.APIError as e:
+        # Drive API not enabled for the project: every sync checks the sheet itself
+        print(f"Cannot read the spreadsheet modification time ({e}), syncing without it")
+        _drive_check_enabled = False
+        return None
+
+def _sync_clients(force=False, full=False):
+    """Bring the clients replica up to date with as few requests as possible
+    
+    - less than SYNC_MIN_INTERVAL since the last check: no request (unless force)
+    - spreadsheet unchanged (Drive modifiedTime): one small request
+    - otherwise: one batchGet for the appended rows and the token column,
+      and a full read only if existing rows were deleted or moved (or full)
+    Manual edits of other cells are picked up by the full read done every
+    SYNC_FULL_REFRESH_SECONDS, or by _find_row_by_token for the row it
+    looks up. Returns the replica rows.
+    
+    The requests run without _write_lock, so lookups and writes of other
+    clients go on meanwhile; the lock is only taken to read the replica
+    state and to apply the result. If the replica changed in between
+    (_clients_generation moved), the reads are thrown away and done again,
+    the last attempt holding the lock throughout.
+    """
+    rows = None
+    for _ in range(SYNC_ATTEMPTS - 1):
+        rows, full = _sync_attempt(force, full)
+        if rows is not None:
+            return rows
+    # Writers kept changing the replica: make them wait this time
+    with _write_lock:
+        while rows is None:
+            rows, full = _sync_attempt(force, full)
+        return rows
+
+def _sync_attempt(force, full):
+    """One try of _sync_clients: (replica rows, full) or (None, full) to try again"""
+    global _clients_synced_at, _clients_modified_time
+    now = time.monotonic()
+    with _write_lock:
+        if _clients_rows is not None and not force and now - _clients_synced_at < SYNC_MIN_INTERVAL:
+            return _clients_rows, full
+        generation = _clients_generation
+        full = full or _clients_rows is None or now - _clients_loaded_at >= SYNC_FULL_REFRESH_SECONDS
+        known_modified = _clients_modified_time
+        known_rows = 0 if full else len(_clients_rows)
+    
+    sheet = _get_clients_sheet()  # Connects on first use
+    # Read the modification time before the data so a concurrent edit is seen next time
+    modified = _get_modified_time()
+    all_values = tail = None
+    if full:
+        all_values = sheet.get_all_values()
+    elif modified is None or modified != known_modified:
+        tail = _fetch_clients_tail(sheet, known_rows)
+        if tail is None:
+            return None, True
+    
+    with _write_lock:
+        if _clients_generation != generation:
+            if not force and _clients_synced_at >= now:
+                return _clients_rows, full  # Another thread synced meanwhile
+            return None, full
+        if all_values is not None:
+            _apply_clients(all_values)
+        elif tail is not None and not _apply_clients_tail(*tail):
+            print(f"Rows of sheet {CLIENTS_SHEET} were moved or deleted, reloading it...")
+            return None, True
+        _clients_modified_time = modified
+        _clients_synced_at = now
+        return _clients_rows, full
+
+def _fetch_clients_tail(sheet, known_rows):
+    """Read the rows after the known_rows replica rows and the token column of the sheet
+    
+    Returns (tail, tokens), or None if the layout changed and a full read is needed.
+    """
+    token_idx = _get_columns(CLIENTS_SHEET)["token"]
+    token_col = rowcol_to_a1(1, token_idx + 1)[:-1]  # Column letter
+    last_col = rowcol_to_a1(1, sheet.col_count)[:-1]
+    first_new_row = known_rows + 2  # +1 for the header, +1 for the next row
+    
+    try:
+        return sheet.batch_get([f"A{first_new_row}:{last_col}", f"{token_col}2:{token_col}"])
+    except gspread.exceptions.APIError as e:
+        if not _is_layout_error(e):
+            raise
+        # The grid shrank below our row count or the sheet moved: start over
+        _invalidate_schema(CLIENTS_SHEET)
+        return None
+
+def _apply_clients_tail(tail, tokens):
+    """Add the fetched tail to the replica (caller holds _write_lock)
+    
+    Returns False if the token column no longer matches the replica.
+    """
+    if tail:
+        _add_replica_rows([list(row) for row in tail])
+    
+    # Rows deleted, inserted or sorted by hand shift the row numbers of the index
+    token_idx = _column_maps[CLIENTS_SHEET]["token"]
+    sheet_tokens = [row[0] if row else "" for row in tokens]
+    cached_tokens = [row[token_idx] for row in _clients_rows]
+    while cached_tokens and not cached_tokens[-1]:
+        cached_tokens.pop()  # The API trims trailing empty cells
+    return sheet_tokens == cached_tokens
+
+def _replica_rows():
+    """The replica rows, for a caller holding _write_lock after _sync_clients
+    
+    Synced again (under the lock) only if the replica was dropped meanwhile.
+    """
+    return _clients_rows if _clients_rows is not None else _sync_clients()
+
+def _get_client_rows():
+    """Return a synced snapshot of the clients replica for list reads"""
+    _sync_clients()
+    with _write_lock:
+        return list(_replica_rows())
+
+def _get_token_index():
+    """Return the token index, loading it on first use"""
+    index = _token_index
+    if index is None:
+        _sync_clients()
+        with _write_lock:
+            _replica_rows()
+            index = _token_index
+    return index
+
+def reset_token_index():
+    """Drop the clients replica, the token index and row counters so the next use reloads them"""
+    global _clients_rows, _token_index, _client_names, _clients_modified_time, _burned_row_count, _max_client_id
+    _replica_changed()
+    _clients_rows = None
+    _token_index = None
+    _client_names = None
+    _max_client_id = 0
+    _clients_modified_time = None
+    _burned_row_count = None
+    _reset_stats()
+    _reset_search_index()
+
+def _replica_changed():
+    """Redo the syncs that read the sheet before this change (caller holds _write_lock)"""
+    global _clients_generation
+    _clients_generation += 1
+
+def _reset_stats():
+    for key in _stats_counts:
+        _stats_counts[key] = 0
+    del _end_dates[:]
+
+def _reset_search_index():
+    del _search_texts[:]
+    _trigram_rows.clear()
+
+def _search_text(row, fields):
+    # \x00 between fields so a match never spans two of them
+    return "\x00".join([row[i] for i in fields]).lower()
+
+def _unchanged_search_prefix():
+    """Number of leading indexed rows whose searchable fields match the replica"""
+    columns = _column_maps[CLIENTS_SHEET]
+    fields = [columns[name] for name in SEARCH_FIELDS]
+    limit = min(len(_search_texts), len(_clients_rows))
+    position = 0
+    while position < limit and _search_text(_clients_rows[position], fields) == _search_texts[position]:
+        position += 1
+    return position
+
+def _truncate_search_index(length):
+    """Drop the /search index entries of the rows from position length on
+    
+    They are indexed again by the next search. Positions are appended in
+    order, so each posting list is cut at one point.
+    """
+    if length >= len(_search_texts):
+        return
+    if length == 0:
+        _reset_search_index()
+        return
+    del _search_texts[length:]
+    for trigram, positions in list(_trigram_rows.items()):
+        cut = bisect.bisect_left(positions, length)
+        if cut == 0:
+            del _trigram_rows[trigram]
+        else:
+            del positions[cut:]
+
+def _update_search_index():
+    """Index the replica rows not in the /search index yet (caller holds _write_lock)"""
+    columns = _get_columns(CLIENTS_SHEET)
+    fields = [columns[name] for name in SEARCH_FIELDS]
+    for position in range(len(_search_texts), len(_clients_rows)):
+        text = _search_text(_clients_rows[position], fields)
+        _search_texts.append(text)
+        for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+            _trigram_rows[trigram].append(position)
+
+def _end_date_key(value):
+    """End date as a sortable "%Y-%m-%d %H:%M:%S" string, or None if it can't be parsed"""
+    if _END_DATE_RE.fullmatch(value):
+        return value
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+
+def _count_client_row(row, sign, new_end_dates=None):
+    """Add (sign=1) or remove (sign=-1) one replica row from the /stats aggregates
+    
+    Called with _write_lock held, before and after a cached row changes.
+    Rows added in bulk collect their end date in new_end_dates instead, for
+    the caller to sort in once.
+    """
+    columns = _column_maps[CLIENTS_SHEET]
+    status = row[columns["status"]]
+    _stats_counts["total"] += sign
+    if status == "Paid":
+        _stats_counts["paid"] += sign
+    elif status == "Unpaid":
+        _stats_counts["unpaid"] += sign
+    if row[columns["is_burned"]] == "1":
+        _stats_counts["burned"] += sign
+    
+    end = _end_date_key(row[columns["end_date"]])
+    if end is None:
+        return
+    if new_end_dates is not None:
+        new_end_dates.append(end)
+    elif sign > 0:
+        bisect.insort(_end_dates, end)
+    else:
+        i = bisect.bisect_left(_end_dates, end)
+        if i < len(_end_dates) and _end_dates[i] == end:
+            del _end_dates[i]
+
+def _set_cached_value(row, idx, value):
+    """Update a cached row in place, padding it if the sheet returned a short row"""
+    if idx >= len(row):
+        row.extend([""] * (idx + 1 - len(row)))
+    row[idx] = value
+
+def _update_client_cells(token, changes):
+    """Write several cells of one client row in a single batch_update request
+    
+    changes maps column names to their new values. The cached row is only
+    updated once the write has succeeded. Returns False if the token is gone.
+    The caller holds the row lock of the token.
+    
+    Rows deleted, inserted or sorted by hand shift the row numbers of the
+    replica, so the token cell of the target row is read back first and the
+    replica reloaded if it holds another token: a write never lands in
+    another client's row.
+    """
+    def write():
+        row_num, row_data = _find_row_by_token(token)
+        if row_num is None:
+            return False
+        
+        sheet = _get_clients_sheet()
+        columns = _get_columns(CLIENTS_SHEET)
+        if sheet.acell(rowcol_to_a1(row_num, columns["token"] + 1)).value != token:
+            print(f"Row {row_num} of sheet {CLIENTS_SHEET} no longer holds token {token}, reloading it...")
+            _load_clients()
+            row_num, row_data = _get_token_index().get(token, (None, None))
+            if row_num is None:
+                return False
+            columns = _get_columns(CLIENTS_SHEET)
+        
+        data = []
+        for column, value in changes.items():
+            col = columns[column] + 1  # +1 because gspread is 1-indexed
+            data.append({"range": rowcol_to_a1(row_num, col), "values": [[value]]})
+        
+        # Same input option as update_cell so dates and numbers are parsed identically
+        sheet.batch_update(data, value_input_option=ValueInputOption.user_entered)
+        
+        # A reload may have replaced the cached row while we were writing
+        with _write_lock:
+            _replica_changed()
+            _, cached_row = _get_token_index().get(token, (None, None))
+            if cached_row is not None:
+                _count_client_row(cached_row, -1)
+            for column, value in changes.items():
+                _set_cached_value(cached_row or row_data, columns[column], value)
+            if cached_row is not None:
+                _count_client_row(cached_row, 1)
+        return True
     
-    for i, row in enumerate(all_values[1:], start=2):  # Start from 2 to account for header row
-        if row[token_idx] == token:
-            return i, row
+    return _write_with_schema_retry(CLIENTS_SHEET, write)
+
+def _appended_row_number(response):
+    """Row number written by append_row, from updates.updatedRange ("'clients'!A12:L12")"""
+    updated_range = response.get("updates", {}).get("updatedRange", "")
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+def _find_row_by_token(token):
+    """Find a row by token and return row number and data
+    
+    Runs the cheap sync first (a modifiedTime check at most every
+    SYNC_MIN_INTERVAL), and re-reads the row itself when the sheet changed
+    since the last check so cells edited by hand are seen at once.
+    """
+    checked_at, modified = _clients_synced_at, _clients_modified_time
+    _sync_clients()
+    with _write_lock:
+        _replica_rows()
+        row_num, row_data = _token_index.get(token, (None, None))
+        changed = _clients_modified_time is None or _clients_modified_time != modified
+        refresh = row_num is not None and _clients_synced_at != checked_at and changed
+        generation = _clients_generation
+    if refresh:
+        row_num, row_data = _refresh_client_row(token, row_num, row_data, generation)
+    return row_num, row_data
+
+def _refresh_client_row(token, row_num, row_data, generation):
+    """Re-read one replica row from the sheet
     
-    return None, None
+    The row is read without _write_lock and only applied if the replica did
+    not change since generation; otherwise the replica's row is returned.
+    """
+    sheet = _get_clients_sheet()
+    last_col = rowcol_to_a1(1, sheet.col_count)[:-1]
+    values = sheet.get(f"A{row_num}:{last_col}{row_num}")
+    fresh = list(values[0]) if values else []
+    
+    with _write_lock:
+        if _clients_generation != generation:
+            # Written or synced meanwhile: the replica is at least as recent
+            return _get_token_index().get(token, (None, None))
+        
+        columns = _column_maps[CLIENTS_SHEET]
+        width = max(columns.values()) + 1
+        fresh.extend([""] * (width - len(fresh)))
+        if fresh[columns["token"]] == token:
+            # Same list object: the replica and the index keep sharing it
+            _replica_changed()
+            _count_client_row(row_data, -1)
+            row_data[:] = fresh
+            _count_client_row(row_data, 1)
+            _client_names[row_data[columns["id"]]] = row_data[columns["name"]]
+            
+            position = row_num - 2  # Row 1 is the header
+            fields = [columns[name] for name in SEARCH_FIELDS]
+            if position < len(_search_texts) and _search_texts[position] != _search_text(row_data, fields):
+                _truncate_search_index(position)
+            return row_num, row_data
+    
+    print(f"Row {row_num} of sheet {CLIENTS_SHEET} no longer holds token {token}, reloading it...")
+    _load_clients()
+    return _get_token_index().get(token, (None, None))
 
+@_governed
 def token_exists(token):
     """Check if a token already exists"""
     row_num, _ = _find_row_by_token(token)
     return row_num is not None
 
+@_governed
 def add_client(token, name, email, profile, duration):
-    """Add a new client to the sheet"""
+    """Add a new client to the sheet
+    
+    The id allocation, the append and the replica update run under the
+    write lock as one step, so concurrent calls never share an id or a row.
+    The replica is synced first (before taking the lock) so rows added by
+    hand count for the id. Raises ValueError if the token is already used.
+    """
     sheet = _get_clients_sheet()
+    _sync_clients(force=True)
+    with _write_lock:
+        _replica_rows()
+        if token in _token_index:
+            raise ValueError(f"Token {token} already exists")
+        start_date, end_date, next_id, reload = _append_client(sheet, token, name, email, profile, duration)
+    if reload:
+        print(f"Sheet {CLIENTS_SHEET} changed while adding {token}, reloading it...")
+        _load_clients()
+    
+    # Log the NEW operation
+    details = f"Profile: {profile}, Duration: {duration}"
+    _log_operation("NEW", token, details, 0, str(next_id))
+    
+    return start_date, end_date
+
+def _append_client(sheet, token, name, email, profile, duration):
+    """Append the row of a new client (caller holds _write_lock)
+    
+    Returns (start_date, end_date, client id, reload), reload telling that
+    the row did not land where the replica expected it.
+    """
     
     # Calculate dates
     start_date = datetime.now()
@@ -211,9 +994,8 @@ def add_client(token, name, email, profile, duration):
     end_date = start_date + delta
     end_str = end_date.strftime("%Y-%m-%d %H:%M:%S")
     
-    # Get next ID
-    all_values = sheet.get_all_values()
-    next_id = len(all_values)  # Simple auto-increment
+    # Next ID after the highest one (rows deleted by hand leave gaps)
+    next_id = _max_client_id + 1
     
     # Prepare row
     new_row = [
@@ -232,66 +1014,70 @@ def add_client(token, name, email, profile, duration):
     ]
     
     # Append to sheet
-    sheet.append_row(new_row)
-    
-    # Log the NEW operation
-    details = f"Profile: {profile}, Duration: {duration}"
-    _log_operation("NEW", token, details, 0, str(next_id))
-    
-    return start_date, end_date
+    response = sheet.append_row(new_row)
+    
+    # Keep the replica and the token index current, unless the row did not
+    # land right after the rows we know of (edited by hand since the sync)
+    if _appended_row_number(response) == len(_clients_rows) + 2:  # +1 header, +1 next row
+        _add_replica_rows([new_row])
+        return start_date, end_date, next_id, False
+    _replica_changed()  # A sync started before the append must not apply
+    return start_date, end_date, next_id, True
 
+@_governed
 def get_client_by_token(token):
     """Get client details by token"""
     row_num, row_data = _find_row_by_token(token)
     if row_num is None:
         return None
     
-    sheet = _get_clients_sheet()
-    headers = sheet.row_values(1)
+    # Copy the cached row so callers never mutate the index
+    row_data = list(row_data)
     
     # Convert payment_amount to float
-    payment_idx = headers.index("payment_amount") if "payment_amount" in headers else -1
+    payment_idx = _get_columns(CLIENTS_SHEET).get("payment_amount", -1)
     if payment_idx >= 0 and payment_idx < len(row_data) and row_data[payment_idx]:
         row_data[payment_idx] = float(row_data[payment_idx])
     
     # Return as tuple to match database.py behavior
     return tuple(row_data)
 
+@_governed
+@_row_serialized
 def update_status(token, new_status, payment_amount=None):
-    """Update client status and optionally payment amount"""
+    """Update client status and optionally payment amount
+    
+    Returns False if the token was not found (or its row vanished before the write).
+    """
     row_num, row_data = _find_row_by_token(token)
     if row_num is None:
-        return
-    
-    sheet = _get_clients_sheet()
-    headers = sheet.row_values(1)
+        return False
     
-    # Update status
-    status_idx = headers.index("status") + 1  # +1 because gspread is 1-indexed
-    sheet.update_cell(row_num, status_idx, new_status)
+    # Update status and payment amount (if provided) in one request
+    changes = {"status": new_status}
+    if payment_amount is not None:
+        changes["payment_amount"] = str(payment_amount)
+    if not _update_client_cells(token, changes):
+        return False
     
-    # Update payment amount if provided
     if payment_amount is not None:
-        payment_idx = headers.index("payment_amount") + 1
-        sheet.update_cell(row_num, payment_idx, str(payment_amount))
-        
         # Log PAID operation when status is changed to Paid
         if new_status == "Paid":
             client_id = row_data[0] if row_data and len(row_data) > 0 else ""
             details = f"Status changed to Paid"
             _log_operation("PAID", token, details, payment_amount, client_id)
+    return True
 
+@_governed
+@_row_serialized
 def extend_subscription(token, extra_days):
     """Extend subscription by adding days to end_date"""
     row_num, row_data = _find_row_by_token(token)
     if row_num is None:
         return None
     
-    sheet = _get_clients_sheet()
-    headers = sheet.row_values(1)
-    
     # Get end date
-    end_idx = headers.index("end_date")
+    end_idx = _get_columns(CLIENTS_SHEET)["end_date"]
     end_str = row_data[end_idx]
     
     # Parse date
@@ -308,8 +1094,9 @@ def extend_subscription(token, extra_days):
     new_end = end_date + timedelta(days=extra_days)
     new_end_str = new_end.strftime("%Y-%m-%d %H:%M:%S")
     
-    # Update in sheet
-    sheet.update_cell(row_num, end_idx + 1, new_end_str)
+    # Update in sheet (the row may have been deleted by hand since the lookup)
+    if not _update_client_cells(token, {"end_date": new_end_str}):
+        return None
     
     # Log EXT operation
     client_id = row_data[0] if row_data and len(row_data) > 0 else ""
@@ -318,23 +1105,23 @@ def extend_subscription(token, extra_days):
     
     return new_end
 
+@_governed
 def get_unpaid_clients():
     """Get list of unpaid clients"""
-    sheet = _get_clients_sheet()
-    all_values = sheet.get_all_values()
-    headers = all_values[0]
+    rows = _get_client_rows()
+    columns = _get_columns(CLIENTS_SHEET)
     
     # Find column indices
-    token_idx = headers.index("token")
-    name_idx = headers.index("name")
-    profile_idx = headers.index("profile")
-    start_idx = headers.index("start_date")
-    end_idx = headers.index("end_date")
-    status_idx = headers.index("status")
+    token_idx = columns["token"]
+    name_idx = columns["name"]
+    profile_idx = columns["profile"]
+    start_idx = columns["start_date"]
+    end_idx = columns["end_date"]
+    status_idx = columns["status"]
     
     # Filter unpaid clients
     unpaid = []
-    for row in all_values[1:]:  # Skip header
+    for row in rows:
         if row[status_idx] == "Unpaid":
             unpaid.append((
                 row[token_idx],
@@ -346,24 +1133,24 @@ def get_unpaid_clients():
     
     return unpaid
 
+@_governed
 def get_all_clients():
     """Get all clients"""
-    sheet = _get_clients_sheet()
-    all_values = sheet.get_all_values()
-    headers = all_values[0]
+    rows = _get_client_rows()
+    columns = _get_columns(CLIENTS_SHEET)
     
     # Find column indices
-    token_idx = headers.index("token")
-    name_idx = headers.index("name")
-    email_idx = headers.index("email")
-    profile_idx = headers.index("profile")
-    start_idx = headers.index("start_date")
-    end_idx = headers.index("end_date")
-    status_idx = headers.index("status")
+    token_idx = columns["token"]
+    name_idx = columns["name"]
+    email_idx = columns["email"]
+    profile_idx = columns["profile"]
+    start_idx = columns["start_date"]
+    end_idx = columns["end_date"]
+    status_idx = columns["status"]
     
     # Extract client data
     clients = []
-    for row in all_values[1:]:  # Skip header
+    for row in rows:
         clients.append((
             row[token_idx],
             row[name_idx],
@@ -376,108 +1163,191 @@ def get_all_clients():
     
     return clients
 
+def iter_clients():
+    """Yield the rows of get_all_clients one at a time (exports)
+    
+    Iterates a synced snapshot of the replica, so rows are built as the
+    export writes them instead of as one big list.
+    """
+    rows = _governed(_get_client_rows)()
+    columns = _get_columns(CLIENTS_SHEET)
+    indices = [columns[name] for name in ("token", "name", "email", "profile", "start_date", "end_date", "status")]
+    for row in rows:
+        yield tuple(row[idx] for idx in indices)
+
+@_governed
+@_row_serialized
 def burn_token(token, reason):
     """Mark a token as burned"""
     row_num, row_data = _find_row_by_token(token)
     if row_num is None:
         return False, "Token not found"
     
-    sheet = _get_clients_sheet()
-    headers = sheet.row_values(1)
-    
     # Check if already burned
-    is_burned_idx = headers.index("is_burned")
+    is_burned_idx = _get_columns(CLIENTS_SHEET)["is_burned"]
     if row_data[is_burned_idx] == "1":
         return False, "Token is already burned"
     
     # Current time
     burn_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # Update client record
-    sheet.update_cell(row_num, is_burned_idx + 1, "1")
-    sheet.update_cell(row_num, headers.index("burn_reason") + 1, reason)
-    sheet.update_cell(row_num, headers.index("burn_date") + 1, burn_date)
+    # Update client record in one request
+    if not _update_client_cells(token, {
+        "is_burned": "1",
+        "burn_reason": reason,
+        "burn_date": burn_date
+    }):
+        return False, "Token not found"
     
-    # Add to burned tokens sheet
-    burned_sheet = _get_burned_sheet()
-    burned_values = burned_sheet.get_all_values()
-    next_id = len(burned_values)
+    # Add to burned tokens sheet (ids allocated under _burned_lock)
+    def append_burned():
+        global _burned_row_count
+        burned_sheet = _get_burned_sheet()
+        if _burned_row_count is None:
+            # Count the existing rows once; later burns reuse the cached count
+            _burned_row_count = len(burned_sheet.col_values(1)) - 1
+        next_id = _burned_row_count + 1
+        
+        burned_sheet.append_row([
+            str(next_id),
+            token,
+            reason,
+            burn_date,
+            row_data[0]  # client_id
+        ])
+        _burned_row_count += 1
     
-    burned_sheet.append_row([
-        str(next_id),
-        token,
-        reason,
-        burn_date,
-        row_data[0]  # client_id
-    ])
+    with _burned_lock:
+        _write_with_schema_retry(BURNED_SHEET, append_burned)
     
     # Log operation
     _log_operation("BURN", token, reason, 0, row_data[0])
     
     return True, f"Token {token} has been burned successfully"
 
-def _get_burned_sheet():
-    """Get the burned tokens sheet"""
-    return _get_sheet(BURNED_SHEET)
-
 def _get_operations_sheet():
     """Get the operations log sheet"""
     operations_sheet = _get_sheet(OPERATIONS_SHEET)
     
-    # Verify headers
-    headers = operations_sheet.row_values(1)
-    if not headers or len(headers) < 3:  # Check that there are at least some headers
-        print(f"Sheet {OPERATIONS_SHEET} exists but has no headers. Adding headers...")
-        headers = ["id", "timestamp", "operation_type", "token", "details", "amount", "client_id"]
-        operations_sheet.clear()
-        operations_sheet.append_row(headers)
-        print("Headers added successfully.")
+    # Verify headers (only the first time)
+    _verify_headers(operations_sheet, OPERATIONS_SHEET, SHEET_HEADERS[OPERATIONS_SHEET])
     
     return operations_sheet
 
 def _log_operation(op_type, token, details, amount=0, client_id=""):
-    """Log an operation to the operations log sheet"""
+    """Queue an operation for the operations log sheet
+    
+    The id is allocated locally and the row is written later by the
+    background flusher, so the caller never waits on the log sheet.
+    """
+    global _log_next_id
     try:
-        operations_sheet = _get_operations_sheet()
-        operations = operations_sheet.get_all_values()
-        next_id = len(operations)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _init_log_ids()
+        with _log_lock:
+            next_id = _log_next_id
+            _log_next_id += 1
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            _log_buffer.append([
+                str(next_id),
+                timestamp,
+                op_type,
+                token,
+                details,
+                str(amount),
+                client_id
+            ])
+            pending = len(_log_buffer)
         
-        operations_sheet.append_row([
-            str(next_id),
-            timestamp,
-            op_type,
-            token,
-            details,
-            str(amount),
-            client_id
-        ])
+        _start_log_flusher()
+        if pending >= LOG_FLUSH_BATCH_SIZE:
+            _log_wakeup.set()
         return True
     except Exception as e:
         print(f"Error logging operation: {e}")
         return False
 
+def _init_log_ids():
+    """Count the existing log rows once (column A only); ids continue from there
+    
+    Called before taking _log_lock: resolving the sheet may take _write_lock.
+    Since the log is append-only, operation id n sits on row n + 1 of the sheet.
+    """
+    global _log_next_id
+    if _log_next_id is not None:
+        return
+    count = len(_get_operations_sheet().col_values(1))
+    with _log_lock:
+        if _log_next_id is None:
+            _log_next_id = count
+
+def flush_operations_log():
+    """Append every buffered log entry to the operations sheet in one request"""
+    with _log_flush_lock:
+        with _log_lock:
+            rows = _log_buffer[:]
+            del _log_buffer[:]
+        if not rows:
+            return True
+        
+        try:
+            _write_with_schema_retry(OPERATIONS_SHEET, lambda: _get_operations_sheet().append_rows(rows))
+            return True
+        except Exception as e:
+            print(f"Error flushing operations log ({len(rows)} entries kept for retry): {e}")
+            with _log_lock:
+                # Put the entries back in front so the log keeps its order
+                _log_buffer[0:0] = rows
+            return False
+
+def _log_flusher():
+    """Background loop flushing the log every LOG_FLUSH_INTERVAL seconds or per batch"""
+    while not _log_stopping:
+        _log_wakeup.wait(LOG_FLUSH_INTERVAL)
+        _log_wakeup.clear()
+        flush_operations_log()
+
+def _start_log_flusher():
+    """Start the flusher thread on first use"""
+    global _log_thread
+    if _log_thread is not None or _log_stopping:
+        return
+    with _log_lock:
+        if _log_thread is None:
+            _log_thread = threading.Thread(target=_log_flusher, name="operations-log-flusher", daemon=True)
+            _log_thread.start()
+
+def stop_operations_log():
+    """Stop the flusher thread and write out everything still buffered"""
+    global _log_stopping
+    _log_stopping = True
+    _log_wakeup.set()
+    if _log_thread is not None:
+        _log_thread.join(timeout=LOG_FLUSH_INTERVAL * 2)
+    flush_operations_log()
+
+# Make sure buffered log entries reach the sheet on interpreter exit
+atexit.register(stop_operations_log)
+
+@_governed
 def get_burned_tokens():
     """Get all burned tokens"""
     burned_sheet = _get_burned_sheet()
-    clients_sheet = _get_clients_sheet()
-    
     burned_values = burned_sheet.get_all_values()
-    client_values = clients_sheet.get_all_values()
     
     # Skip if no data
     if len(burned_values) <= 1:  # Only header
         return []
     
     # Create client lookup by ID
-    client_headers = client_values[0]
-    id_idx = client_headers.index("id")
-    name_idx = client_headers.index("name")
-    email_idx = client_headers.index("email")
-    profile_idx = client_headers.index("profile")
+    client_columns = _get_columns(CLIENTS_SHEET)
+    id_idx = client_columns["id"]
+    name_idx = client_columns["name"]
+    email_idx = client_columns["email"]
+    profile_idx = client_columns["profile"]
     
     clients_by_id = {}
-    for row in client_values[1:]:
+    for row in _get_client_rows():
         clients_by_id[row[id_idx]] = {
             "name": row[name_idx],
             "email": row[email_idx],
@@ -509,56 +1379,34 @@ def get_burned_tokens():
     result.sort(key=lambda x: x[2], reverse=True)
     return result
 
+@_governed
 def get_stats():
-    """Get subscription statistics"""
-    sheet = _get_clients_sheet()
-    all_values = sheet.get_all_values()
-    
-    if len(all_values) <= 1:  # Only header or empty
-        return 0, 0, 0, 0, 0
-    
-    headers = all_values[0]
-    status_idx = headers.index("status")
-    end_idx = headers.index("end_date")
-    is_burned_idx = headers.index("is_burned")
-    
-    total = len(all_values) - 1  # Exclude header
-    paid = sum(1 for row in all_values[1:] if row[status_idx] == "Paid")
-    unpaid = sum(1 for row in all_values[1:] if row[status_idx] == "Unpaid")
-    
-    # Count expired
-    now = datetime.now()
-    expired = 0
-    for row in all_values[1:]:
-        try:
-            end_date = datetime.strptime(row[end_idx], "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            try:
-                end_date = datetime.strptime(row[end_idx], "%Y-%m-%d")
-            except ValueError:
-                continue
-        
-        if end_date < now:
-            expired += 1
-    
-    # Count burned
-    burned = sum(1 for row in all_values[1:] if row[is_burned_idx] == "1")
-    
-    return total, paid, unpaid, expired, burned
+    """Get subscription statistics
+    
+    Constant time apart from the sync: counters are maintained as the replica
+    changes and expired clients are a bisect in the sorted end dates.
+    """
+    _sync_clients()
+    with _write_lock:
+        _replica_rows()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        expired = bisect.bisect_left(_end_dates, now)
+        return (_stats_counts["total"], _stats_counts["paid"], _stats_counts["unpaid"],
+                expired, _stats_counts["burned"])
 
+@_governed
 def get_expiring_clients(days):
     """Get clients expiring within specified days"""
-    sheet = _get_clients_sheet()
-    all_values = sheet.get_all_values()
-    headers = all_values[0]
+    rows = _get_client_rows()
+    columns = _get_columns(CLIENTS_SHEET)
     
     # Find column indices
-    token_idx = headers.index("token")
-    name_idx = headers.index("name")
-    profile_idx = headers.index("profile")
-    end_idx = headers.index("end_date")
-    status_idx = headers.index("status")
-    payment_idx = headers.index("payment_amount") if "payment_amount" in headers else -1
+    token_idx = columns["token"]
+    name_idx = columns["name"]
+    profile_idx = columns["profile"]
+    end_idx = columns["end_date"]
+    status_idx = columns["status"]
+    payment_idx = columns.get("payment_amount", -1)
     
     # Calculate limit date
     now = datetime.now()
@@ -566,7 +1414,7 @@ def get_expiring_clients(days):
     
     # Filter expiring clients
     expiring = []
-    for row in all_values[1:]:
+    for row in rows:
         try:
             end_date = datetime.strptime(row[end_idx], "%Y-%m-%d %H:%M:%S")
         except ValueError:
@@ -595,80 +1443,107 @@ def get_expiring_clients(days):
     
     return expiring
 
-def search_clients(query):
-    """Search for clients by name, email, profile, or token"""
-    sheet = _get_clients_sheet()
-    all_values = sheet.get_all_values()
-    headers = all_values[0]
-    
-    # Find column indices
-    token_idx = headers.index("token")
-    name_idx = headers.index("name")
-    email_idx = headers.index("email")
-    profile_idx = headers.index("profile")
-    start_idx = headers.index("start_date")
-    end_idx = headers.index("end_date")
-    status_idx = headers.index("status")
-    
-    # Search
-    query = query.lower()
-    results = []
-    
-    for row in all_values[1:]:
-        if (query in row[token_idx].lower() or
-            query in row[name_idx].lower() or
-            query in row[email_idx].lower() or
-            query in row[profile_idx].lower()):
-            
-            results.append((
-                row[token_idx],
-                row[name_idx],
-                row[email_idx],
-                row[profile_idx],
-                row[start_idx],
-                row[end_idx],
-                row[status_idx]
-            ))
-    
-    return results
+@_governed
+def search_clients(query, limit=SEARCH_LIMIT):
+    """Search for clients by name, email, profile, or token
+    
+    Candidates come from the trigram index (rows holding the rarest trigram
+    of the query), then are checked for the whole substring. Returns at most
+    limit matches: exact token first, then prefix matches, then sheet order.
+    Queries under 3 characters scan the rows; queries matching more than
+    SEARCH_RANK_MAX_MATCHES rows only put the exact token first.
+    """
+    _sync_clients()
+    with _write_lock:
+        rows = _replica_rows()
+        _update_search_index()
+        columns = _get_columns(CLIENTS_SHEET)
+        fields = [columns[name] for name in ("token", "name", "email", "profile", "start_date", "end_date", "status")]
+        
+        q = query.lower()
+        if len(q) >= 3:
+            postings = [_trigram_rows.get(q[i:i + 3], ()) for i in range(len(q) - 2)]
+            candidates = min(postings, key=len)
+        else:
+            candidates = range(len(_search_texts))
+        
+        matches = []
+        for position in candidates:
+            if q in _search_texts[position]:
+                matches.append(position)
+                if len(matches) > SEARCH_RANK_MAX_MATCHES:
+                    break
+        
+        if len(matches) <= SEARCH_RANK_MAX_MATCHES:
+            def rank(position):
+                text = _search_texts[position]
+                if text.split("\x00", 1)[0] == q:
+                    return 0, position
+                if text.startswith(q) or "\x00" + q in text:
+                    return 1, position
+                return 2, position
+            best = heapq.nsmallest(limit, matches, key=rank)
+        else:
+            # Too broad to rank: the exact token, then the first matches
+            row_num, _ = _token_index.get(query, (None, None))
+            exact = [] if row_num is None else [row_num - 2]  # Row 1 is the header
+            best = exact + [position for position in matches if position not in exact][:limit - len(exact)]
+        
+        return [tuple(rows[position][i] for i in fields) for position in best]
 
+@_governed
 def get_recent_operations(limit=10):
-    """Get recent operations from the operations log"""
+    """Get recent operations from the operations log
+    
+    The log is append-only, so only its last rows are read (by range) and
+    merged with the entries still waiting in the buffer.
+    """
     try:
-        # Get operations from the dedicated operations log
+        if limit <= 0:
+            return []
+        
+        # Resolved before the log locks (see the lock order at _write_lock)
+        _init_log_ids()
         operations_sheet = _get_operations_sheet()
-        all_operations = operations_sheet.get_all_values()
         
-        if len(all_operations) <= 1:  # Only header or empty
-            return []
+        # Holding the flush lock keeps the entries from being in flight between buffer and sheet
+        with _log_flush_lock:
+            with _log_lock:
+                pending = [list(row) for row in _log_buffer]
+                last_row = _log_next_id - len(pending)  # Last row already on the sheet
             
-        headers = all_operations[0]
+            recent_rows = []
+            if last_row >= 2:  # Row 1 is the header
+                first_row = max(2, last_row - limit + 1)
+                last_col = rowcol_to_a1(1, operations_sheet.col_count)[:-1]
+                recent_rows = [list(row) for row in operations_sheet.get(f"A{first_row}:{last_col}")]
         
-        # Find column indices
-        timestamp_idx = headers.index("timestamp")
-        op_type_idx = headers.index("operation_type")
-        token_idx = headers.index("token")
-        details_idx = headers.index("details")
-        amount_idx = headers.index("amount")
-        client_id_idx = headers.index("client_id")
+        rows = (recent_rows + pending)[-limit:]
+        if not rows:
+            return []
         
-        # Get client info for better display
-        clients_sheet = _get_clients_sheet()
-        client_values = clients_sheet.get_all_values()
-        client_headers = client_values[0]
-        client_id_idx_client = client_headers.index("id")
-        client_name_idx = client_headers.index("name")
+        columns = _get_columns(OPERATIONS_SHEET)
+        width = max(columns.values()) + 1
         
-        # Create client lookup by ID
-        clients_by_id = {}
-        for row in client_values[1:]:
-            if len(row) > client_name_idx:
-                clients_by_id[row[client_id_idx_client]] = row[client_name_idx]
+        # Find column indices
+        timestamp_idx = columns["timestamp"]
+        op_type_idx = columns["operation_type"]
+        token_idx = columns["token"]
+        details_idx = columns["details"]
+        amount_idx = columns["amount"]
+        client_id_idx = columns["client_id"]
+        
+        # Client names come from the cached id -> name map of the clients replica
+        _get_token_index()
+        clients_by_id = _client_names
         
         # Process operations
         operations = []
-        for row in all_operations[1:]:  # Skip header
+        for row in rows:
             try:
+                # The API trims trailing empty cells
+                row = row + [""] * (width - len(row))
+                
                 # Parse timestamp
                 timestamp_str = row[timestamp_idx]
                 try:
@@ -678,14 +1553,14 @@ def get_recent_operations(limit=10):
                 
                 # Get amount
                 amount = 0
-                if amount_idx < len(row) and row[amount_idx]:
+                if row[amount_idx]:
                     try:
                         amount = float(row[amount_idx])
                     except (ValueError, TypeError):
                         amount = 0
                 
                 # Get client name if available
-                client_id = row[client_id_idx] if client_id_idx < len(row) else ""
+                client_id = row[client_id_idx]
                 client_name = clients_by_id.get(client_id, "")
                 
                 # Fix duplicated names like "hamidihamidi"
@@ -0,0 +1,38 @@
+# locks.py
+# Per-key asyncio locks for handlers running concurrently
+#
+# The bots process updates concurrently (Application concurrent_updates), so
+# two admins may work on the same client at once. Handlers that read a client,
+# change it and replan its reminders hold the lock of its token for the whole
+# sequence; commands on different tokens never wait for each other.
+import asyncio
+import contextlib
+
+class KeyedLocks:
+    """One asyncio.Lock per key, created on demand and dropped once unused
+
+    Usage:
+        token_locks = KeyedLocks()
+        async with token_locks(token):
+            ...
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, number of holders and waiters]
+
+    @contextlib.asynccontextmanager
+    async def __call__(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
@@ -0,0 +1,194 @@
+# outbox.py
+# Central queue for every message the bot sends to Telegram
+#
+# Telegram allows about 30 messages per second overall, 1 per second in a
+# private chat and 20 per minute in a group. Instead of calling
+# reply_text/send_message directly, handlers and reminders enqueue their
+# messages here and a single dispatcher sends them as fast as those limits
+# allow. Interactive replies always go before bulk messages (reminders,
+# digests), and a RetryAfter from Telegram pauses the whole queue for the
+# requested time before the message is retried.
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Priorities, lowest value first
+INTERACTIVE = 0
+BULK = 1
+
+GLOBAL_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_SECOND = 1
+GROUP_MESSAGES_PER_MINUTE = 20
+MAX_RETRIES = 3  # RetryAfter answers tolerated for one message
+DEPTH_WARNING = 100  # Log a warning when this many messages are waiting
+
+class Outbox:
+    """Rate-limited, prioritized sender for one bot
+
+    Usage:
+        outbox = Outbox()
+        outbox.start(app.bot)                      # from Application.post_init
+        await outbox.reply(update, "text")          # interactive
+        await outbox.send(chat_id, "text", priority=BULK)
+        outbox.metrics()                            # queue depth and counters
+    """
+
+    def __init__(self):
+        self._bot = None
+        # priority -> chat_id -> deque of (method, kwargs, future, attempts)
+        # Chats are served round-robin inside a priority level
+        self._queues = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}
+        self._chat_ready_at = {}  # chat_id -> time.monotonic() the next message may go
+        self._global_ready_at = 0.0
+        self._wakeup = None
+        self._task = None
+        self._in_flight = set()
+        self.stats = Counter()  # sent, failed, retry_after
+
+    def start(self, bot):
+        """Bind the bot and start the dispatcher (needs a running event loop)"""
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """Send what is still queued (up to timeout seconds), then stop the dispatcher"""
+        deadline = time.monotonic() + timeout
+        while (self.depth() or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def send(self, chat_id, text, priority=INTERACTIVE, **kwargs):
+        """Queue a send_message and wait for the sent Message"""
+        return await self.call(chat_id, "send_message", priority, text=text, **kwargs)
+
+    async def reply(self, update, text, **kwargs):
+        """Queue an interactive reply to the chat of an update"""
+        return await self.send(update.effective_chat.id, text, INTERACTIVE, **kwargs)
+
+    async def reply_document(self, update, document, **kwargs):
+        """Queue an interactive send_document to the chat of an update"""
+        return await self.call(update.effective_chat.id, "send_document", INTERACTIVE, document=document, **kwargs)
+
+    async def call(self, chat_id, method, priority=INTERACTIVE, **kwargs):
+        """Queue any Bot method that sends to a chat and wait for its result
+
+        Errors other than RetryAfter (e.g. BadRequest) are raised here, to the caller.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(chat_id, deque()).append((method, kwargs, future, 0))
+
+        depth = self.depth()
+        if depth >= DEPTH_WARNING and depth % DEPTH_WARNING == 0:
+            logger.warning(f"Outbox is backing up: {depth} messages waiting")
+        self._wakeup.set()
+        return await future
+
+    def depth(self, priority=None):
+        """Number of messages waiting (not yet handed to Telegram)"""
+        levels = [priority] if priority is not None else list(self._queues)
+        return sum(len(q) for level in levels for q in self._queues[level].values())
+
+    def metrics(self):
+        """Queue depth per priority plus delivery counters"""
+        return {
+            "interactive_waiting": self.depth(INTERACTIVE),
+            "bulk_waiting": self.depth(BULK),
+            "in_flight": len(self._in_flight),
+            "sent": self.stats["sent"],
+            "failed": self.stats["failed"],
+            "retry_after": self.stats["retry_after"],
+            "paused_for": max(0.0, round(self._global_ready_at - time.monotonic(), 1)),
+        }
+
+    def _chat_interval(self, chat_id):
+        # Negative ids are groups and channels, which have the stricter per-minute limit
+        if isinstance(chat_id, int) and chat_id < 0:
+            return 60 / GROUP_MESSAGES_PER_MINUTE
+        return 1 / CHAT_MESSAGES_PER_SECOND
+
+    def _pick(self, now):
+        """Take the next message that may be sent now, highest priority first"""
+        if now < self._global_ready_at:
+            return None
+        for priority, chats in self._queues.items():
+            for chat_id in list(chats):
+                if self._chat_ready_at.get(chat_id, 0) > now:
+                    continue
+                messages = chats[chat_id]
+                item = messages.popleft()
+                if messages:
+                    chats.move_to_end(chat_id)  # Round-robin between chats
+                else:
+                    del chats[chat_id]
+                return priority, chat_id, item
+        return None
+
+    def _next_wait(self, now):
+        """Seconds until something may become sendable, or None if the queue is empty"""
+        chats = [chat_id for level in self._queues.values() for chat_id in level]
+        if not chats:
+            return None
+        ready_at = min(self._chat_ready_at.get(chat_id, 0) for chat_id in chats)
+        return max(0.0, max(ready_at, self._global_ready_at) - now)
+
+    async def _run(self):
+        """Dispatcher loop: hand each message to Telegram as soon as the limits allow"""
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            picked = self._pick(now)
+            if picked is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_wait(now))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            priority, chat_id, item = picked
+            self._chat_ready_at[chat_id] = now + self._chat_interval(chat_id)
+            self._global_ready_at = max(self._global_ready_at, now + 1 / GLOBAL_MESSAGES_PER_SECOND)
+
+            # Deliver concurrently: the limits are enforced here, at dispatch time
+            task = asyncio.get_running_loop().create_task(self._deliver(priority, chat_id, item))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _deliver(self, priority, chat_id, item):
+        method, kwargs, future, attempts = item
+        # A retry sends the same file objects: rewind what the last attempt read
+        for value in kwargs.values():
+            if hasattr(value, "seek") and hasattr(value, "read"):
+                value.seek(0)
+        try:
+            result = await getattr(self._bot, method)(chat_id=chat_id, **kwargs)
+        except RetryAfter as e:
+            self.stats["retry_after"] += 1
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            if attempts + 1 > MAX_RETRIES:
+                self.stats["failed"] += 1
+                if not future.done():
+                    future.set_exception(e)
+                return
+            # Telegram wants us to slow down: hold everything back, then retry this message first
+            logger.warning(f"Telegram asked to retry after {delay}s, pausing the outbox")
+            self._global_ready_at = max(self._global_ready_at, time.monotonic() + delay)
+            self._queues[priority].setdefault(chat_id, deque()).appendleft((method, kwargs, future, attempts + 1))
+            self._queues[priority].move_to_end(chat_id, last=False)
+            self._wakeup.set()
+        except Exception as e:
+            self.stats["failed"] += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.stats["sent"] += 1
+            if not future.done():
+                future.set_result(result)
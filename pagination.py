@@ -0,0 +1,181 @@
+# pagination.py
+# Paginated result lists with prev/next inline buttons
+#
+# List commands (/unpaid, /expiring, /search, /burned) hand their rows to
+# Paginator.send() instead of building one giant message. The rows are kept
+# as a snapshot keyed by the query and only the first page is rendered and
+# sent. The buttons carry "pg:<snapshot>:<first row>", and pressing one
+# renders that page from the snapshot and edits the message in place, so
+# paging never queries the backend again.
+import bisect
+import itertools
+import time
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from rendering import TELEGRAM_MESSAGE_LIMIT
+
+PAGE_SIZE = 10  # Rows per page
+SNAPSHOT_TTL_SECONDS = 900  # Buttons of older results answer "expired"
+MAX_SNAPSHOTS = 200  # Oldest snapshots are dropped beyond this
+CALLBACK_PATTERN = r"^pg:"
+
+class Paginator:
+    """Snapshot cache plus the callback handler for paginated lists
+
+    Usage:
+        pages = Paginator(outbox)
+        await pages.send(update, ("unpaid",), rows, render_row, "⚠️ <b>Unpaid Clients</b>", parse_mode="HTML")
+        app.add_handler(CallbackQueryHandler(admin_required(pages.handle_callback), pattern=CALLBACK_PATTERN))
+    """
+
+    def __init__(self, outbox, page_size=PAGE_SIZE, ttl=SNAPSHOT_TTL_SECONDS):
+        self._outbox = outbox
+        self._page_size = page_size
+        self._ttl = ttl
+        self._snapshots = OrderedDict()  # snapshot id -> snapshot dict, oldest first
+        self._by_query = {}  # query key -> snapshot id
+        self._ids = itertools.count(1)
+
+    async def send(self, update, query, rows, render, header, parse_mode=None):
+        """Store rows as the snapshot of query and reply with its first page
+
+        render(row) returns the text of one row, already escaped for
+        parse_mode; it only runs for the rows of the page being shown.
+        """
+        # Running the same command again refreshes its snapshot, so the buttons
+        # of an older message for that query page through the fresh results
+        snapshot_id = self._by_query.get(query) or str(next(self._ids))
+        self._snapshots.pop(snapshot_id, None)
+        self._snapshots[snapshot_id] = {
+            "query": query,
+            "rows": list(rows),
+            "render": render,
+            "header": header,
+            "parse_mode": parse_mode,
+            "created": time.monotonic(),
+            "starts": [0],  # Known first rows of pages, ascending (pages vary in length)
+        }
+        self._by_query[query] = snapshot_id
+        self._evict()
+
+        text, markup = self._render(snapshot_id, 0)
+        chat_id = update.effective_chat.id
+        return await self._send_page("send_message", chat_id, text, markup, parse_mode)
+
+    async def handle_callback(self, update, context):
+        """CallbackQueryHandler callback for the prev/next buttons"""
+        query = update.callback_query
+        try:
+            _, snapshot_id, start = query.data.split(":")
+            start = int(start)
+        except ValueError:
+            await query.answer()
+            return
+
+        snapshot = self._get(snapshot_id)
+        if snapshot is None:
+            await query.answer("⌛ These results have expired, run the command again.", show_alert=True)
+            return
+
+        await query.answer()
+        text, markup = self._render(snapshot_id, start)
+        try:
+            await self._send_page(
+                "edit_message_text", query.message.chat_id, text, markup, snapshot["parse_mode"],
+                message_id=query.message.message_id
+            )
+        except BadRequest as e:
+            # Double taps on the same button
+            if "not modified" not in str(e).lower():
+                raise
+
+    def _get(self, snapshot_id):
+        snapshot = self._snapshots.get(snapshot_id)
+        if snapshot is None:
+            return None
+        if time.monotonic() - snapshot["created"] > self._ttl:
+            self._drop(snapshot_id)
+            return None
+        return snapshot
+
+    def _drop(self, snapshot_id):
+        snapshot = self._snapshots.pop(snapshot_id, None)
+        if snapshot is not None and self._by_query.get(snapshot["query"]) == snapshot_id:
+            del self._by_query[snapshot["query"]]
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._snapshots:
+            oldest_id, oldest = next(iter(self._snapshots.items()))
+            if len(self._snapshots) <= MAX_SNAPSHOTS and now - oldest["created"] <= self._ttl:
+                break
+            self._drop(oldest_id)
+
+    def _render(self, snapshot_id, start):
+        """Text and keyboard of the page starting at row start"""
+        snapshot = self._snapshots[snapshot_id]
+        total = len(snapshot["rows"])
+        start = max(0, min(start, total - 1))
+
+        lines, end = self._page(snapshot, start)
+        text = snapshot["header"] + "\n\n" + "".join(lines)
+        if total > self._page_size or end < total:
+            text += f"\n📄 {start + 1}–{end} / {total}"
+
+        buttons = []
+        if start > 0:
+            buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"pg:{snapshot_id}:{self._previous_start(snapshot, start)}"))
+        if end < total:
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"pg:{snapshot_id}:{end}"))
+        markup = InlineKeyboardMarkup([buttons]) if buttons else None
+        return text, markup
+
+    def _page(self, snapshot, start):
+        """Rendered rows of the page starting at row start, and the first row after it
+
+        A page stops early rather than overflowing the message limit. When
+        the page is one of those paged through from row 0, where it ends is
+        recorded as the start of the next one, for that page's Prev button.
+        """
+        header = len(snapshot["header"]) + 2
+        # Leave room for the footer
+        budget = TELEGRAM_MESSAGE_LIMIT - 64 - header
+        lines = []
+        size = 0
+        for row in snapshot["rows"][start:start + self._page_size]:
+            line = snapshot["render"](row)
+            if lines and size + len(line) > budget:
+                break
+            lines.append(line)
+            size += len(line)
+
+        end = start + len(lines)
+        starts = snapshot["starts"]
+        if end < len(snapshot["rows"]) and _contains(starts, start) and not _contains(starts, end):
+            bisect.insort(starts, end)
+        return lines, end
+
+    def _previous_start(self, snapshot, start):
+        """First row of the page before the one starting at row start"""
+        starts = snapshot["starts"]
+        i = bisect.bisect_left(starts, start)
+        previous = starts[i - 1]
+        if i < len(starts) and starts[i] == start:
+            return previous
+        # Not reached through Next (e.g. a button of a refreshed snapshot):
+        # walk the pages from the closest known start
+        while True:
+            _, end = self._page(snapshot, previous)
+            if end >= start:
+                return previous
+            previous = end
+
+    async def _send_page(self, method, chat_id, text, markup, parse_mode, **kwargs):
+        return await self._outbox.call(chat_id, method, text=text, reply_markup=markup, parse_mode=parse_mode, **kwargs)
+
+def _contains(sorted_list, value):
+    i = bisect.bisect_left(sorted_list, value)
+    return i < len(sorted_list) and sorted_list[i] == value
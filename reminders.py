@@ -0,0 +1,445 @@
+# reminders.py
+# Subscription reminders shared by botnetflix.py and bot.py
+#
+# Every active subscription gets a small plan of reminder events: one per
+# configured tier before its end date (REMINDER_TIERS, e.g. 3 days, 1 day and
+# 1 hour before), one if it is still unpaid UNPAID_REMINDER_DAYS after its start,
+# and the expiration itself. The plan is computed once, when the client is
+# created, extended, paid or burned, and kept as the "next due" index: a
+# min-heap of (due timestamp, token, kind). A single sweeper job wakes up at
+# the earliest due event and only touches the events that are due, then
+# re-arms itself for the next one. Insert, reschedule and cancel are O(log n):
+# a replanned or cancelled token simply leaves stale heap entries behind,
+# which are skipped when they reach the top (lazy deletion).
+#
+# Clients and pending events are persisted in tables of JOBS_DB, so they
+# survive restarts (the sweeper job itself lives in APScheduler's memory job
+# store: start() re-arms it from the pending events): the bot no longer
+# rescans every client at startup, and an event that fell due while the bot
+# was down is still sent, as long as it is at most MISFIRE_GRACE_SECONDS late.
+#
+# Events are coalesced: the sweeper waits NOTIFY_COALESCE_SECONDS after the
+# first due event and sends everything due in that window as one digest
+# message, so a batch of trials ending together does not flood CHAT_ID.
+import heapq
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from rendering import TELEGRAM_MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+MISFIRE_GRACE_SECONDS = int(os.getenv("MISFIRE_GRACE_SECONDS", 24 * 3600))
+NOTIFY_COALESCE_SECONDS = int(os.getenv("NOTIFY_COALESCE_SECONDS", 60))
+# Reminders before the end date, e.g. "3d,1d,1h" (m = minutes, h = hours, d or nothing = days)
+REMINDER_TIERS = os.getenv("REMINDER_TIERS", "3d,1d,1h")
+# Remind about clients still unpaid this many days after their start (0 disables it)
+UNPAID_REMINDER_DAYS = int(os.getenv("UNPAID_REMINDER_DAYS", 3))
+SWEEPER_JOB_ID = "expiry-sweeper"
+
+scheduler = AsyncIOScheduler(
+    job_defaults={"misfire_grace_time": MISFIRE_GRACE_SECONDS, "coalesce": True}
+)
+
+# Bound by start(): the Application, the bot's notify coroutine and the sender for digests
+_app = None
+_chat_id = None
+_notify = None
+_send = None
+
+# Tracked clients: token -> (end timestamp, start timestamp, status, name, email, profile, end label)
+_clients = {}
+# Pending events: token -> {kind: due timestamp}
+_events = {}
+# Min-heap of (due timestamp, token, kind); may hold stale entries (see _is_live)
+_heap = []
+_armed_at = None  # Due timestamp the sweeper job is currently scheduled for
+
+def parse_end_date(end):
+    """Parse an end_date as stored by the backends, or return None"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(end, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def parse_duration(duration_str: str) -> timedelta:
+    """Parse a duration like "30", "30d", "12h" or "45m" (days by default)"""
+    duration_str = str(duration_str).lower()
+    if duration_str.endswith("m"):
+        return timedelta(minutes=int(duration_str[:-1]))
+    elif duration_str.endswith("h"):
+        return timedelta(hours=int(duration_str[:-1]))
+    elif duration_str.endswith("d"):
+        return timedelta(days=int(duration_str[:-1]))
+    else:
+        return timedelta(days=int(duration_str))  # default days
+
+def _parse_tiers(spec):
+    """Parse REMINDER_TIERS into (label, seconds) pairs, longest first"""
+    tiers = []
+    for label in spec.split(","):
+        label = label.strip().lower()
+        if label:
+            tiers.append((label, parse_duration(label).total_seconds()))
+    tiers.sort(key=lambda tier: tier[1], reverse=True)
+    return tiers
+
+_tiers = _parse_tiers(REMINDER_TIERS)
+
+def _connect():
+    """Open JOBS_DB (its tables are created once, by start())"""
+    return sqlite3.connect(JOBS_DB)
+
+def _create_schema():
+    """Create the reminder tables of JOBS_DB if they don't exist yet"""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS reminder_meta (key TEXT PRIMARY KEY, value TEXT)")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_clients (
+            token TEXT PRIMARY KEY,
+            end_ts REAL NOT NULL,
+            start_ts REAL,
+            status TEXT,
+            name TEXT,
+            email TEXT,
+            profile TEXT,
+            end_label TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_events (
+            token TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            due_ts REAL NOT NULL,
+            PRIMARY KEY (token, kind)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+def _load():
+    """Load the persisted clients and events and build the heap in O(n)"""
+    conn = _connect()
+    c = conn.cursor()
+    _clients.clear()
+    _events.clear()
+    c.execute("SELECT token, end_ts, start_ts, status, name, email, profile, end_label FROM reminder_clients")
+    for row in c.fetchall():
+        _clients[row[0]] = tuple(row[1:])
+    c.execute("SELECT token, kind, due_ts FROM reminder_events")
+    for token, kind, due_ts in c.fetchall():
+        _events.setdefault(token, {})[kind] = due_ts
+    conn.close()
+    _rebuild_heap()
+
+def _rebuild_heap():
+    global _heap
+    _heap = [(due_ts, token, kind) for token, events in _events.items() for kind, due_ts in events.items()]
+    heapq.heapify(_heap)
+
+def _drop_legacy():
+    """Remove what earlier versions of this module left in JOBS_DB"""
+    conn = _connect()
+    # APScheduler's persistent job store (per-client expire:<token> jobs, then the sweeper)
+    conn.execute("DROP TABLE IF EXISTS apscheduler_jobs")
+    # Expiration-only table, replaced by reminder_clients/reminder_events
+    conn.execute("DROP TABLE IF EXISTS expirations")
+    conn.commit()
+    conn.close()
+
+def start(app, chat_id, notify, send=None):
+    """Bind the application, load the pending reminders and start the scheduler
+
+    notify is the bot's coroutine notify(app, chat_id, token, name, email, profile, end).
+    send(chat_id, text) sends digests, e.g. through an outbox; defaults to app.bot.send_message.
+    Call it from Application.post_init so overdue reminders are only sent once the bot is ready,
+    and before any other function of this module: it creates the tables of JOBS_DB.
+    """
+    global _app, _chat_id, _notify, _send
+    _app = app
+    _chat_id = chat_id
+    _notify = notify
+    _send = send or (lambda chat_id, text: app.bot.send_message(chat_id=chat_id, text=text))
+
+    _create_schema()
+    _drop_legacy()
+    _load()
+    scheduler.start()
+    _arm(force=True)
+
+def _arm(force=False):
+    """(Re)schedule the sweeper job for the earliest pending event"""
+    global _armed_at
+    _compact_heap()
+    if not _heap:
+        _armed_at = None
+        if scheduler.get_job(SWEEPER_JOB_ID):
+            scheduler.remove_job(SWEEPER_JOB_ID)
+        return
+
+    next_ts = _heap[0][0]
+    if not force and _armed_at is not None and _armed_at <= next_ts:
+        return  # Already waking up early enough
+
+    scheduler.add_job(
+        _sweep,
+        "date",
+        run_date=datetime.fromtimestamp(next_ts + NOTIFY_COALESCE_SECONDS),
+        id=SWEEPER_JOB_ID,
+        replace_existing=True,
+        misfire_grace_time=None  # Always run, lateness is checked per event
+    )
+    _armed_at = next_ts
+
+def _compact_heap():
+    """Drop stale entries from the top of the heap"""
+    while _heap and not _is_live(*_heap[0]):
+        heapq.heappop(_heap)
+
+def _is_live(due_ts, token, kind):
+    return _events.get(token, {}).get(kind) == due_ts
+
+def _plan(client, now):
+    """Compute the pending events of a client: kind -> due timestamp
+
+    Tiers already in the past are left out, so replanning a client (after
+    /extend or /pay) never repeats a reminder that was already due.
+    """
+    end_ts, start_ts, status = client[0], client[1], client[2]
+    events = {"expired": end_ts}
+    for label, seconds in _tiers:
+        due_ts = end_ts - seconds
+        if due_ts > now:
+            events[f"before:{label}"] = due_ts
+    if UNPAID_REMINDER_DAYS and status == "Unpaid" and start_ts is not None:
+        due_ts = start_ts + UNPAID_REMINDER_DAYS * 86400
+        if now < due_ts < end_ts:
+            events["unpaid"] = due_ts
+    return events
+
+def schedule_reminders(token, name, email, profile, start_date, end_date, status, end_label):
+    """Plan (or replan) every reminder of a token, replacing its previous ones"""
+    now = time.time()
+    client = (end_date.timestamp(), start_date.timestamp() if start_date else None, status, name, email, profile, end_label)
+    events = _plan(client, now)
+
+    conn = _connect()
+    c = conn.cursor()
+    c.execute(
+        "INSERT OR REPLACE INTO reminder_clients (token, end_ts, start_ts, status, name, email, profile, end_label) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (token,) + client
+    )
+    c.execute("DELETE FROM reminder_events WHERE token = ?", (token,))
+    c.executemany(
+        "INSERT INTO reminder_events (token, kind, due_ts) VALUES (?, ?, ?)",
+        [(token, kind, due_ts) for kind, due_ts in events.items()]
+    )
+    conn.commit()
+    conn.close()
+
+    _clients[token] = client
+    _events[token] = events
+    for kind, due_ts in events.items():
+        heapq.heappush(_heap, (due_ts, token, kind))
+    if scheduler.running:
+        _arm()
+
+def cancel_reminders(token):
+    """Forget every pending reminder of a token (its heap entries go stale)"""
+    conn = _connect()
+    conn.execute("DELETE FROM reminder_clients WHERE token = ?", (token,))
+    conn.execute("DELETE FROM reminder_events WHERE token = ?", (token,))
+    conn.commit()
+    conn.close()
+
+    # If one was the next due, the sweeper just wakes up for nothing and re-arms
+    _clients.pop(token, None)
+    _events.pop(token, None)
+
+def sync_client(token, client):
+    """Make the registry match a client row (as returned by get_client_by_token)
+
+    Active subscriptions get one plan of reminders for their current end date
+    and status; burned or already expired ones get none, and so does a token
+    whose row is gone (client is None, e.g. deleted by hand in the sheet).
+    """
+    if client is None:
+        cancel_reminders(token)
+        return
+    name, email, profile, start, end, status, is_burned = (
+        client[2], client[3], client[4], client[5], client[6], client[7], client[9]
+    )
+    end_date = parse_end_date(end)
+    if str(is_burned) == "1" or end_date is None or end_date <= datetime.now():
+        cancel_reminders(token)
+    else:
+        schedule_reminders(token, name, email, profile, parse_end_date(start), end_date, status, end_date.strftime('%d-%m-%Y %H:%M'))
+
+def _pop_due(now):
+    """Pop every live event whose due time has passed"""
+    due = []
+    while _heap and _heap[0][0] <= now:
+        due_ts, token, kind = heapq.heappop(_heap)
+        if _is_live(due_ts, token, kind):
+            events = _events[token]
+            del events[kind]
+            if kind == "expired":
+                client = _clients.pop(token, None)
+                _events.pop(token, None)
+            else:
+                client = _clients.get(token)
+            due.append((due_ts, token, kind, client))
+    return due
+
+async def _sweep():
+    """Sweeper job: send every due reminder, then wait for the next one"""
+    global _armed_at
+    _armed_at = None
+    now = time.time()
+    due = _pop_due(now)
+
+    if due:
+        conn = _connect()
+        c = conn.cursor()
+        c.executemany("DELETE FROM reminder_events WHERE token = ? AND kind = ?", [(token, kind) for _, token, kind, _ in due])
+        c.executemany("DELETE FROM reminder_clients WHERE token = ?", [(token,) for _, token, kind, _ in due if kind == "expired"])
+        conn.commit()
+        conn.close()
+
+    ready = []
+    for due_ts, token, kind, client in due:
+        if client is None:
+            continue
+        if now - due_ts > MISFIRE_GRACE_SECONDS + NOTIFY_COALESCE_SECONDS:
+            logger.warning(f"Reminder {kind} of {token} is {int(now - due_ts)}s late, skipped")
+            continue
+        if kind != "expired" and client[0] <= now:
+            continue  # Already expired: the expiration notice says it all
+        ready.append((token, kind, client))
+
+    if len(ready) == 1 and ready[0][1] == "expired":
+        # A lone expiration keeps the bot's own message format
+        token, _, (end_ts, start_ts, status, name, email, profile, end_label) = ready[0]
+        try:
+            await _notify(_app, _chat_id, token, name, email, profile, end_label)
+        except Exception as e:
+            logger.error(f"Error sending expiration notification for {token}: {e}")
+    elif ready:
+        await _send_digest(ready)
+
+    # Rebuild the heap once stale entries (replanned or cancelled tokens) pile up
+    if len(_heap) > 2 * sum(len(events) for events in _events.values()) + 64:
+        _rebuild_heap()
+    _arm(force=True)
+
+def _section_title(kind, count):
+    if kind == "expired":
+        return f"❌ {count} Subscriptions Expired"
+    if kind == "unpaid":
+        return f"💰 {count} Still Unpaid after {UNPAID_REMINDER_DAYS} days"
+    return f"⏰ {count} Expiring within {kind.split(':', 1)[1]}"
+
+async def _send_digest(ready):
+    """Send the reminders of one window as a single message, split if too long"""
+    # Sections: pre-expiry tiers (longest first), then unpaid, then expired
+    order = [f"before:{label}" for label, _ in _tiers] + ["unpaid", "expired"]
+    lines = []
+    for kind in order:
+        section = [(token, client) for token, k, client in ready if k == kind]
+        if not section:
+            continue
+        lines.append(_section_title(kind, len(section)))
+        lines.append("")
+        for token, (end_ts, start_ts, status, name, email, profile, end_label) in section:
+            lines.append(f"🔑 {token}\n👤 {name} ({email}) – {profile}\n📅 End: {end_label}\n")
+
+    for chunk in split_message("\n".join(lines)):
+        try:
+            await _send(_chat_id, chunk)
+        except Exception as e:
+            logger.error(f"Error sending reminder digest ({len(ready)} reminders): {e}")
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Split a text into chunks Telegram accepts, cutting at line breaks when possible"""
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            # A single line longer than the limit has to be cut
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def needs_seeding():
+    """True until the reminder tables have been filled from the clients table once"""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("SELECT value FROM reminder_meta WHERE key = 'reminders_seeded'")
+    row = c.fetchone()
+    conn.commit()
+    conn.close()
+    return row is None
+
+def seed(clients, burned=()):
+    """Plan the reminders of every active subscription once, from get_all_clients() rows
+
+    burned holds the burned tokens (get_all_clients() rows don't say), which
+    get no reminders, like in sync_client. Only needed the first time (or
+    after deleting JOBS_DB): later starts reuse the persisted plans.
+    """
+    burned = set(burned)
+    now = datetime.now()
+    now_ts = now.timestamp()
+    client_rows = []
+    event_rows = []
+    for token, name, email, profile, start, end, status in clients:
+        if token in burned:
+            continue
+        end_date = parse_end_date(end)
+        # إذا الاشتراك مزال ما انتهى
+        if end_date is None or end_date <= now:
+            continue
+        start_date = parse_end_date(start)
+        client = (end_date.timestamp(), start_date.timestamp() if start_date else None, status, name, email, profile,
+                  end_date.strftime('%d-%m-%Y %H:%M'))
+        events = _plan(client, now_ts)
+        _clients[token] = client
+        _events[token] = events
+        client_rows.append((token,) + client)
+        for kind, due_ts in events.items():
+            heapq.heappush(_heap, (due_ts, token, kind))
+            event_rows.append((token, kind, due_ts))
+
+    conn = _connect()
+    c = conn.cursor()
+    c.executemany(
+        "INSERT OR REPLACE INTO reminder_clients (token, end_ts, start_ts, status, name, email, profile, end_label) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        client_rows
+    )
+    c.executemany("INSERT OR REPLACE INTO reminder_events (token, kind, due_ts) VALUES (?, ?, ?)", event_rows)
+    c.execute("INSERT OR REPLACE INTO reminder_meta (key, value) VALUES ('reminders_seeded', ?)", (now.strftime("%Y-%m-%d %H:%M:%S"),))
+    conn.commit()
+    conn.close()
+
+    if scheduler.running:
+        _arm(force=True)
+    logger.info(f"Planned reminders for {len(client_rows)} active subscriptions from the clients table")
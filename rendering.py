@@ -0,0 +1,188 @@
+# rendering.py
+# Message templates for the bots, rendered as Telegram HTML
+#
+# Replies used to be sent with parse_mode="Markdown" and re-sent as plain text
+# whenever a client name or email contained "_", "*" or "`" (two API calls for
+# one reply). Templates here are parsed once at import time and every value is
+# HTML-escaped when rendered, so a formatted reply always goes through on the
+# first send.
+import html
+import string
+
+# Pass as parse_mode with every rendered message
+PARSE_MODE = "HTML"
+TELEGRAM_MESSAGE_LIMIT = 4096  # Longest text Telegram accepts in one message
+
+_formatter = string.Formatter()
+
+def escape(value):
+    """Escape a value for Telegram HTML (&, < and >)"""
+    return html.escape(str(value), quote=False)
+
+class Raw(str):
+    """An already rendered fragment, inserted into a template as is"""
+
+class Template:
+    """A message template compiled once
+
+    Placeholders use str.format syntax ({name}, {amount:.2f}); values are
+    escaped when rendered unless wrapped in Raw. The literal text of the
+    template is Telegram HTML (<b>, <i>, <code>).
+
+    Usage:
+        EXPIRED = Template("❌ <b>Subscription Expired</b>\\n🔑 <code>{token}</code>")
+        text = EXPIRED.render(token=token)
+    """
+
+    __slots__ = ("source", "_parts")
+
+    def __init__(self, source):
+        self.source = source
+        self._parts = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if field is not None and not field.isidentifier():
+                raise ValueError(f"Unsupported placeholder {{{field}}} in template: {source!r}")
+            self._parts.append((literal, field, spec or "", conversion))
+
+    def render(self, **fields):
+        out = []
+        for literal, field, spec, conversion in self._parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = fields[field]
+            if isinstance(value, Raw):
+                out.append(value)
+                continue
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            out.append(escape(format(value, spec)))
+        return Raw("".join(out))
+
+    def __repr__(self):
+        return f"Template({self.source!r})"
+
+# --- Notifications ------------------------------------------------------
+
+EXPIRED = Template(
+    "❌ <b>Subscription Expired</b>\n\n"
+    "🔑 Token: <code>{token}</code>\n"
+    "👤 {name} ({email}) – {profile}\n"
+    "📅 End: {end}"
+)
+
+# --- /new, /token, /extend, /burn ---------------------------------------
+
+REGISTERED = Template(
+    "✅ <b>Registration successful!</b>\n\n"
+    "👤 {name}\n"
+    "📧 {email}\n"
+    "📺 {profile}\n"
+    "📅 Start: {start}\n"
+    "📅 End: {end}\n"
+    "⏱ Duration: {duration}\n"
+    "💰 Status: Unpaid\n\n"
+    "🔑 <b>Token:</b> <code>{token}</code>"
+)
+
+TOKEN_INFO = Template(
+    "ℹ️ <b>Token Information</b>\n\n"
+    "🔑 Token: <code>{token}</code>\n"
+    "👤 Name: {name}\n"
+    "📧 Email: {email}\n"
+    "🖥️ Profile: {profile}\n"
+    "📅 Start: {start}\n"
+    "📅 End: {end}\n"
+    "{days_left}"
+    "{status_emoji} Status: {status}\n"
+    "{payment}"
+    "{burned}"
+    "🆔 Client ID: {client_id}\n"
+)
+TOKEN_DAYS_LEFT = Template("⏱️ Days left: {days}\n")
+TOKEN_PAYMENT = Template("💵 Payment: {amount} TND\n")
+TOKEN_BURNED = Template("🔥 <b>BURNED</b>: {reason}\n")
+TOKEN_BURN_DATE = Template("📅 Burned on: {date}\n")
+
+EXTENDED = Template(
+    "➕ <b>Abonnement prolongé</b>\n\n"
+    "🔑 Token: <code>{token}</code>\n"
+    "+{days} jours → Nouvelle fin: {end}"
+)
+
+BURNED = Template(
+    "🔥 <b>Token Burned Successfully</b>\n\n"
+    "🔑 Token: <code>{token}</code>\n"
+    "👤 {name} ({email})\n"
+    "📺 Profile: {profile}\n"
+    "📜 Reason: {reason}\n"
+    "📅 Date: {date}"
+)
+
+# --- /admin -------------------------------------------------------------
+
+ADMIN_GRANTED = Template(
+    "✅ <b>Admin Access Granted</b>\n\n"
+    "Hello, {first_name}!\n\n"
+    "User ID: <code>{user_id}</code>\n"
+    "Username: @{username}\n\n"
+    "You have full administrative access to this bot.\n\n"
+    "Current admin IDs: <code>{admin_ids}</code>"
+)
+
+ADMIN_DENIED = Template(
+    "❌ <b>Access Denied</b>\n\n"
+    "Hello, {first_name}!\n\n"
+    "User ID: <code>{user_id}</code>\n"
+    "Username: @{username}\n\n"
+    "This bot is restricted to administrators only.\n\n"
+    "To request access, please contact the bot owner with your User ID shown above."
+)
+
+# Middleware answer to non-admins (auth.py); start adds the contact hint
+ACCESS_DENIED = Template(
+    "⛔ <b>Access Denied</b>\n\n"
+    "User ID: <code>{user_id}</code> (@{username})\n\n"
+    "This bot is restricted to administrators only.\n"
+    "Use /admin to see your status and get your User ID.{contact}"
+)
+ACCESS_DENIED_CONTACT = "\n\nPlease contact the bot owner to request access."
+
+# --- Paginated lists (header + one template per row) --------------------
+
+UNPAID_HEADER = Template("⚠️ <b>Unpaid Clients</b>")
+UNPAID_ROW = Template(
+    "👤 <b>{name}</b> - {profile}\n"
+    "📅 Ends: {end}\n"
+    "🔑 Token: <code>{token}</code>\n\n"
+)
+
+EXPIRING_HEADER = Template("⏳ <b>Clients expiring in {days} days:</b>")
+EXPIRING_ROW = Template(
+    "👤 <b>{name}</b> - {profile}\n"
+    "📅 Ends: {end} - Status: <b>{status}</b>\n"
+    "⏳ Remaining: {remaining}\n"
+    "{payment}"
+    "🔑 Token: <code>{token}</code>\n\n"
+)
+EXPIRING_PAYMENT = Template("💵 Payment: {amount}\n")
+
+SEARCH_HEADER = Template("🔎 <b>Search results for '{query}':</b>")
+SEARCH_HEADER_TOP = Template("🔎 <b>Top {limit} results for '{query}':</b>")  # Results capped at SEARCH_LIMIT
+SEARCH_ROW = Template(
+    "👤 {name} ({profile}) - {status}\n"
+    "🔑 Token: <code>{token}</code>\n\n"
+)
+
+BURNED_HEADER = Template("🔥 <b>Burned Tokens ({count}):</b>")
+BURNED_ROW = Template(
+    "👤 {name}\n"
+    "🔑 Token: <code>{token}</code>\n"
+    "📅 {date}\n"
+    "📜 {reason}\n\n"
+)
+
+# --- /last10 ------------------------------------------------------------
+
+RECENT_HEADER = Template("📃 <b>آخر {count} عمليات:</b>\n\n")
+RECENT_ROW = Template("{i}) {icon} {type} <code>{token}</code> {date} {client} {extra}\n\n")
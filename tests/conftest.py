@@ -0,0 +1,57 @@
+# conftest.py
+# Shared fixtures: a fake spreadsheet for googlesheet.py, a temporary SQLite
+# file for database.py and a temporary JOBS_DB for reminders.py
+import os
+import sys
+
+import pytest
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+# The modules live at the repository root, next to the bots
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import fake_sheets
+import googlesheet
+import reminders
+from benchmark import BURNED_HEADERS, CLIENT_HEADERS, OPERATION_HEADERS, make_dataset
+
+@pytest.fixture
+def sheets(monkeypatch):
+    """Factory: seed a fake spreadsheet with make_dataset(size) and point googlesheet at it"""
+    # Tests measure requests, not the governor: no quota waits
+    monkeypatch.setattr(googlesheet, "_read_window", googlesheet._RequestWindow(10 ** 9))
+    monkeypatch.setattr(googlesheet, "_write_window", googlesheet._RequestWindow(10 ** 9))
+
+    def setup(size=5):
+        clients, burned, operations = make_dataset(size)
+        session = fake_sheets.FakeSheetsSession()
+        session.seed(googlesheet.CLIENTS_SHEET, [CLIENT_HEADERS] + clients)
+        session.seed(googlesheet.BURNED_SHEET, [BURNED_HEADERS] + burned)
+        session.seed(googlesheet.OPERATIONS_SHEET, [OPERATION_HEADERS] + operations)
+        fake_sheets.install(googlesheet, session)
+        googlesheet.init_db()
+        return session
+
+    yield setup
+    # Write the buffered log entries into this test's spreadsheet
+    googlesheet.flush_operations_log()
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database file for database.py"""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "clients.db"))
+    yield database
+    database.close_db()
+
+@pytest.fixture
+def jobs_db(tmp_path, monkeypatch):
+    """reminders.py on an empty JOBS_DB, with its in-memory registry cleared"""
+    monkeypatch.setattr(reminders, "JOBS_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(reminders, "_clients", {})
+    monkeypatch.setattr(reminders, "_events", {})
+    monkeypatch.setattr(reminders, "_heap", [])
+    monkeypatch.setattr(reminders, "_armed_at", None)
+    monkeypatch.setattr(reminders, "scheduler", AsyncIOScheduler())
+    reminders._create_schema()
+    return reminders
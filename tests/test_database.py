@@ -0,0 +1,153 @@
+# test_database.py
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+def user_version(db):
+    return db.get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def names(db):
+    return {row[0] for row in db.get_connection().execute("SELECT name FROM sqlite_master")}
+
+def add(db, token, name, email="x@example.com", profile="P1"):
+    db.add_client(token, name, email, profile, "30")
+
+def tokens(rows):
+    return [row[0] for row in rows]
+
+def test_one_wal_connection_per_thread(db):
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+def test_close_db_reopens_on_next_use(db):
+    conn = db.get_connection()
+    db.close_db()
+    assert db.get_connection() is not conn
+    assert db.get_connection().execute("SELECT 1").fetchone() == (1,)
+
+def test_update_status_reports_unknown_tokens(db):
+    db.init_db()
+    add(db, "T1", "client")
+    assert db.update_status("T1", "Paid", 10) is True
+    assert db.update_status("NOPE", "Paid", 10) is False
+
+def test_stats_counters_follow_writes(db):
+    db.init_db()
+    for i in range(4):
+        add(db, f"T{i}", f"client{i}")
+    db.update_status("T0", "Paid", 10)
+    db.update_status("T1", "Paid", 10)
+    db.burn_token("T2", "sharing")
+    assert db.get_stats() == (4, 2, 2, 0, 1)
+    assert db.get_connection().execute(
+        "SELECT COUNT(*), SUM(status = 'Paid'), SUM(is_burned) FROM clients"
+    ).fetchone() == (4, 2, 1)
+
+def test_expiring_and_expired_use_text_dates(db):
+    db.init_db()
+    add(db, "T1", "soon")
+    soon = (datetime.now() + timedelta(days=1)).strftime(db.DATE_FORMAT)
+    past = (datetime.now() - timedelta(days=1)).strftime(db.DATE_FORMAT)
+    conn = db.get_connection()
+    with conn:
+        conn.execute("UPDATE clients SET end_date = ? WHERE token = 'T1'", (soon,))
+    add(db, "T2", "gone")
+    with conn:
+        conn.execute("UPDATE clients SET end_date = ? WHERE token = 'T2'", (past,))
+    add(db, "T3", "later")
+
+    assert tokens(db.get_expiring_clients(3)) == ["T2", "T1"]
+    assert db.get_stats()[3] == 1
+
+@pytest.fixture(params=[True, False], ids=["fts", "like"])
+def search_db(db, request, monkeypatch):
+    """Database with a few clients, searched through FTS5 or the LIKE fallback"""
+    db.init_db()
+    add(db, "NFX-ANNA", "zed", "zed@example.com")
+    add(db, "NFX-0002", "joanna", "jo@example.com")
+    add(db, "NFX-0003", "anna", "anna@example.com")
+    add(db, "NFX-0004", "bob", "bob@example.com", profile="Anna's room")
+    add(db, "NFX-0005", "carl", "carl@example.com")
+    monkeypatch.setattr(db, "_fts_enabled", request.param)
+    return db
+
+def test_search_ranks_exact_token_then_prefixes(search_db):
+    rows = search_db.search_clients("nfx-anna")
+    assert tokens(rows)[0] == "NFX-ANNA"
+
+    rows = search_db.search_clients("anna")
+    found = tokens(rows)
+    assert set(found) == {"NFX-ANNA", "NFX-0002", "NFX-0003", "NFX-0004"}
+    if not search_db._fts_enabled:
+        return  # The LIKE scan only puts the exact token first
+    # Prefix of a field (name, email or profile) before a match inside a field
+    assert found.index("NFX-0003") < found.index("NFX-0002")
+    assert found.index("NFX-0004") < found.index("NFX-0002")
+
+def test_search_limit_and_misses(search_db):
+    assert len(search_db.search_clients("nfx", limit=2)) == 2
+    assert search_db.search_clients("nobody") == []
+
+def test_search_treats_like_wildcards_literally(search_db):
+    assert search_db.search_clients("%") == []
+    assert search_db.search_clients("_") == []
+
+def test_short_queries_scan(search_db):
+    assert "NFX-0005" in tokens(search_db.search_clients("rl"))
+
+def test_broad_queries_put_the_exact_token_first(search_db, monkeypatch):
+    monkeypatch.setattr(search_db, "SEARCH_RANK_MAX_MATCHES", 2)
+    rows = search_db.search_clients("NFX-0005", limit=3)
+    assert tokens(rows) == ["NFX-0005"]
+    rows = search_db.search_clients("nfx", limit=3)
+    assert len(rows) == 3
+
+def test_new_database_gets_every_migration(db):
+    db.init_db()
+    assert user_version(db) == db.SCHEMA_VERSION == 4
+    assert {"clients", "burned_tokens", "client_stats", "clients_fts",
+            "idx_clients_status", "idx_clients_is_burned", "idx_clients_end_date"} <= names(db)
+    assert db._fts_enabled
+    assert db.get_stats() == (0, 0, 0, 0, 0)
+
+def test_up_to_date_database_is_not_migrated_again(db, capsys):
+    db.init_db()
+    capsys.readouterr()
+    db.init_db()
+    assert "Migrating" not in capsys.readouterr().out
+    assert user_version(db) == 4
+
+def test_unversioned_database_is_upgraded(db):
+    # A clients table from before the payment and burn columns, with bare end dates
+    conn = sqlite3.connect(db.DB_NAME)
+    conn.execute("""
+        CREATE TABLE clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT UNIQUE, name TEXT, email TEXT,
+            profile TEXT, start_date TEXT, end_date TEXT, status TEXT
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO clients (token, name, email, profile, start_date, end_date, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [("OLD-1", "alice", "a@example.com", "P1", "2024-01-01", "2024-02-01", "Paid"),
+         ("OLD-2", "bob", "b@example.com", "P2", "2024-01-01 10:00:00", "2099-01-01 10:00:00", "Unpaid")]
+    )
+    conn.commit()
+    conn.close()
+
+    db.init_db()
+    assert user_version(db) == 4
+    columns = {row[1] for row in db.get_connection().execute("PRAGMA table_info(clients)")}
+    assert {"payment_amount", "is_burned", "burn_reason", "burn_date"} <= columns
+    assert db.get_client_by_token("OLD-1")[6] == "2024-02-01 00:00:00"
+    # Counters and search index cover the rows that were already there
+    assert db.get_stats() == (2, 1, 1, 1, 0)
+    assert tokens(db.search_clients("alic")) == ["OLD-1"]
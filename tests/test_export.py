@@ -0,0 +1,31 @@
+# test_export.py
+import csv
+import io
+
+import export
+
+def rows(count):
+    for i in range(count):
+        yield (f"NFX-{i}", f"client {i}", f"c{i}@example.com", "P1", "2026-01-01 00:00:00", "2026-02-01 00:00:00", "Paid")
+
+def read_csv(buffer):
+    return list(csv.reader(io.TextIOWrapper(buffer, encoding="utf-8", newline="")))
+
+def test_csv_export_is_named_and_rewound():
+    with export.export_to_csv(rows(3)) as document:
+        assert document.name.startswith("netflix_clients_") and document.name.endswith(".csv")
+        assert document.tell() == 0
+        lines = read_csv(document)
+    assert lines[0] == export.EXPORT_HEADERS
+    assert lines[1:] == [list(row) for row in rows(3)]
+
+def test_small_exports_stay_in_memory():
+    with export.export_to_csv(rows(10)) as document:
+        assert not document._rolled
+
+def test_big_exports_spill_to_an_unnamed_file(monkeypatch):
+    monkeypatch.setattr(export, "SPOOL_MAX_BYTES", 1024)
+    with export.export_to_csv(rows(200)) as document:
+        assert document._rolled
+        assert document.name.endswith(".csv")  # Still the document name, not a descriptor
+        assert len(read_csv(document)) == 201
@@ -0,0 +1,275 @@
+# test_googlesheet.py
+# googlesheet.py against fake_sheets.py: replica sync, row numbers after
+# manual edits, /search index, request window and retry policy
+import threading
+
+import gspread
+import pytest
+
+import googlesheet as g
+
+STATUS = g.SHEET_HEADERS[g.CLIENTS_SHEET].index("status")
+PAYMENT = g.SHEET_HEADERS[g.CLIENTS_SHEET].index("payment_amount")
+NAME = g.SHEET_HEADERS[g.CLIENTS_SHEET].index("name")
+
+def clients_rows(session):
+    """The clients sheet as stored by the fake, header excluded"""
+    return session.sheets[g.CLIENTS_SHEET].values[1:]
+
+def edit_by_hand(session, change):
+    """Change the clients sheet outside the bot, bumping its modifiedTime"""
+    change(session.sheets[g.CLIENTS_SHEET].values)
+    session._modified += 1
+
+def hand_row(client_id, token, name="hand"):
+    return [str(client_id), token, name, "h@example.com", "P1", "2026-01-01 00:00:00",
+            "2099-01-01 00:00:00", "Unpaid", "0", "0", "", ""]
+
+def replica_matches_sheet(session):
+    g._sync_clients(force=True)
+    return [row[:len(g.SHEET_HEADERS[g.CLIENTS_SHEET])] for row in g._clients_rows] == clients_rows(session)
+
+@pytest.fixture
+def no_sync_interval(monkeypatch):
+    # Every read checks the sheet, as if SYNC_MIN_INTERVAL had passed
+    monkeypatch.setattr(g, "SYNC_MIN_INTERVAL", 0)
+
+# --- Incremental sync -----------------------------------------------------
+
+def test_unchanged_sheet_costs_one_request(sheets, no_sync_interval):
+    session = sheets(20)
+    g.get_all_clients()
+    session.reset_counters()
+    assert len(g.get_all_clients()) == 20
+    assert session.calls["drive.get"] == 1
+    assert session.total_calls() == 1
+
+def test_rows_appended_by_hand_are_fetched(sheets, no_sync_interval):
+    session = sheets(20)
+    g.get_all_clients()
+    edit_by_hand(session, lambda values: values.append(hand_row(21, "HAND-1")))
+    session.reset_counters()
+
+    tokens = [row[0] for row in g.get_all_clients()]
+    assert tokens[-1] == "HAND-1" and len(tokens) == 21
+    assert session.calls["values.batchGet"] == 1
+    assert session.calls["values.get"] == 0  # No full read
+    assert g.get_stats()[0] == 21
+
+def test_rows_deleted_by_hand_trigger_a_full_read(sheets, no_sync_interval):
+    session = sheets(20)
+    g.get_all_clients()
+    edit_by_hand(session, lambda values: values.pop(3))
+    assert len(g.get_all_clients()) == 19
+    assert replica_matches_sheet(session)
+
+def test_stats_counters_match_a_recount(sheets):
+    session = sheets(50)
+    rows = clients_rows(session)
+    g.update_status(rows[0][1], "Paid", 10)
+    g.burn_token(rows[1][1], "sharing")
+    g.add_client("NEW-1", "n", "e@example.com", "P1", "30")
+
+    rows = clients_rows(session)
+    expected_paid = sum(row[STATUS] == "Paid" for row in rows)
+    total, paid, unpaid, _, burned = g.get_stats()
+    assert (total, paid, unpaid) == (len(rows), expected_paid, len(rows) - expected_paid)
+    assert burned == sum(row[9] == "1" for row in rows)
+
+def test_point_lookups_see_cells_edited_by_hand(sheets, no_sync_interval):
+    session = sheets(5)
+    token = clients_rows(session)[2][1]
+    status = "Unpaid" if g.get_client_by_token(token)[STATUS] == "Paid" else "Paid"
+    edit_by_hand(session, lambda values: values[3].__setitem__(STATUS, status))
+
+    assert g.get_client_by_token(token)[STATUS] == status
+    assert g.get_stats()[1] == sum(row[STATUS] == "Paid" for row in clients_rows(session))
+
+def test_sync_reads_run_outside_the_write_lock(sheets, monkeypatch):
+    session = sheets(5)
+    token = clients_rows(session)[2][1]
+    g._sync_clients(force=True)
+    reading, release = threading.Event(), threading.Event()
+    get_all_values = gspread.Worksheet.get_all_values
+
+    def slow_read(self, *args, **kwargs):
+        values = get_all_values(self, *args, **kwargs)
+        if not reading.is_set():
+            reading.set()
+            release.wait(5)
+        return values
+
+    monkeypatch.setattr(gspread.Worksheet, "get_all_values", slow_read)
+    syncing = threading.Thread(target=g._load_clients)
+    syncing.start()
+    assert reading.wait(5)
+
+    # The full read is in flight: lookups and writes go on meanwhile
+    assert g.get_client_by_token(token)[1] == token
+    g.add_client("NEW-1", "n", "e@example.com", "P1", "30")
+    release.set()
+    syncing.join(5)
+
+    # The read from before the append was thrown away, not applied
+    assert "NEW-1" in g._token_index
+    assert replica_matches_sheet(session)
+
+# --- Row numbers after manual edits ---------------------------------------
+
+def test_add_client_after_a_row_added_by_hand(sheets):
+    session = sheets(5)
+    g._sync_clients(force=True)
+    edit_by_hand(session, lambda values: values.append(hand_row(6, "HAND-1")))
+
+    g.add_client("NEW-1", "n", "e@example.com", "P1", "30")
+    g.update_status("NEW-1", "Paid", 9)
+
+    rows = clients_rows(session)
+    assert [row[:2] for row in rows[-2:]] == [["6", "HAND-1"], ["7", "NEW-1"]]
+    assert rows[-2][STATUS] == "Unpaid"
+    assert (rows[-1][STATUS], rows[-1][PAYMENT]) == ("Paid", "9")
+    assert replica_matches_sheet(session)
+
+def test_add_client_rejects_a_token_added_by_hand(sheets):
+    session = sheets(5)
+    g._sync_clients(force=True)
+    edit_by_hand(session, lambda values: values.append(hand_row(6, "HAND-1")))
+    with pytest.raises(ValueError):
+        g.add_client("HAND-1", "n", "e@example.com", "P1", "30")
+
+def test_write_after_a_row_deleted_by_hand(sheets):
+    session = sheets(5)
+    g._sync_clients(force=True)  # The next lookup reuses this sync
+    target = clients_rows(session)[2][1]
+    before = {row[1]: list(row) for row in clients_rows(session)}
+    edit_by_hand(session, lambda values: values.pop(1))
+
+    assert g.update_status(target, "Paid", 7) is not False
+
+    for row in clients_rows(session):
+        if row[1] == target:
+            assert (row[STATUS], row[PAYMENT]) == ("Paid", "7")
+        else:
+            assert row == before[row[1]]  # Nobody else's row was written
+    assert replica_matches_sheet(session)
+
+def test_writes_report_a_row_deleted_before_the_write(sheets, monkeypatch):
+    session = sheets(5)
+    target = clients_rows(session)[2][1]
+    g._sync_clients(force=True)
+    find_row_by_token = g._find_row_by_token
+
+    def deleted_after_lookup(token):
+        found = find_row_by_token(token)
+        edit_by_hand(session, lambda values: values.__setitem__(slice(1, None), [row for row in values[1:] if row[1] != token]))
+        return found
+
+    monkeypatch.setattr(g, "_find_row_by_token", deleted_after_lookup)
+    logged = len(session.sheets[g.OPERATIONS_SHEET].values)
+    assert g.update_status(target, "Paid", 7) is False
+    assert g.extend_subscription(target, 5) is None
+    g.flush_operations_log()
+    assert len(session.sheets[g.OPERATIONS_SHEET].values) == logged  # No PAID or EXT entry
+
+def test_appended_row_number():
+    assert g._appended_row_number({"updates": {"updatedRange": "'clients'!A12:L12"}}) == 12
+    assert g._appended_row_number({"updates": {"updatedRange": "clients!A7"}}) == 7
+    assert g._appended_row_number({}) is None
+
+# --- /search index ---------------------------------------------------------
+
+def scan(session, query):
+    """Tokens of the rows a full scan finds"""
+    q = query.lower()
+    return {row[1] for row in clients_rows(session)
+            if any(q in field.lower() for field in row[1:5])}
+
+def test_search_matches_a_scan(sheets):
+    session = sheets(200)
+    for query in ("client_1", "PROFILE3", "nfx-b000150", "@example", "zz"):
+        found = {row[0] for row in g.search_clients(query, limit=1000)}
+        assert found == scan(session, query), query
+
+def test_search_puts_the_exact_token_first(sheets):
+    session = sheets(200)
+    token = clients_rows(session)[150][1]
+    assert g.search_clients(token.lower())[0][0] == token
+
+def test_full_reload_keeps_the_search_index(sheets):
+    session = sheets(200)
+    g.search_clients("client_1")
+    with g._write_lock:
+        g._load_clients()
+    assert len(g._search_texts) == 200  # Nothing to index again
+
+    edit_by_hand(session, lambda values: values[150].__setitem__(NAME, "renamed"))
+    edit_by_hand(session, lambda values: values.append(hand_row(201, "HAND-1", "renamed too")))
+    with g._write_lock:
+        g._load_clients()
+    assert len(g._search_texts) == 149  # Cut at the first changed row
+
+    found = {row[0] for row in g.search_clients("renamed")}
+    assert found == scan(session, "renamed") == {clients_rows(session)[149][1], "HAND-1"}
+    assert {row[0] for row in g.search_clients("client_15", limit=1000)} == scan(session, "client_15")
+
+# --- Request governor ---------------------------------------------------------
+
+def test_request_window_never_exceeds_the_quota():
+    window = g._RequestWindow(10)
+    slots = [window.reserve() for _ in range(35)]
+    assert slots == sorted(slots)
+    for slot in slots:
+        in_window = [other for other in slots if slot - g.QUOTA_WINDOW_SECONDS < other <= slot]
+        assert len(in_window) <= 10
+    # Booked in bursts one window apart, not refilled continuously
+    assert slots[10] - slots[0] >= g.QUOTA_WINDOW_SECONDS
+
+def test_refunded_slots_are_given_to_the_next_request():
+    window = g._RequestWindow(2)
+    first, second = window.reserve(), window.reserve()
+    window.refund(second)
+    assert window.reserve() - first < 1
+
+@pytest.mark.parametrize("method, endpoint, idempotent", [
+    ("get", "https://sheets.googleapis.com/v4/spreadsheets/ID/values/clients", True),
+    ("put", "https://sheets.googleapis.com/v4/spreadsheets/ID/values/clients%21A2", True),
+    ("post", "https://sheets.googleapis.com/v4/spreadsheets/ID/values:batchUpdate", True),
+    ("post", "https://sheets.googleapis.com/v4/spreadsheets/ID/values/clients:clear", True),
+    ("post", "https://sheets.googleapis.com/v4/spreadsheets/ID/values/clients:append", False),
+    ("post", "https://sheets.googleapis.com/v4/spreadsheets/ID:batchUpdate", False),
+])
+def test_idempotent_requests(method, endpoint, idempotent):
+    assert g._is_idempotent(method, endpoint) is idempotent
+
+class FakeResponse:
+    def __init__(self, code):
+        self.status_code = code
+        self.text = ""
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": "fake", "status": "FAKE"}}
+
+@pytest.mark.parametrize("endpoint, code, attempts", [
+    ("ID/values/clients:append", 500, 1),
+    ("ID/values/clients:append", 429, 2),
+    ("ID/values:batchUpdate", 503, 2),
+])
+def test_appends_only_retry_429(monkeypatch, endpoint, code, attempts):
+    monkeypatch.setattr(g, "BACKOFF_BASE", 0.001)
+    calls = []
+
+    def request(self, method, url, *args, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            raise gspread.exceptions.APIError(FakeResponse(code))
+        return "ok"
+
+    monkeypatch.setattr(gspread.http_client.HTTPClient, "request", request)
+    client = g._GovernedHTTPClient.__new__(g._GovernedHTTPClient)
+    url = "https://sheets.googleapis.com/v4/spreadsheets/" + endpoint
+    if attempts == 1:
+        with pytest.raises(gspread.exceptions.APIError):
+            client.request("post", url)
+    else:
+        assert client.request("post", url) == "ok"
+    assert len(calls) == attempts
@@ -0,0 +1,58 @@
+# test_locks.py
+import asyncio
+
+from locks import KeyedLocks
+
+def test_same_key_is_serialized():
+    locks = KeyedLocks()
+    events = []
+
+    async def handler(key, name):
+        async with locks(key):
+            events.append(f"{name} in")
+            await asyncio.sleep(0.01)
+            events.append(f"{name} out")
+
+    async def main():
+        await asyncio.gather(handler("T1", "a"), handler("T1", "b"))
+
+    asyncio.run(main())
+    assert events == ["a in", "a out", "b in", "b out"]
+
+def test_different_keys_run_concurrently():
+    locks = KeyedLocks()
+    events = []
+
+    async def handler(key):
+        async with locks(key):
+            events.append(f"{key} in")
+            await asyncio.sleep(0.01)
+            events.append(f"{key} out")
+
+    async def main():
+        await asyncio.gather(handler("T1"), handler("T2"))
+
+    asyncio.run(main())
+    assert events[:2] == ["T1 in", "T2 in"]
+
+def test_unused_locks_are_dropped():
+    locks = KeyedLocks()
+
+    async def hold(locks, key):
+        async with locks(key):
+            pass
+
+    async def main():
+        async with locks("T1"):
+            waiter = asyncio.ensure_future(hold(locks, "T1"))
+            await asyncio.sleep(0)
+            assert len(locks) == 1
+        await waiter
+        try:
+            async with locks("T2"):
+                raise ValueError
+        except ValueError:
+            pass
+
+    asyncio.run(main())
+    assert len(locks) == 0
@@ -0,0 +1,109 @@
+# test_outbox.py
+import asyncio
+import io
+import time
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+import outbox
+from outbox import BULK, INTERACTIVE, Outbox
+
+class FakeBot:
+    """Records what reaches Telegram; raises the queued errors first"""
+
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+    async def send_document(self, chat_id, document, **kwargs):
+        data = document.read()  # Consumes the stream, like an upload
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, data, time.monotonic()))
+        return len(data)
+
+@pytest.fixture(autouse=True)
+def fast_chats(monkeypatch):
+    # Retries go to the same chat: don't wait a second between attempts
+    monkeypatch.setattr(outbox, "CHAT_MESSAGES_PER_SECOND", 1000)
+
+def run(bot, scenario):
+    async def main():
+        box = Outbox()
+        box.start(bot)
+        try:
+            return await scenario(box)
+        finally:
+            await box.stop(timeout=1)
+    return asyncio.run(main())
+
+def test_interactive_messages_go_first():
+    bot = FakeBot()
+
+    async def scenario(box):
+        # Queued together, before the dispatcher gets to run
+        await asyncio.gather(
+            box.send(1, "bulk 1", priority=BULK),
+            box.send(2, "bulk 2", priority=BULK),
+            box.send(3, "reply 3", priority=INTERACTIVE),
+            box.send(4, "reply 4", priority=INTERACTIVE),
+        )
+
+    run(bot, scenario)
+    assert [text for _, text, _ in bot.sent] == ["reply 3", "reply 4", "bulk 1", "bulk 2"]
+
+def test_messages_to_one_chat_are_spaced(monkeypatch):
+    monkeypatch.setattr(outbox, "CHAT_MESSAGES_PER_SECOND", 20)
+    bot = FakeBot()
+
+    async def scenario(box):
+        await asyncio.gather(*[box.send(1, f"m{i}") for i in range(3)])
+
+    run(bot, scenario)
+    times = [sent_at for _, _, sent_at in bot.sent]
+    assert [text for _, text, _ in bot.sent] == ["m0", "m1", "m2"]
+    assert all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:]))
+
+def test_retry_after_pauses_and_resends_the_whole_document():
+    bot = FakeBot(errors=[RetryAfter(0.1)])
+    document = io.BytesIO(b"token,name\nNFX-1,client\n")
+
+    async def scenario(box):
+        started = time.monotonic()
+        result = await box.call(1, "send_document", INTERACTIVE, document=document)
+        return result, time.monotonic() - started, box.metrics()
+
+    result, elapsed, metrics = run(bot, scenario)
+    assert result == len(b"token,name\nNFX-1,client\n")
+    assert bot.sent[0][1] == b"token,name\nNFX-1,client\n"
+    assert elapsed >= 0.1
+    assert metrics["retry_after"] == 1 and metrics["sent"] == 1
+
+def test_retry_after_gives_up_after_max_retries():
+    bot = FakeBot(errors=[RetryAfter(0.01)] * (outbox.MAX_RETRIES + 1))
+
+    async def scenario(box):
+        with pytest.raises(RetryAfter):
+            await box.send(1, "hello")
+        return box.metrics()
+
+    metrics = run(bot, scenario)
+    assert metrics["failed"] == 1
+    assert bot.sent == []
+
+def test_other_errors_reach_the_caller():
+    bot = FakeBot(errors=[BadRequest("Message is too long")])
+
+    async def scenario(box):
+        with pytest.raises(BadRequest):
+            await box.send(1, "hello")
+        return await box.send(1, "again")
+
+    assert run(bot, scenario) == "again"
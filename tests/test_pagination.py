@@ -0,0 +1,141 @@
+# test_pagination.py
+import asyncio
+from types import SimpleNamespace
+
+import pagination
+from pagination import Paginator
+from rendering import TELEGRAM_MESSAGE_LIMIT
+
+class RecordingOutbox:
+    """Stands in for Outbox: records every call instead of sending it"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, chat_id, method, **kwargs):
+        self.calls.append((method, kwargs))
+
+def update_for(chat_id=1):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id))
+
+def press(pages, data):
+    """Press an inline button; returns the answer() arguments"""
+    answers = []
+
+    async def answer(*args, **kwargs):
+        answers.append((args, kwargs))
+
+    query = SimpleNamespace(data=data, answer=answer, message=SimpleNamespace(chat_id=1, message_id=42))
+    asyncio.run(pages.handle_callback(SimpleNamespace(callback_query=query), None))
+    return answers
+
+def buttons(kwargs):
+    markup = kwargs["reply_markup"]
+    if markup is None:
+        return []
+    return [(button.text, button.callback_data) for button in markup.inline_keyboard[0]]
+
+def render(row):
+    return f"{row}\n"
+
+def send(pages, query, rows):
+    asyncio.run(pages.send(update_for(), query, rows, render, "Header"))
+
+def test_first_page_and_next_button():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    send(pages, ("unpaid",), [f"row{i}" for i in range(25)])
+
+    method, kwargs = outbox.calls[-1]
+    assert method == "send_message"
+    assert "row0\n" in kwargs["text"] and "row9\n" in kwargs["text"] and "row10" not in kwargs["text"]
+    assert "1–10 / 25" in kwargs["text"]
+    assert buttons(kwargs) == [("Next ➡️", "pg:1:10")]
+
+def test_pages_come_from_the_snapshot():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    rows = [f"row{i}" for i in range(25)]
+    send(pages, ("unpaid",), rows)
+    rows.clear()  # The caller's list is not the snapshot
+
+    press(pages, "pg:1:20")
+    method, kwargs = outbox.calls[-1]
+    assert method == "edit_message_text" and kwargs["message_id"] == 42
+    assert "row20\n" in kwargs["text"] and "row24\n" in kwargs["text"]
+    assert "21–25 / 25" in kwargs["text"]
+    assert buttons(kwargs) == [("⬅️ Prev", "pg:1:10")]
+
+def test_short_list_has_no_buttons():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    send(pages, ("burned",), ["a", "b"])
+    _, kwargs = outbox.calls[-1]
+    assert kwargs["reply_markup"] is None
+    assert "/" not in kwargs["text"]
+
+def test_same_query_refreshes_its_snapshot():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    send(pages, ("search", "x"), [f"old{i}" for i in range(15)])
+    send(pages, ("search", "x"), [f"new{i}" for i in range(15)])
+    send(pages, ("search", "y"), [f"other{i}" for i in range(15)])
+
+    # Buttons of the first message page through the fresh results
+    press(pages, "pg:1:10")
+    _, kwargs = outbox.calls[-1]
+    assert "new10" in kwargs["text"] and "old" not in kwargs["text"]
+    assert buttons(outbox.calls[-2][1]) == [("Next ➡️", "pg:2:10")]
+
+def test_expired_snapshot(monkeypatch):
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10, ttl=60)
+    send(pages, ("unpaid",), [f"row{i}" for i in range(25)])
+
+    now = pagination.time.monotonic()
+    monkeypatch.setattr(pagination, "time", SimpleNamespace(monotonic=lambda: now + 61))
+    answers = press(pages, "pg:1:10")
+    assert "expired" in answers[0][0][0]
+    assert outbox.calls[-1][0] == "send_message"  # Nothing edited
+
+def test_oldest_snapshots_are_evicted(monkeypatch):
+    monkeypatch.setattr(pagination, "MAX_SNAPSHOTS", 3)
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    for i in range(5):
+        send(pages, ("search", str(i)), [f"row{j}" for j in range(15)])
+
+    assert "expired" in press(pages, "pg:1:10")[0][0][0]
+    press(pages, "pg:5:10")
+    assert outbox.calls[-1][0] == "edit_message_text"
+
+def test_page_stops_before_the_message_limit():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    send(pages, ("all",), ["x" * 1000 for _ in range(10)])
+
+    _, kwargs = outbox.calls[-1]
+    assert len(kwargs["text"]) <= TELEGRAM_MESSAGE_LIMIT
+    shown = kwargs["text"].count("x" * 1000)
+    assert shown < 10
+    assert buttons(kwargs) == [("Next ➡️", f"pg:1:{shown}")]
+
+def test_prev_goes_back_to_the_start_of_a_short_page():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    send(pages, ("all",), ["x" * 1000 for _ in range(12)])
+    second = buttons(outbox.calls[-1][1])[0][1]
+
+    press(pages, second)
+    third = buttons(outbox.calls[-1][1])[1][1]
+    press(pages, third)
+    # Pages hold 4 rows here: Prev leads to the page shown before, not 10 rows back
+    assert buttons(outbox.calls[-1][1])[0] == ("⬅️ Prev", second)
+
+def test_prev_from_a_page_not_reached_through_next():
+    outbox = RecordingOutbox()
+    pages = Paginator(outbox, page_size=10)
+    send(pages, ("all",), ["x" * 1000 for _ in range(12)])
+    press(pages, "pg:1:6")  # e.g. a button of an older message
+    # The page before holds row 5: the one paging from row 0 would show (rows 4-7)
+    assert buttons(outbox.calls[-1][1])[0] == ("⬅️ Prev", "pg:1:4")
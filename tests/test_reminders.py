@@ -0,0 +1,162 @@
+# test_reminders.py
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import reminders
+
+DAY = 86400
+
+@pytest.fixture
+def tiers(monkeypatch):
+    monkeypatch.setattr(reminders, "_tiers", reminders._parse_tiers("3d,1d,1h"))
+    monkeypatch.setattr(reminders, "UNPAID_REMINDER_DAYS", 3)
+
+@pytest.fixture
+def sent(jobs_db, monkeypatch):
+    """Messages sent by the sweeper, as (kind, text) pairs"""
+    messages = []
+
+    async def send(chat_id, text):
+        messages.append(("digest", text))
+
+    async def notify(app, chat_id, token, name, email, profile, end):
+        messages.append(("expired", token))
+
+    monkeypatch.setattr(reminders, "_send", send)
+    monkeypatch.setattr(reminders, "_notify", notify)
+    monkeypatch.setattr(reminders, "_chat_id", 1)
+    return messages
+
+def sweep_at(monkeypatch, timestamp):
+    """Run the sweeper as if the clock said timestamp"""
+    monkeypatch.setattr(reminders, "time", SimpleNamespace(time=lambda: timestamp))
+    asyncio.run(reminders._sweep())
+
+def schedule(token, start, end, status="Unpaid"):
+    reminders.schedule_reminders(token, f"name {token}", f"{token}@example.com", "P1", start, end, status, end.strftime("%d-%m-%Y %H:%M"))
+
+@pytest.mark.parametrize("text, expected", [
+    ("30", timedelta(days=30)),
+    ("7d", timedelta(days=7)),
+    ("12H", timedelta(hours=12)),
+    ("45m", timedelta(minutes=45)),
+    (5, timedelta(days=5)),
+])
+def test_parse_duration(text, expected):
+    assert reminders.parse_duration(text) == expected
+
+def test_parse_tiers_longest_first():
+    assert reminders._parse_tiers(" 1h, 3d,,1d ") == [("3d", 3 * DAY), ("1d", DAY), ("1h", 3600)]
+
+def test_plan_drops_past_tiers(tiers):
+    now = time.time()
+    client = (now + 2 * DAY, now - DAY, "Paid", "n", "e", "p", "end")
+    events = reminders._plan(client, now)
+    # 3d before the end is already past: replanning never repeats it
+    assert events == {"expired": now + 2 * DAY, "before:1d": now + DAY, "before:1h": now + 2 * DAY - 3600}
+
+def test_plan_unpaid_reminder(tiers):
+    now = time.time()
+    unpaid = (now + 10 * DAY, now - DAY, "Unpaid", "n", "e", "p", "end")
+    assert reminders._plan(unpaid, now)["unpaid"] == now + 2 * DAY
+    paid = (now + 10 * DAY, now - DAY, "Paid", "n", "e", "p", "end")
+    assert "unpaid" not in reminders._plan(paid, now)
+    # Not worth a reminder when the subscription ends first
+    short = (now + DAY, now - DAY, "Unpaid", "n", "e", "p", "end")
+    assert "unpaid" not in reminders._plan(short, now)
+
+def test_schedule_is_persisted_and_reloaded(tiers, jobs_db):
+    now = datetime.now()
+    schedule("T1", now, now + timedelta(days=5))
+    reminders.cancel_reminders("T1")
+    schedule("T2", now, now + timedelta(days=5), status="Paid")
+    expected = dict(reminders._events)
+
+    reminders._clients.clear()
+    reminders._events.clear()
+    reminders._load()
+    assert reminders._events == expected
+    assert set(reminders._events) == {"T2"}
+    live = sorted(entry for entry in reminders._heap if reminders._is_live(*entry))
+    assert live == sorted((due_ts, "T2", kind) for kind, due_ts in expected["T2"].items())
+
+def test_late_events_are_skipped(tiers, sent, monkeypatch):
+    monkeypatch.setattr(reminders, "MISFIRE_GRACE_SECONDS", 60)
+    now = datetime.now()
+    schedule("A", now, now + timedelta(minutes=30))
+    sweep_at(monkeypatch, now.timestamp() + 2 * DAY)
+    assert sent == []
+    assert reminders._events == {}
+
+def test_seed_once(tiers, jobs_db):
+    now = datetime.now()
+    fmt = "%Y-%m-%d %H:%M:%S"
+    end = now + timedelta(days=5)
+    clients = [
+        ("T1", "n1", "e1", "P1", now.strftime(fmt), end.strftime(fmt), "Unpaid"),
+        ("T2", "n2", "e2", "P2", now.strftime(fmt), (now - timedelta(days=1)).strftime(fmt), "Paid"),
+        ("T3", "n3", "e3", "P3", now.strftime(fmt), end.strftime(fmt), "Paid"),
+    ]
+    assert reminders.needs_seeding()
+    reminders.seed(clients, burned=["T3"])
+    assert not reminders.needs_seeding()
+    assert set(reminders._events) == {"T1"}
+    # Same label as sync_client and schedule_reminders
+    assert reminders._clients["T1"][-1] == end.strftime("%d-%m-%Y %H:%M")
+
+def test_sync_client_row_gone(tiers, jobs_db):
+    now = datetime.now()
+    schedule("T1", now, now + timedelta(days=5))
+    reminders.sync_client("T1", None)
+    assert "T1" not in reminders._events and "T1" not in reminders._clients
+
+def test_due_events_coalesce_into_one_digest(tiers, sent, monkeypatch):
+    now = datetime.now()
+    schedule("A", now, now + timedelta(days=2))
+    schedule("B", now, now + timedelta(days=2, seconds=10))
+    schedule("C", now, now + timedelta(hours=12))
+
+    sweep_at(monkeypatch, now.timestamp() + DAY + 30)
+
+    # A and B reach their 1d tier, C expires (its 1h tier is not sent on top)
+    assert len(sent) == 1
+    kind, text = sent[0]
+    assert kind == "digest"
+    assert "2 Expiring within 1d" in text and "1 Subscriptions Expired" in text
+    assert text.index("Expiring") < text.index("Expired")
+    assert "1h" not in text
+    assert "C" not in reminders._clients
+
+    conn = sqlite3.connect(reminders.JOBS_DB)
+    remaining = {row[0] for row in conn.execute("SELECT DISTINCT token FROM reminder_events")}
+    conn.close()
+    assert remaining == {"A", "B"}
+
+def test_lone_expiration_uses_the_bot_message(tiers, sent, monkeypatch):
+    now = datetime.now()
+    schedule("A", now, now + timedelta(minutes=30))
+    sweep_at(monkeypatch, now.timestamp() + 1800)
+    assert sent == [("expired", "A")]
+
+def test_split_message_short_text():
+    assert reminders.split_message("hello\nworld") == ["hello\nworld"]
+
+def test_split_message_cuts_at_line_breaks():
+    lines = [f"line {i} " + "x" * 40 for i in range(100)]
+    text = "\n".join(lines)
+    chunks = reminders.split_message(text, limit=500)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "\n".join(chunks) == text
+
+def test_split_message_cuts_overlong_lines():
+    text = "head\n" + "y" * 1200 + "\ntail"
+    chunks = reminders.split_message(text, limit=500)
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert chunks[0] == "head" and len(chunks) == 4
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
@@ -0,0 +1,29 @@
+# test_rendering.py
+import pytest
+
+from rendering import Raw, Template, escape
+
+def test_escape():
+    assert escape("a_b *c* <i>&</i>") == "a_b *c* &lt;i&gt;&amp;&lt;/i&gt;"
+    assert escape(12.5) == "12.5"
+
+def test_values_are_escaped_but_not_the_template():
+    template = Template("<b>{name}</b> <code>{token}</code>")
+    text = template.render(name="<script>&", token="NFX_1*")
+    assert text == "<b>&lt;script&gt;&amp;</b> <code>NFX_1*</code>"
+
+def test_format_spec_is_applied_before_escaping():
+    assert Template("{amount:.2f} TND").render(amount=3) == "3.00 TND"
+    assert Template("{name!r}").render(name="<a>") == "'&lt;a&gt;'"
+
+def test_raw_fragments_are_inserted_as_is():
+    row = Template("<i>{name}</i>\n").render(name="a<b")
+    page = Template("<b>Header</b>\n{rows}").render(rows=Raw(row + row))
+    assert page == "<b>Header</b>\n<i>a&lt;b</i>\n<i>a&lt;b</i>\n"
+    assert isinstance(page, Raw)
+
+def test_only_plain_placeholders():
+    with pytest.raises(ValueError):
+        Template("{client.name}")
+    with pytest.raises(ValueError):
+        Template("{0}")
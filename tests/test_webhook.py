@@ -0,0 +1,36 @@
+# test_webhook.py
+import pytest
+
+import webhook
+
+@pytest.fixture
+def config(monkeypatch):
+    """Set the webhook settings read from .env"""
+    def setup(mode="webhook", url="https://bot.example.com/telegram", secret="s3cret_Value-1"):
+        monkeypatch.setattr(webhook, "BOT_MODE", mode)
+        monkeypatch.setattr(webhook, "WEBHOOK_URL", url)
+        monkeypatch.setattr(webhook, "WEBHOOK_SECRET", secret)
+    return setup
+
+def test_valid_configuration(config):
+    config()
+    assert webhook.enabled()
+
+def test_polling_mode(config):
+    config(mode="polling")
+    assert not webhook.enabled()
+
+def test_url_must_be_https(config):
+    config(url="http://bot.example.com/telegram")
+    assert not webhook.enabled()
+
+@pytest.mark.parametrize("secret", [
+    "",
+    "has spaces",
+    "semi;colon",
+    "x" * 257,
+    "change_me_to_a_long_random_string",  # The .env.example placeholder
+])
+def test_unusable_secrets_fall_back_to_polling(config, secret):
+    config(secret=secret)
+    assert not webhook.enabled()
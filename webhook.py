@@ -0,0 +1,49 @@
+# webhook.py
+# Webhook mode: Telegram POSTs updates to the bot instead of being polled
+#
+# With BOT_MODE=webhook in .env the bot runs Application.run_webhook from
+# python-telegram-bot (its [webhooks] extra, a tornado server): it registers
+# WEBHOOK_URL with Telegram and only accepts requests carrying WEBHOOK_SECRET
+# in the X-Telegram-Bot-Api-Secret-Token header. Anything missing from the
+# configuration falls back to long polling.
+#
+# Usage (from main()):
+#     if webhook.enabled():
+#         app.run_webhook(listen=webhook.WEBHOOK_LISTEN, port=webhook.WEBHOOK_PORT,
+#                         url_path=webhook.WEBHOOK_PATH, webhook_url=webhook.WEBHOOK_URL,
+#                         secret_token=webhook.WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+#     else:
+#         app.run_polling()
+import logging
+import os
+import re
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public https URL Telegram posts to
+WEBHOOK_PATH = urlsplit(WEBHOOK_URL).path.lstrip("/")  # Served locally; a reverse proxy may sit in front
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+_SECRET_RE = re.compile(r"^[A-Za-z0-9_-]{1,256}$")  # What Telegram accepts for secret_token
+_PLACEHOLDER_SECRETS = {"change_me_to_a_long_random_string"}  # Shipped in older .env.example files
+
+def enabled():
+    """True if .env asks for webhook mode and the configuration is usable"""
+    if BOT_MODE != "webhook":
+        return False
+    if not WEBHOOK_URL.startswith("https://"):
+        logger.warning("BOT_MODE=webhook but WEBHOOK_URL is not an https URL, falling back to polling")
+        return False
+    if not _SECRET_RE.match(WEBHOOK_SECRET):
+        logger.warning("BOT_MODE=webhook but WEBHOOK_SECRET is missing or invalid (1-256 of A-Z a-z 0-9 _ -), "
+                       "falling back to polling")
+        return False
+    if WEBHOOK_SECRET in _PLACEHOLDER_SECRETS:
+        logger.warning("BOT_MODE=webhook but WEBHOOK_SECRET is still the .env.example placeholder, "
+                       "falling back to polling")
+        return False
+    return True
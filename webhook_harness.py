@@ -0,0 +1,157 @@
+# webhook_harness.py
+# POST synthetic Telegram updates to the webhook server and measure throughput.
+#
+# By default python-telegram-bot's webhook server (Updater.start_webhook, the
+# one Application.run_webhook uses) is started in process on a free local
+# port, with a bot that never calls Telegram and a plain queue standing in
+# for the application, so no token or network is needed. --url points the
+# harness at an already running bot instead (BOT_MODE=webhook), e.g. one
+# listening on 127.0.0.1.
+#
+# Usage:
+#   python webhook_harness.py                              # 5000 updates, 20 connections
+#   python webhook_harness.py --updates 20000 --connections 50
+#   python webhook_harness.py --url http://127.0.0.1:8443/telegram --secret my_secret
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from telegram import Bot
+from telegram.ext import Updater
+
+import webhook
+
+class OfflineBot(Bot):
+    """A Bot that never reaches Telegram: enough for the webhook server to decode updates"""
+
+    async def initialize(self):
+        pass  # No get_me
+
+    async def shutdown(self):
+        pass
+
+    async def set_webhook(self, *args, **kwargs):
+        return True
+
+    async def delete_webhook(self, *args, **kwargs):
+        return True
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_update(update_id, text="/stats", user_id=1):
+    """A private-chat command message, as Telegram would post it"""
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+async def post(reader, writer, host, path, secret, body):
+    """One keep-alive POST; returns the status code"""
+    writer.write(
+        f"POST {path} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+async def worker(url, secret, bodies, latencies, statuses):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        while bodies:
+            body = bodies.pop()
+            start = time.perf_counter()
+            status = await post(reader, writer, parts.netloc, parts.path or "/", secret, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def drain(queue, received):
+    while True:
+        await queue.get()
+        received.append(1)
+
+async def bench(args):
+    updater = consumer = None
+    url, secret = args.url, args.secret
+    received = []
+    if url is None:
+        # In-process server: updates land in a queue drained as fast as possible
+        secret = secret or "harness-secret"
+        queue = asyncio.Queue()
+        port = free_port()
+        updater = Updater(OfflineBot("0:harness"), queue)
+        await updater.initialize()
+        await updater.start_webhook(listen="127.0.0.1", port=port, url_path="telegram", secret_token=secret)
+        url = f"http://127.0.0.1:{port}/telegram"
+        consumer = asyncio.create_task(drain(queue, received))
+
+    # A request without the right secret must be refused
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    refused = await post(reader, writer, parts.netloc, parts.path, "wrong-secret", json.dumps(make_update(0)).encode())
+    writer.close()
+
+    bodies = [json.dumps(make_update(i)).encode() for i in range(args.updates, 0, -1)]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(url, secret, bodies, latencies, statuses) for _ in range(args.connections)])
+    elapsed = time.perf_counter() - start
+
+    if updater is not None:
+        await asyncio.sleep(0)
+        consumer.cancel()
+        await updater.stop()
+        await updater.shutdown()
+
+    latencies.sort()
+    print(f"target: {url}")
+    print(f"wrong secret answered: {refused}")
+    print(f"{args.updates} updates over {args.connections} connections in {elapsed:.2f}s "
+          f"-> {args.updates / elapsed:.0f} updates/s")
+    print(f"status codes: {statuses}")
+    print(f"latency ms: p50 {statistics.median(latencies):.2f}  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}  "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f}  max {latencies[-1]:.2f}")
+    if updater is not None:
+        print(f"queued updates: {len(received)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the webhook server with synthetic updates")
+    parser.add_argument("--updates", type=int, default=5000, help="number of updates to post")
+    parser.add_argument("--connections", type=int, default=20, help="concurrent keep-alive connections")
+    parser.add_argument("--url", default=None, help="webhook of a running bot (default: in-process server)")
+    parser.add_argument("--secret", default=webhook.WEBHOOK_SECRET or None, help="secret token (default: WEBHOOK_SECRET)")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+if __name__ == "__main__":
+    main()